@@ -0,0 +1,176 @@
+"""
+Offline annotation of recorded videos
+
+Runs the host mode hand tracker (hand_tracker_host.py) on video files and writes,
+for each video, one row per detected hand in a columnar session log (see landmark_log.py):
+    frame, timestamp, gesture, lm_score, handedness, landmarks.
+
+The videos are cut in shards of fixed duration which are processed by a pool of worker processes.
+Shards and inference batches only depend on the video and on --shard_duration/--batch_size,
+never on the number of workers, and the tracker has no state between frames.
+A shard starts by seeking to its first frame. Seeking is fast but, depending on the codec and
+the OpenCV backend, may not land on the exact frame. With --exact_seek, each shard decodes the
+video from the beginning (a keyframe) and discards the frames before its start: slower, but the
+output is then bit-identical whatever the number of workers.
+
+The log of each video is written in <output>/<video name>. When several videos have the same
+name (eg a/clip.mp4 and b/clip.mp4), a hash of their parent directory is appended to the name.
+
+Usage:
+> python3 annotate_videos.py session1.mp4 session2.mp4 -o annotations -w 4
+> python3 annotate_videos.py session1.mp4 -o annotations --scaling 8   # Report the frames/s from 1 to 8 workers
+"""
+import argparse
+import os
+import hashlib
+from collections import Counter
+from pathlib import Path
+from time import monotonic
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+import mediapipe as mp
+from landmark_log import COLUMNS, write_log
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    nb_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    return nb_frames, fps
+
+def make_shards(videos, shard_duration):
+    shards = []
+    for path in videos:
+        nb_frames, fps = video_info(path)
+        shard_len = max(1, int(round(shard_duration * fps)))
+        for start in range(0, nb_frames, shard_len):
+            shards.append((path, start, min(start + shard_len, nb_frames), fps))
+    return shards
+
+def empty_columns(nb_rows=0):
+    return {name: np.zeros((nb_rows,) + shape, dtype=dtype) for name, (dtype, shape) in COLUMNS.items()}
+
+# The tracker of each worker process, created once by init_worker()
+tracker = None
+
+def init_worker(tracker_args):
+    global tracker
+    # One inference thread per process: parallelism comes from the processes
+    cv2.setNumThreads(1)
+    from hand_tracker_host import HostHandTracker
+    tracker = HostHandTracker(nb_threads=1, **tracker_args)
+
+def open_at(path, start, exact_seek=False):
+    """
+    Opens the video 'path', positioned so that the next read returns the frame 'start'.
+    - exact_seek: if True, decode from the beginning of the video and discard the frames
+    before 'start', instead of seeking. The reported position after a seek does not prove
+    the decoder landed on the right frame, decoding from the first keyframe does.
+    """
+    cap = cv2.VideoCapture(path)
+    if start > 0:
+        if exact_seek:
+            for _ in range(start):
+                if not cap.grab(): break
+        else:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    return cap
+
+def process_shard(shard, batch_size, exact_seek=False):
+    path, start, end, fps = shard
+    cap = open_at(path, start, exact_seek)
+    rows = []
+    frame_nb = start
+    while frame_nb < end:
+        frames = []
+        while len(frames) < batch_size and frame_nb + len(frames) < end:
+            ok, frame = cap.read()
+            if not ok: break
+            frames.append(frame)
+        if not frames: break
+        for i, hands in enumerate(tracker.process_batch(frames)):
+            for hand in hands:
+                landmarks = np.empty((21, 3), dtype=np.float32)
+                landmarks[:,:2] = hand.landmarks
+                landmarks[:,2] = hand.norm_landmarks[:,2]
+                gesture = mp.GESTURES.index(hand.gesture) if hand.gesture else -1
+                rows.append((frame_nb + i, (frame_nb + i) / fps, gesture, hand.lm_score, hand.handedness, landmarks))
+        frame_nb += len(frames)
+    cap.release()
+    columns = empty_columns(len(rows))
+    for r, row in enumerate(rows):
+        for name, value in zip(COLUMNS, row):
+            columns[name][r] = value
+    return columns, frame_nb - start
+
+def annotate(videos, nb_workers, tracker_args={}, shard_duration=30, batch_size=8, exact_seek=False):
+    """
+    Returns a dict {video path: columns} and the number of processed frames
+    """
+    shards = make_shards(videos, shard_duration)
+    with ProcessPoolExecutor(nb_workers, initializer=init_worker, initargs=(tracker_args,)) as pool:
+        results = list(pool.map(process_shard, shards, [batch_size] * len(shards), [exact_seek] * len(shards)))
+    annotations = {}
+    for path in videos:
+        shard_columns = [columns for shard, (columns, _) in zip(shards, results) if shard[0] == path]
+        annotations[path] = {name: np.concatenate([c[name] for c in shard_columns]) for name in COLUMNS}
+    nb_frames = sum(n for _, n in results)
+    return annotations, nb_frames
+
+def output_directories(videos, output):
+    """
+    Returns a dict {video path: log directory}. The directory is named after the video,
+    plus a hash of its parent directory when another video has the same name.
+    """
+    stems = Counter(Path(path).stem for path in videos)
+    directories = {}
+    for path in videos:
+        name = Path(path).stem
+        if stems[name] > 1:
+            parent = str(Path(path).resolve().parent)
+            name = f"{name}_{hashlib.sha1(parent.encode()).hexdigest()[:8]}"
+        directories[path] = os.path.join(output, name)
+    return directories
+
+def same_annotations(a1, a2):
+    return a1.keys() == a2.keys() and all(
+        np.array_equal(a1[p][name], a2[p][name]) for p in a1 for name in COLUMNS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Annotate recorded videos with the host mode hand tracker")
+    parser.add_argument('videos', nargs='+', help="Video files")
+    parser.add_argument('-o', '--output', default="annotations", help="Output directory (default=%(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes (default=%(default)s)")
+    parser.add_argument('--shard_duration', type=float, default=30, help="Duration in s of the shards (default=%(default)s)")
+    parser.add_argument('--batch_size', type=int, default=8, help="Number of frames per inference batch (default=%(default)s)")
+    parser.add_argument('--exact_seek', action="store_true", help="Decode each video from the beginning up to the start of each shard, instead of seeking (frame-accurate but slower)")
+    parser.add_argument('--lm_model', default="lite", help="Landmark model: 'full', 'lite', 'sparse', a quantized variant (eg 'lite_int8') or path of an ONNX file (default=%(default)s)")
+    parser.add_argument('--pd_model', default="float", help="Palm detection model: 'float', 'int8', 'fp16' or path of an ONNX file (default=%(default)s)")
+    parser.add_argument('--max_hands', type=int, default=2, help="Max number of hands per frame (default=%(default)s)")
+    parser.add_argument('--scaling', type=int, metavar="N", help="Report the frames/s with 1 to N workers (and check the outputs are identical)")
+    args = parser.parse_args()
+
+    tracker_args = {'pd_model': args.pd_model, 'lm_model': args.lm_model, 'max_hands': args.max_hands}
+    if args.scaling:
+        reference = None
+        for nb_workers in range(1, args.scaling + 1):
+            start = monotonic()
+            annotations, nb_frames = annotate(args.videos, nb_workers, tracker_args, args.shard_duration, args.batch_size, args.exact_seek)
+            fps = nb_frames / (monotonic() - start)
+            if reference is None:
+                reference, reference_fps = annotations, fps
+            identical = same_annotations(reference, annotations)
+            print(f"{nb_workers:2d} workers : {fps:7.1f} frames/s - speedup x{fps/reference_fps:.2f} - identical output: {identical}")
+    else:
+        start = monotonic()
+        annotations, nb_frames = annotate(args.videos, args.workers, tracker_args, args.shard_duration, args.batch_size, args.exact_seek)
+        print(f"{nb_frames} frames processed in {monotonic() - start:.1f} s")
+    directories = output_directories(args.videos, args.output)
+    for path, columns in annotations.items():
+        directory = directories[path]
+        write_log(directory, columns)
+        print(f"{path}: {len(columns['frame'])} hands -> {directory}")
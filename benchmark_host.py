@@ -0,0 +1,204 @@
+"""
+Benchmark of the host side hot path, without camera
+
+Synthetic hand results (see synthetic_hands.py) are replayed through each stage of the
+per-frame host processing, and through the full loop:
+    extract   : HandTracker.extract_hand_data()
+    gesture   : mediapipe.recognize_gesture()
+    events    : HandController.generate_events()
+    smoothing : DoubleExponentialSmoothing.update()
+    render    : HandTrackerRenderer.draw()
+    render_legacy : HandTrackerRenderer.draw() with the former per-landmark drawing (reference for 'render')
+    loop      : all the stages above + HandController.process_events() (no-op callbacks)
+For each stage, the following are reported:
+    - the throughput (frames/s),
+    - the number of allocations per frame: memory blocks allocated during the frame and still
+      allocated at its end (sum of the positive count_diff of tracemalloc snapshots taken
+      before and after the frame). Temporaries freed within the frame are not counted,
+    - the peak memory per frame: peak of the memory traced by tracemalloc during the frame
+      above the memory at its start, in KB.
+The allocations and the peak memory are informative: only the throughput is compared with the baseline.
+
+Baselines are machine specific: save them once with --save_baseline, then each run compares
+its throughput to the baseline and exits with code 1 if a stage is slower than the baseline
+by more than --tolerance.
+
+Usage:
+> python3 benchmark_host.py [--frames 3000] [--save_baseline] [--tolerance 0.2]
+"""
+import argparse
+import copy
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+import numpy as np
+import mediapipe as mp
+from synthetic_hands import SyntheticHandStream, SyntheticTracker
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BASELINE_FILE = str(SCRIPT_DIR / "benchmark_baseline.json")
+
+STAGES = ["extract", "gesture", "events", "smoothing", "render", "render_legacy", "loop"]
+
+def noop(event):
+    pass
+
+CONTROLLER_CONFIG = {
+    'pose_actions' : [
+        {'name': 'MOVE', 'pose':'FIVE', 'callback': 'noop', "trigger":"continuous", "first_trigger_delay":0.1,},
+        {'name': 'CLICK', 'pose':'FIST', 'callback': 'noop', "trigger":"enter_leave", "first_trigger_delay":0.1},
+        {'name': 'SCROLL', 'pose':'PEACE', 'callback': 'noop', "trigger":"continuous", "first_trigger_delay":0.1},
+    ]
+}
+
+def legacy_draw_hand(renderer, hand):
+    # Former HandTrackerRenderer.draw_hand(): polylines rebuilt from Python lists and one cv2.circle() per landmark
+    import cv2
+    from hand_tracker_renderer import LINES_HAND
+    dynamic_size = hand.rect_w_a / 400
+    if hand.lm_score > renderer.tracker.lm_score_thresh:
+        if renderer.show_landmarks:
+            lines = [np.array([hand.landmarks[point] for point in line]).astype(np.int32) for line in LINES_HAND]
+            cv2.polylines(renderer.frame, lines, False, (255, 0, 0), int(1+dynamic_size*3), cv2.LINE_AA)
+            radius = int(1+dynamic_size*5)
+            if renderer.tracker.use_gesture:
+                color = { 1: (0,255,0), 0: (0,0,255), -1:(0,255,255)}
+                states = [-1] + [hand.thumb_state]*4 + [hand.index_state]*4 + [hand.middle_state]*4 + [hand.ring_state]*4 + [hand.little_state]*4
+                for i in range(21):
+                    cv2.circle(renderer.frame, (hand.landmarks[i][0], hand.landmarks[i][1]), radius, color[states[i]], -1)
+            else:
+                for x,y in hand.landmarks[:,:2]:
+                    cv2.circle(renderer.frame, (int(x), int(y)), radius, (255, 0, 0), -1)
+
+class Bench:
+    """
+    Holds the objects of the host processing and the replayed inputs of each stage
+    """
+    def __init__(self, nb_frames, seed=0):
+        from hand_pose_controller import HandController
+        from hand_tracker_renderer import HandTrackerRenderer
+        from smoothing import DoubleExponentialSmoothing
+        stream = SyntheticHandStream(seed=seed)
+        self.results = stream.results(nb_frames)
+        self.tracker = SyntheticTracker(stream, self.results)
+        # parse_poses() modifies the config
+        self.controller = HandController(copy.deepcopy(CONTROLLER_CONFIG), tracker=self.tracker)
+        self.renderer = HandTrackerRenderer(self.tracker)
+        self.legacy_renderer = HandTrackerRenderer(self.tracker)
+        self.legacy_renderer.draw_hand = lambda hand: legacy_draw_hand(self.legacy_renderer, hand)
+        self.smooth = DoubleExponentialSmoothing(smoothing=0.3, prediction=0.1, jitter_radius=700, out_int=True)
+        self.frame = np.zeros((self.tracker.img_h, self.tracker.img_w, 3), dtype=np.uint8)
+        # Hands of each frame, used as inputs of the stages after 'extract'
+        self.hands = [[self.tracker.extract_hand_data(res, i) for i in range(len(res.get("lm_score", [])))] for res in self.results]
+        self.frame_time = 1 / 30
+
+    def extract(self, i):
+        res = self.results[i]
+        use_gesture = self.tracker.use_gesture
+        self.tracker.use_gesture = False
+        for h in range(len(res.get("lm_score", []))):
+            self.tracker.extract_hand_data(res, h)
+        self.tracker.use_gesture = use_gesture
+
+    def gesture(self, i):
+        for hand in self.hands[i]:
+            mp.recognize_gesture(hand)
+
+    def events(self, i):
+        self.controller.now = i * self.frame_time
+        self.controller.frame_nb = i + 1
+        return self.controller.generate_events(self.hands[i])
+
+    def smoothing(self, i):
+        for hand in self.hands[i]:
+            self.smooth.update(hand.landmarks[8,:2])
+
+    def render(self, i):
+        self.renderer.draw(self.frame, self.hands[i])
+
+    def render_legacy(self, i):
+        self.legacy_renderer.draw(self.frame, self.hands[i])
+
+    def loop(self, i):
+        res = self.results[i]
+        hands = [self.tracker.extract_hand_data(res, h) for h in range(len(res.get("lm_score", [])))]
+        self.controller.now = i * self.frame_time
+        self.controller.frame_nb = i + 1
+        self.controller.process_events(self.controller.generate_events(hands))
+        for hand in hands:
+            self.smooth.update(hand.landmarks[8,:2])
+        self.renderer.draw(self.frame, hands)
+
+def run_stage(fn, nb_frames, nb_peak_frames):
+    # Warm up
+    for i in range(min(100, nb_frames)):
+        fn(i)
+    start = perf_counter()
+    for i in range(nb_frames):
+        fn(i)
+    fps = nb_frames / (perf_counter() - start)
+    # Peak memory (separate pass, tracemalloc slows down the execution)
+    tracemalloc.start()
+    peak = 0
+    for i in range(nb_peak_frames):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(i)
+        peak += tracemalloc.get_traced_memory()[1] - current
+    # Allocations (separate pass, the snapshots would be counted in the peak memory)
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    allocs = 0
+    before = tracemalloc.take_snapshot().filter_traces(ignore)
+    for i in range(nb_peak_frames):
+        fn(i)
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        allocs += sum(max(0, stat.count_diff) for stat in after.compare_to(before, "traceback"))
+        before = after
+    tracemalloc.stop()
+    return {"fps": fps, "allocs_per_frame": allocs / nb_peak_frames, "peak_kb_per_frame": peak / nb_peak_frames / 1024}
+
+def run(nb_frames=3000, stages=STAGES, seed=0):
+    bench = Bench(nb_frames, seed)
+    return {stage: run_stage(getattr(bench, stage), nb_frames, min(nb_frames, 300)) for stage in stages}
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the list of the stages slower than the baseline by more than 'tolerance'
+    """
+    return [stage for stage, r in results.items()
+            if stage in baseline and r["fps"] < baseline[stage]["fps"] * (1 - tolerance)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the host side processing with synthetic hands")
+    parser.add_argument('--frames', type=int, default=3000, help="Number of frames per stage (default=%(default)i)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to run (default: all)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline file (default=%(default)s)")
+    parser.add_argument('--save_baseline', action="store_true", help="Save the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Accepted slowdown ratio before failing (default=%(default)s)")
+    args = parser.parse_args()
+
+    results = run(args.frames, args.stages)
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except (OSError, ValueError):
+        baseline = {}
+
+    print(f"{'stage':10s} {'frames/s':>10s} {'allocs':>8s} {'peak KB':>9s} {'baseline':>10s}")
+    for stage, r in results.items():
+        base = f"{baseline[stage]['fps']:10.0f}" if stage in baseline else f"{'-':>10s}"
+        print(f"{stage:10s} {r['fps']:10.0f} {r['allocs_per_frame']:8.1f} {r['peak_kb_per_frame']:9.2f} {base}")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=4)
+        print(f"Baseline saved in {args.baseline}")
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regression (more than {args.tolerance:.0%} slower than baseline): {', '.join(regressions)}")
+            sys.exit(1)
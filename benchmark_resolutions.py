@@ -0,0 +1,68 @@
+"""
+Achieved FPS and landmark success rate for combinations of input resolutions
+
+Each combination of sensor resolution, frame height (internal_frame_height: frames of the landmark crops)
+and palm detection frame height (pd_frame_height, 'none' for the shared frame) is run on the connected
+device for a fixed duration, with the same camera FPS. For each combination are reported:
+    - the output FPS and the ratio of dropped frames,
+    - the landmark success rate: ratio of the landmark inferences that confirmed a hand,
+    - the ratio of frames with a hand.
+Keep the hands in the field of view (at the distances of interest) during the whole run,
+as the success rates depend on the scene.
+
+Usage (the device must be connected):
+> python3 benchmark_resolutions.py --resolutions full ultra --heights 640 1080 2160 --pd_heights none 256
+"""
+import argparse
+from itertools import product
+from time import monotonic
+from device_profile import RESOLUTIONS
+
+def measure(tracker_args, duration=10, warmup=2):
+    from hand_tracker_edge import HandTracker
+    tracker = HandTracker(use_profile=False, **tracker_args)
+    start = monotonic()
+    while monotonic() - start < warmup:
+        tracker.next_frame()
+    counters = ["nb_dropped_frames", "nb_lm_inferences", "nb_failed_lm_inferences", "nb_frames_no_hand"]
+    counts_start = {c: getattr(tracker, c) for c in counters}
+    nb_frames = 0
+    start = monotonic()
+    while monotonic() - start < duration:
+        tracker.next_frame()
+        nb_frames += 1
+    elapsed = monotonic() - start
+    counts = {c: getattr(tracker, c) - counts_start[c] for c in counters}
+    tracker.exit()
+    nb_lm = counts["nb_lm_inferences"]
+    return {
+        'fps': nb_frames / elapsed,
+        'drop_rate': counts["nb_dropped_frames"] / (nb_frames + counts["nb_dropped_frames"]),
+        'lm_success_rate': (nb_lm - counts["nb_failed_lm_inferences"]) / nb_lm if nb_lm else float("nan"),
+        'hand_rate': 1 - counts["nb_frames_no_hand"] / nb_frames,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FPS and landmark success rate for combinations of input resolutions")
+    parser.add_argument('--resolutions', nargs='+', default=["full"], choices=list(RESOLUTIONS), help="Sensor resolutions (default=%(default)s)")
+    parser.add_argument('--heights', type=int, nargs='+', default=[640, 1080], help="Frame heights (internal_frame_height) (default=%(default)s)")
+    parser.add_argument('--pd_heights', nargs='+', default=["none", "256"], help="Palm detection frame heights, 'none' for the shared frame (default=%(default)s)")
+    parser.add_argument('--lm_model', default="lite", choices=["full", "lite", "sparse"], help="Landmark model (default=%(default)s)")
+    parser.add_argument('--fps', type=int, default=30, help="Internal camera FPS (default=%(default)i)")
+    parser.add_argument('--laconic', action="store_true", help="Do not send the video frames to the host")
+    parser.add_argument('--duration', type=float, default=10, help="Duration in s of each measure (default=%(default)s)")
+    args = parser.parse_args()
+
+    results = []
+    for resolution, height, pd_height in product(args.resolutions, args.heights, args.pd_heights):
+        if height > RESOLUTIONS[resolution][1]: continue
+        pd_frame_height = None if pd_height == "none" else int(pd_height)
+        if pd_frame_height is not None and pd_frame_height > height: continue
+        tracker_args = dict(input_src="rgb_laconic" if args.laconic else "rgb", lm_model=args.lm_model, resolution=resolution,
+                            internal_fps=args.fps, internal_frame_height=height, pd_frame_height=pd_frame_height)
+        results.append((resolution, height, pd_height, measure(tracker_args, args.duration)))
+
+    print(f"\n{'resolution':10s} {'height':>6s} {'pd height':>9s} {'fps':>6s} {'dropped':>8s} {'lm success':>10s} {'hand':>6s}")
+    for resolution, height, pd_height, r in results:
+        print(f"{resolution:10s} {height:6d} {pd_height:>9s} {r['fps']:6.1f} {r['drop_rate']:8.1%} {r['lm_success_rate']:10.1%} {r['hand_rate']:6.1%}")
@@ -0,0 +1,117 @@
+"""
+Latency and accuracy of the host model variants (float, int8, fp16) on recorded frames
+
+For each palm detection variant:
+    - latency (ms) of one inference,
+    - detection agreement with the float model: ratio of the frames with the same number of palms
+      and mean distance (pixels of the 128x128 input) between the matched palm centers.
+For each landmark variant:
+    - latency (ms) of one inference,
+    - landmark error against the float model on the same hand crops (the crops found by the float
+      palm detection): mean, 95th percentile and max distance in pixels of the 224x224 crop.
+All the variants are run with the same number of threads, on the same inputs.
+
+Usage:
+> python benchmark_host_models.py recorded.mp4 [--lm_models lite lite_int8 lite_fp16] [--threads 1]
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+import numpy as np
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import mediapipe as mp
+from hand_tracker_host import HOST_PALM_MODELS, HOST_LANDMARK_MODELS, PD_OUTPUTS, LM_OUTPUTS
+from quantize_host_models import read_frames, model_inputs
+
+def create_session(model, nb_threads):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = nb_threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(model, options, providers=["CPUExecutionProvider"])
+
+def run_one_by_one(sess, output_names, inputs):
+    """
+    Returns (outputs concatenated along the batch axis, mean latency in ms of one inference)
+    """
+    input_name = sess.get_inputs()[0].name
+    sess.run(output_names, {input_name: inputs[:1]}) # Warm up
+    results = []
+    start = perf_counter()
+    for i in range(len(inputs)):
+        results.append(sess.run(output_names, {input_name: inputs[i:i+1]}))
+    latency = (perf_counter() - start) / len(inputs) * 1000
+    return [np.concatenate(r) for r in zip(*results)], latency
+
+def palm_centers(scores, bboxes, anchors, score_thresh=0.5, nms_thresh=0.3):
+    # Centers of the palms kept by NMS, for each input
+    centers = []
+    for s, b in zip(scores, bboxes):
+        detections = mp.non_max_suppression(mp.decode_bboxes(score_thresh, s, b, anchors, 128), nms_thresh)
+        centers.append(np.array([[d.pd_box[0] + d.pd_box[2] / 2, d.pd_box[1] + d.pd_box[3] / 2] for d in detections]).reshape(-1, 2) * 128)
+    return centers
+
+def compare_palms(ref_centers, centers):
+    """
+    Returns (ratio of the inputs with the same number of palms, mean distance between matched centers)
+    """
+    same = 0
+    distances = []
+    for ref, c in zip(ref_centers, centers):
+        same += len(ref) == len(c)
+        if len(ref) and len(c):
+            d = np.linalg.norm(ref[:,None] - c[None], axis=2)
+            distances += d.min(axis=1).tolist()
+    return same / len(ref_centers), np.mean(distances) if distances else float("nan")
+
+def compare_landmarks(ref, landmarks):
+    """
+    Returns the distances (pixels of the crop) between the landmarks (N,21,3) and the reference landmarks
+    """
+    return np.linalg.norm(ref.reshape(-1, 21, 3)[:,:,:2] - landmarks.reshape(-1, 21, 3)[:,:,:2], axis=2).reshape(-1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and accuracy of the host model variants")
+    parser.add_argument('sources', nargs='+', help="Video files or directories of images")
+    parser.add_argument('--pd_models', nargs='+', default=["float", "int8", "fp16"], help="Palm detection variants (default=%(default)s)")
+    parser.add_argument('--lm_models', nargs='+', default=["lite", "lite_int8", "lite_fp16", "full", "full_int8", "full_fp16"],
+                        help="Landmark variants, the float model of a variant must be listed before it (default=%(default)s)")
+    parser.add_argument('--nb_frames', type=int, default=300, help="Number of frames (default=%(default)i)")
+    parser.add_argument('--threads', type=int, default=1, help="Number of threads of the onnxruntime sessions (default=%(default)i)")
+    args = parser.parse_args()
+
+    frames = read_frames(args.sources, args.nb_frames)
+    pd_inputs, lm_inputs = model_inputs(frames)
+    print(f"{len(pd_inputs)} frames, {len(lm_inputs)} hand crops, {args.threads} thread(s)")
+    anchors = mp.generate_handtracker_anchors()
+
+    print(f"\n{'palm detection':18s} {'ms':>7s} {'same nb':>8s} {'center err':>11s}")
+    ref_centers = None
+    for name in args.pd_models:
+        model = HOST_PALM_MODELS.get(name, name)
+        if not os.path.exists(model):
+            print(f"{name:18s} not found ({model})")
+            continue
+        (scores, bboxes), latency = run_one_by_one(create_session(model, args.threads), PD_OUTPUTS, pd_inputs)
+        centers = palm_centers(scores, bboxes, anchors)
+        if ref_centers is None: ref_centers = centers
+        same, center_error = compare_palms(ref_centers, centers)
+        print(f"{name:18s} {latency:7.2f} {same:8.1%} {center_error:11.2f}")
+
+    if len(lm_inputs) == 0:
+        print("No hand detected, landmark models not compared")
+        sys.exit(0)
+    print(f"\n{'landmarks':18s} {'ms':>7s} {'mean err':>9s} {'p95 err':>8s} {'max err':>8s}")
+    references = {}
+    for name in args.lm_models:
+        model = HOST_LANDMARK_MODELS.get(name, name)
+        if not os.path.exists(model):
+            print(f"{name:18s} not found ({model})")
+            continue
+        (landmarks,), latency = run_one_by_one(create_session(model, args.threads), LM_OUTPUTS[:1], lm_inputs)
+        # Reference: the float model of the variant (eg 'lite' for 'lite_int8')
+        ref = references.setdefault(name.split("_")[0], landmarks)
+        errors = compare_landmarks(ref, landmarks)
+        print(f"{name:18s} {latency:7.2f} {errors.mean():9.2f} {np.percentile(errors, 95):8.2f} {errors.max():8.2f}")
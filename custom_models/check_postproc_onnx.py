@@ -0,0 +1,131 @@
+"""
+Parity and cost of the palm detection post processing models generated by generate_postproc_onnx.py
+
+Each ONNX model is run with onnxruntime on recorded palm detection outputs (classificators: 1x896x1,
+regressors: 1x896x18) and its result is compared with the reference decoder of the host mode
+(mediapipe.decode_bboxes + mediapipe.non_max_suppression). Only the detections the manager script
+uses are compared: the rows whose score is above the score threshold (and whose box size is not
+negative), in the order of the result. For each model are reported:
+    - the number of inputs where the model does not give the same number of valid detections as the reference,
+    - the max absolute difference of the values (score, cx, cy, w, kp0, kp2) of the valid detections,
+    - the mean cost (ms) of one inference.
+
+The recorded tensors are .npz files with the arrays 'classificators' (B,896,1) and 'regressors' (B,896,18).
+They can be recorded from videos with the host palm detection model:
+> python check_postproc_onnx.py --record recorded.mp4 --save pd_outputs.npz
+Then:
+> python check_postproc_onnx.py PDPostProcessing_top1.onnx PDPostProcessing_top1_th0.5_fp16.onnx --tensors pd_outputs.npz
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+import numpy as np
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import mediapipe as mp
+
+# Tolerance on the values of the detections, per output type
+TOLERANCES = {np.float32: 1e-4, np.float16: 5e-3}
+
+def record_tensors(sources, nb_frames):
+    """
+    Palm detection outputs of frames of 'sources', with the host palm detection model
+    """
+    from quantize_host_models import read_frames
+    from hand_tracker_host import HostHandTracker, PD_OUTPUTS
+    tracker = HostHandTracker()
+    scores, bboxes = [], []
+    for frame in read_frames(sources, nb_frames):
+        img_h, img_w = frame.shape[:2]
+        frame_size = max(img_h, img_w)
+        pd_inputs = tracker.palm_inputs([frame], frame_size, (frame_size - img_w) // 2, (frame_size - img_h) // 2)
+        s, b = tracker.run(tracker.pd_sess, tracker.pd_input_name, PD_OUTPUTS, tracker.pd_batch, pd_inputs)
+        scores.append(s)
+        bboxes.append(b)
+    return np.concatenate(scores).reshape(-1, 896, 1), np.concatenate(bboxes).reshape(-1, 896, 18)
+
+def reference(scores, bboxes, anchors, score_thresh, nms_thresh, top_k):
+    """
+    Valid detections (K,8), K <= top_k, as returned by the post processing model:
+    (score, cx, cy, w, kp0_x, kp0_y, kp2_x, kp2_y) by decreasing score
+    """
+    regions = mp.non_max_suppression(mp.decode_bboxes(score_thresh, scores, bboxes, anchors), nms_thresh)[:top_k]
+    return np.array([[r.pd_score, r.pd_box[0] + r.pd_box[2]*0.5, r.pd_box[1] + r.pd_box[3]*0.5, r.pd_box[2],
+                    *r.pd_kps[0], *r.pd_kps[2]] for r in regions], dtype=np.float64).reshape(-1, 8)
+
+def valid_detections(result, score_thresh):
+    # Same test as the manager script: pd_score < thresh or box_size < 0 means no hand
+    result = np.asarray(result, dtype=np.float64).reshape(-1, 8)
+    valid = (result[:,0] > score_thresh) & (result[:,3] >= 0)
+    return result[valid]
+
+def compare(results, references, score_thresh):
+    """
+    Returns (number of inputs with a different number of valid detections, max abs difference of the valid detections)
+    """
+    nb_mismatches = 0
+    max_diff = 0
+    for result, ref in zip(results, references):
+        dets = valid_detections(result, score_thresh)
+        if len(dets) != len(ref):
+            nb_mismatches += 1
+        elif len(ref):
+            max_diff = max(max_diff, float(np.abs(dets - ref).max()))
+    return nb_mismatches, max_diff
+
+def run_model(model, scores, bboxes, nb_threads=1):
+    """
+    Returns (list of the results, output type, mean cost in ms of one inference)
+    """
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = nb_threads
+    options.inter_op_num_threads = 1
+    sess = ort.InferenceSession(model, options, providers=["CPUExecutionProvider"])
+    feeds = [{"classificators": s[None].astype(np.float32), "regressors": b[None].astype(np.float32)} for s, b in zip(scores, bboxes)]
+    sess.run(["result"], feeds[0]) # Warm up
+    start = perf_counter()
+    results = [sess.run(["result"], feed)[0] for feed in feeds]
+    cost = (perf_counter() - start) / len(feeds) * 1000
+    return results, results[0].dtype.type, cost
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and cost of the palm detection post processing ONNX models")
+    parser.add_argument('models', nargs='*', help="Post processing ONNX files")
+    parser.add_argument('--tensors', nargs='+', default=[], help="Recorded palm detection outputs (.npz)")
+    parser.add_argument('--record', nargs='+', metavar="SOURCE", help="Record the palm detection outputs of video files or directories of images")
+    parser.add_argument('--nb_frames', type=int, default=300, help="Number of frames recorded (default=%(default)i)")
+    parser.add_argument('--save', help="Save the recorded outputs in this .npz file")
+    parser.add_argument('--score_thresh', type=float, default=0.5, help="Score threshold of the manager script (default=%(default)s)")
+    parser.add_argument('--nms_thresh', type=float, default=0.3, help="IoU threshold of the NMS (default=%(default)s)")
+    parser.add_argument('--threads', type=int, default=1, help="Number of threads of onnxruntime (default=%(default)i)")
+    args = parser.parse_args()
+
+    scores, bboxes = [], []
+    for path in args.tensors:
+        tensors = np.load(path)
+        scores.append(tensors["classificators"].reshape(-1, 896, 1))
+        bboxes.append(tensors["regressors"].reshape(-1, 896, 18))
+    if args.record:
+        s, b = record_tensors(args.record, args.nb_frames)
+        scores.append(s)
+        bboxes.append(b)
+    if not scores:
+        print("No tensors: use --tensors or --record")
+        sys.exit(1)
+    scores, bboxes = np.concatenate(scores), np.concatenate(bboxes)
+    if args.save:
+        np.savez_compressed(args.save, classificators=scores, regressors=bboxes)
+        print(f"Palm detection outputs saved in {args.save}")
+    anchors = mp.generate_handtracker_anchors()
+    print(f"{len(scores)} inputs, score threshold {args.score_thresh}")
+
+    print(f"{'model':45s} {'ms':>7s} {'mismatches':>11s} {'max diff':>9s}")
+    for model in args.models:
+        results, output_type, cost = run_model(model, scores, bboxes, args.threads)
+        top_k = results[0].size // 8
+        references = [reference(s, b, anchors, args.score_thresh, args.nms_thresh, top_k) for s, b in zip(scores, bboxes)]
+        nb_mismatches, max_diff = compare(results, references, args.score_thresh)
+        ok = nb_mismatches == 0 and max_diff <= TOLERANCES.get(output_type, 1e-4)
+        print(f"{os.path.basename(model):45s} {cost:7.3f} {nb_mismatches:11d} {max_diff:9.2g}  {'OK' if ok else 'DIFFERENT'}")
@@ -4,8 +4,8 @@ from torchvision.ops import nms
 import numpy as np
 import onnx
 import sys, os
-sys.path.insert(1, os.path.realpath(os.path.pardir))
-from mediapipe_utils import generate_handtracker_anchors
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from mediapipe import generate_handtracker_anchors
 import argparse
 
 
@@ -15,9 +15,18 @@ iou_threshold = 0.3
 # In the comments below, N=896
 
 class PDPostProcessing(nn.Module):
-    def __init__(self, anchors, top_k):
+    """
+    - anchors: palm detection anchors (N,4),
+    - top_k: number of detections returned (1 is enough in solo mode),
+    - pad: when True, the result is padded to top_k rows with empty detections (score 0, box size -1).
+           Needed when the NMS can return less than top_k boxes (score threshold in the graph, see patch_nms),
+    - fp16: when True, the result is cast to float16.
+    """
+    def __init__(self, anchors, top_k, pad=False, fp16=False):
         super(PDPostProcessing, self).__init__()
         self.top_k = top_k
+        self.pad = pad
+        self.fp16 = fp16
         self.anchors = torch.from_numpy(anchors[:,:2]).float() # [N, 2]
         self.plus_anchor_center = np.array([[1,0,0,0,1,0,1,0,1,0,1,0,1,0,1,0,1,0], [0,1,0,0,0,1,0,1,0,1,0,1,0,1,0,1,0,1]])
         self.plus_anchor_center = torch.from_numpy(self.plus_anchor_center).float()
@@ -51,7 +60,6 @@ class PDPostProcessing(nn.Module):
         # scores: [N]
         # iou_threshold: float
         # Returns: int64 tensor with the indices of the elements that have been kept by NMS, sorted in decreasing order of scores
-        print(bb_x1y1x2y2.dtype, scores.dtype)
         keep_idx = nms(bb_x1y1x2y2, scores, iou_threshold)[:self.top_k]
 
         # The 14 elements of dets from 4 to 18 corresponds to 7 (x,y) normalized keypoints coordinates (useful for determining rotated rectangle)
@@ -66,23 +74,29 @@ class PDPostProcessing(nn.Module):
         cxcyw = dets[:,:3][keep_idx]
        
         dets = torch.cat((scores, cxcyw, kp0, kp2), dim=1)
+        if self.pad:
+            empty = torch.zeros(self.top_k, 8)
+            empty[:,3] = -1
+            dets = torch.cat((dets, empty), dim=0)[:self.top_k]
+        if self.fp16:
+            dets = dets.half()
         return dets
 
 
-def test(anchors, top_k):
+def test(anchors, top_k, pad=False, fp16=False):
 
-    model = PDPostProcessing(anchors, top_k)
+    model = PDPostProcessing(anchors, top_k, pad, fp16)
     N = anchors.shape[0]
     X = torch.randn(1, N, 1, dtype=torch.float)
     Y = torch.randn(1, N, 18, dtype=torch.float)
     result = model(X, Y)
     print("Result shape:", result.shape)
 
-def export_onnx(anchors, top_k, onnx_name):
+def export_onnx(anchors, top_k, onnx_name, pad=False, fp16=False):
     """
     Exports the model to an ONNX file.
     """
-    model = PDPostProcessing(anchors, top_k)
+    model = PDPostProcessing(anchors, top_k, pad, fp16)
     N = anchors.shape[0]
     X = torch.randn(1, N, 1, dtype=torch.float)
     Y = torch.randn(1, N, 18, dtype=torch.float)
@@ -107,6 +121,11 @@ def simplify(model):
     return model_simp
 
 def patch_nms(model, top_k, score_thresh=None):
+    """
+    Sets max_output_boxes_per_class of the NonMaxSuppression node to top_k and,
+    if score_thresh is not None, adds the score_threshold input (the NMS then skips
+    the boxes whose score is not above score_thresh, instead of sorting and comparing all of them)
+    """
     import onnx_graphsurgeon as gs  
     import struct
     graph = gs.import_onnx(model)
@@ -136,6 +155,11 @@ def patch_nms(model, top_k, score_thresh=None):
             mobpc = struct.pack("q", new_mobpc)
             mobpc_input._values.tensor.raw_data = mobpc
             print(f"max_out_boxes_per_class value changed to {top_k}")
+            if score_thresh is not None:
+                # The score_threshold input (4) comes after iou_threshold (3), which is always set by torchvision
+                score_input = gs.Constant("score_threshold", np.array([score_thresh], dtype=np.float32))
+                node.inputs = node.inputs[:4] + [score_input]
+                print(f"score_threshold set to {score_thresh}")
             nms_not_found = False
             break
     assert nms_not_found==False, "NonMaxSuppression could not be found in the graph !"
@@ -144,7 +168,9 @@ def patch_nms(model, top_k, score_thresh=None):
     return gs.export_onnx(graph)
 
 parser = argparse.ArgumentParser()
-parser.add_argument('-top_k', type=int, default=2, help="max number of detections (default=%(default)i)")
+parser.add_argument('-top_k', type=int, default=2, help="max number of detections, 1 for the solo mode (default=%(default)i)")
+parser.add_argument('-score_thresh', type=float, help="score threshold applied in the NMS (default: no threshold)")
+parser.add_argument('-fp16', action="store_true", help="float16 output")
 parser.add_argument('-no_simp', action="store_true", help="do not run simplifier")
 args = parser.parse_args()
 
@@ -155,17 +181,21 @@ run_simp = not args.no_simp
 anchors = generate_handtracker_anchors().astype(float)
 print(f"Nb anchors: {anchors.shape}", anchors.dtype) # [N, 4]
 
-test(anchors, top_k)
+# With a score threshold, the NMS may return less than top_k boxes: the result is padded
+pad = args.score_thresh is not None
+test(anchors, top_k, pad, args.fp16)
 
 name = f"PDPostProcessing_top{top_k}"
+if pad: name += f"_th{args.score_thresh:g}"
+if args.fp16: name += "_fp16"
 raw_onnx_name = f"{name}_raw.onnx"
-export_onnx(anchors, args.top_k, raw_onnx_name)
+export_onnx(anchors, args.top_k, raw_onnx_name, pad, args.fp16)
 
 model = onnx.load(raw_onnx_name)
 print("Model IR version:", model.ir_version)
 if run_simp:
     model = simplify(model)
-model = patch_nms(model, top_k)
+model = patch_nms(model, top_k, args.score_thresh)
 print("Model IR version:", model.ir_version)
 
 
@@ -0,0 +1,136 @@
+"""
+Generation of the quantized variants of the host models (palm detection and hand landmarks)
+
+- int8: static quantization with onnxruntime (QDQ format, weights int8 per channel, activations uint8),
+        calibrated on the inputs the models get in hand_tracker_host.py for recorded frames:
+        the padded resized frames for the palm detection, the hand crops found by the float
+        models for the landmark models,
+- fp16: weights and computations in float16 (onnxconverter_common), inputs and outputs kept in float32.
+The variants are saved next to the float models (eg models/hand_landmark_lite_int8.onnx) and
+are selected by name in HostHandTracker: pd_model="int8", lm_model="lite_int8"...
+
+Usage:
+> python quantize_host_models.py recorded.mp4 frames_dir/ [--models palm lite full] [--variants int8 fp16]
+Then compare the variants with the float models:
+> python benchmark_host_models.py recorded.mp4
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+import numpy as np
+import cv2
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from hand_tracker_host import HostHandTracker, HOST_PALM_MODELS, HOST_LANDMARK_MODELS, QUANTIZED_VARIANTS
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp"]
+
+def read_frames(sources, nb_frames):
+    """
+    Returns about 'nb_frames' BGR frames evenly sampled from 'sources' (video files or directories of images)
+    """
+    frames = []
+    per_source = max(1, nb_frames // len(sources))
+    for source in sources:
+        if os.path.isdir(source):
+            paths = sorted(p for p in Path(source).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+            step = max(1, len(paths) // per_source)
+            frames += [cv2.imread(str(p)) for p in paths[::step][:per_source]]
+        else:
+            cap = cv2.VideoCapture(source)
+            if not cap.isOpened():
+                print(f"Cannot open {source}")
+                sys.exit(1)
+            step = max(1, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) // per_source)
+            for i in range(per_source * step):
+                ok, frame = cap.read()
+                if not ok: break
+                if i % step == 0: frames.append(frame)
+            cap.release()
+    return frames
+
+def model_inputs(frames, batch_size=8):
+    """
+    Returns (palm detection inputs (N,3,128,128), landmark inputs (M,3,224,224)) of 'frames',
+    computed with the float models. The frames are batched by size (the frames of a batch must
+    have the same size), so the inputs are grouped by frame size
+    """
+    tracker = HostHandTracker(pd_model="float", lm_model="lite")
+    by_shape = {}
+    for frame in frames:
+        by_shape.setdefault(frame.shape, []).append(frame)
+    if len(by_shape) > 1:
+        print(f"Frames of {len(by_shape)} different sizes, batched by size")
+    pd_inputs, lm_inputs = [], []
+    for same_shape in by_shape.values():
+        for i in range(0, len(same_shape), batch_size):
+            pd, _, lm, _ = tracker.detect_palms(same_shape[i:i+batch_size])
+            pd_inputs.append(pd)
+            lm_inputs += lm
+    return np.concatenate(pd_inputs), np.array(lm_inputs, dtype=np.float32).reshape(-1, 3, 224, 224)
+
+class InputsDataReader(CalibrationDataReader):
+    """
+    Feeds the calibration inputs one by one (the models may have a fixed batch size of 1)
+    """
+    def __init__(self, input_name, inputs):
+        self.input_name = input_name
+        self.inputs = inputs
+        self.rewind()
+
+    def get_next(self):
+        x = next(self.iterator, None)
+        return None if x is None else {self.input_name: x[None]}
+
+    def rewind(self):
+        self.iterator = iter(self.inputs)
+
+def quantize_int8(model, output, inputs, per_channel=True):
+    import onnx
+    input_name = onnx.load(model).graph.input[0].name
+    preprocessed = output.replace(".onnx", "_preprocessed.onnx")
+    # Shape inference and graph optimization recommended before the quantization
+    quant_pre_process(model, preprocessed)
+    quantize_static(preprocessed, output, InputsDataReader(input_name, inputs),
+                    quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    os.remove(preprocessed)
+
+def convert_fp16(model, output):
+    import onnx
+    from onnxconverter_common import float16
+    model_fp16 = float16.convert_float_to_float16(onnx.load(model), keep_io_types=True)
+    onnx.save(model_fp16, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate quantized variants of the host models")
+    parser.add_argument('sources', nargs='+', help="Calibration frames: video files or directories of images")
+    parser.add_argument('--models', nargs='+', default=["palm", "lite", "full"], choices=["palm", "full", "lite", "sparse"],
+                        help="Models to quantize (default=%(default)s)")
+    parser.add_argument('--variants', nargs='+', default=QUANTIZED_VARIANTS, choices=QUANTIZED_VARIANTS,
+                        help="Variants to generate (default=%(default)s)")
+    parser.add_argument('--nb_frames', type=int, default=300, help="Number of calibration frames (default=%(default)i)")
+    parser.add_argument('--per_tensor', action="store_true", help="int8: quantize the weights per tensor instead of per channel")
+    args = parser.parse_args()
+
+    if "int8" in args.variants:
+        frames = read_frames(args.sources, args.nb_frames)
+        pd_inputs, lm_inputs = model_inputs(frames)
+        print(f"Calibration: {len(frames)} frames, {len(lm_inputs)} hand crops")
+        if len(lm_inputs) == 0 and set(args.models) != {"palm"}:
+            print("No hand detected in the calibration frames")
+            sys.exit(1)
+
+    for name in args.models:
+        model = HOST_PALM_MODELS["float"] if name == "palm" else HOST_LANDMARK_MODELS[name]
+        for variant in args.variants:
+            output = HOST_PALM_MODELS[variant] if name == "palm" else HOST_LANDMARK_MODELS[f"{name}_{variant}"]
+            if variant == "int8":
+                quantize_int8(model, output, pd_inputs if name == "palm" else lm_inputs, per_channel=not args.per_tensor)
+            else:
+                convert_fp16(model, output)
+            size = os.path.getsize(output) / 1e6
+            print(f"{output} ({size:.1f} MB, float: {os.path.getsize(model) / 1e6:.1f} MB)")
@@ -0,0 +1,210 @@
+"""
+Per-device calibration of the internal camera FPS and frame height
+
+The default FPS values of HandTracker (default_internal_fps()) and the default
+frame height (640) were measured on one setup. The achievable FPS depends on the OAK
+model and on the USB link (USB2 links cannot carry large frames at high FPS).
+The calibration sweeps FPS values and valid frame heights, measures the sustained
+output FPS and the rate of dropped frames, and stores the best setting in a profile
+file, keyed by device (MX id) and USB speed. HandTracker loads it automatically.
+
+Usage (the device must be connected):
+> python3 device_profile.py --lm_model lite [--xyz] [--duration 8]
+
+The search and scoring logic can be exercised without a device with --simulate.
+"""
+import json
+from pathlib import Path
+from time import monotonic
+import mediapipe as mp
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROFILE_FILE = str(SCRIPT_DIR / "device_profiles.json")
+
+DEFAULT_FPS_VALUES = [18, 22, 26, 30, 34, 38, 42]
+RESOLUTIONS = {"full": (1920, 1080), "ultra": (3840, 2160)}
+
+
+def default_internal_fps(lm_model, xyz):
+    """
+    Default FPS of the internal color camera, depending on the landmark model 
+    ('full', 'lite', 'sparse' or a blob path) and on the use of depth (xyz).
+    """
+    if lm_model == "full":
+        return 22 if xyz else 26
+    elif lm_model == "lite":
+        return 29 if xyz else 36
+    elif lm_model == "sparse":
+        return 24 if xyz else 29
+    else:
+        return 39
+
+def device_key(mxid, usb_speed):
+    return f"{mxid}/{usb_speed}"
+
+def setting_key(lm_model, xyz, resolution="full", crop=False):
+    return f"{lm_model}{'_xyz' if xyz else ''}_{resolution}{'_crop' if crop else ''}"
+
+def load_profile(mxid, usb_speed, lm_model, xyz, resolution="full", crop=False, path=PROFILE_FILE):
+    """
+    Returns the calibrated setting {'internal_fps':..., 'internal_frame_height':...}
+    of a device, or None if the device has not been calibrated for this configuration.
+    """
+    try:
+        with open(path, 'r') as file:
+            profiles = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return profiles.get(device_key(mxid, usb_speed), {}).get(setting_key(lm_model, xyz, resolution, crop))
+
+def save_profile(mxid, usb_speed, lm_model, xyz, setting, resolution="full", crop=False, path=PROFILE_FILE):
+    try:
+        with open(path, 'r') as file:
+            profiles = json.load(file)
+    except (OSError, ValueError):
+        profiles = {}
+    profiles.setdefault(device_key(mxid, usb_speed), {})[setting_key(lm_model, xyz, resolution, crop)] = setting
+    with open(path, 'w') as file:
+        json.dump(profiles, file, indent=4, sort_keys=True)
+
+def candidate_heights(resolution=(1920, 1080), min_height=288, max_height=1080, crop=False):
+    """
+    List of the distinct frame heights HandTracker can really use, ie the heights produced 
+    by find_isp_scale_params() as HandTracker calls it (on the height in crop mode, on the width otherwise)
+    """
+    width, height = resolution
+    heights = set()
+    for h in range(min_height, min(max_height, height) + 1, 16):
+        if crop:
+            img_h, _ = mp.find_isp_scale_params(h, resolution)
+        else:
+            _, scale_nd = mp.find_isp_scale_params(h * width / height, resolution, is_height=False)
+            img_h = int(round(height * scale_nd[0] / scale_nd[1]))
+        if min_height <= img_h <= max_height:
+            heights.add(img_h)
+    return sorted(heights)
+
+def sweep(measure, fps_values=DEFAULT_FPS_VALUES, heights=(640,), fps_gain=0.02):
+    """
+    Call measure(internal_fps, internal_frame_height) for each height and each FPS value (ascending).
+    measure() returns a dict with at least 'fps' (sustained output FPS) and 'drop_rate' (ratio of dropped frames).
+    For a given height, the FPS sweep stops as soon as the output FPS does not increase anymore
+    (by more than 'fps_gain'), since higher FPS values would only increase the drop rate.
+    Returns the list of the measurement results (the setting is added to each result).
+    """
+    results = []
+    for height in heights:
+        best_fps = 0
+        for fps in sorted(fps_values):
+            result = dict(measure(fps, height), internal_fps=fps, internal_frame_height=height)
+            results.append(result)
+            if result['fps'] <= best_fps * (1 + fps_gain):
+                break
+            best_fps = result['fps']
+    return results
+
+def best_setting(results, max_drop_rate=0.05, fps_tolerance=0.05):
+    """
+    Choose the best setting among sweep() results:
+    - results with a drop rate higher than 'max_drop_rate' are discarded
+      (the camera produces frames that are never processed, which adds latency),
+    - among the remaining results, the setting with the highest output FPS is preferred,
+      but a higher frame height is preferred (better detection of far hands)
+      if its output FPS is within 'fps_tolerance' of the best one.
+    Returns a dict {'internal_fps':..., 'internal_frame_height':...} or None.
+    """
+    valid = [r for r in results if r['drop_rate'] <= max_drop_rate]
+    if not valid:
+        # Everything drops frames: take the setting that drops the least
+        valid = [min(results, key=lambda r: r['drop_rate'])] if results else []
+    if not valid:
+        return None
+    top_fps = max(r['fps'] for r in valid)
+    best = max((r for r in valid if r['fps'] >= top_fps * (1 - fps_tolerance)),
+                key=lambda r: (r['internal_frame_height'], r['fps']))
+    return {'internal_fps': best['internal_fps'], 'internal_frame_height': best['internal_frame_height']}
+
+
+class SimulatedDevice:
+    """
+    Stand-in of an OAK device for the calibration search.
+    The output FPS is limited by the camera FPS, the neural networks, the ISP and ImageManip
+    processing (proportional to the number of pixels) and the USB link (video frames are sent in NV12).
+    In crop mode, the frames are square.
+    """
+    def __init__(self, usb_speed="SUPER", nn_time=0.027, pixel_rate=28e6, mxid="SIMULATED", crop=False):
+        self.mxid = mxid
+        self.crop = crop
+        self.usb_speed = usb_speed
+        self.nn_time = nn_time
+        self.pixel_rate = pixel_rate
+        # Usable bandwidth in bytes/s
+        self.usb_bandwidth = 280e6 if usb_speed in ["SUPER", "SUPER_PLUS"] else 30e6
+
+    def measure(self, internal_fps, internal_frame_height, resolution=(1920, 1080)):
+        width = internal_frame_height if self.crop else int(round(internal_frame_height * resolution[0] / resolution[1]))
+        pixels = width * internal_frame_height
+        fps = min(internal_fps, 1 / self.nn_time, self.pixel_rate / pixels, self.usb_bandwidth / (pixels * 1.5))
+        return {'fps': fps, 'drop_rate': 1 - fps / internal_fps}
+
+
+def measure_device(lm_model="lite", xyz=False, resolution="full", crop=False, duration=8, warmup=2):
+    """
+    Returns a measure(internal_fps, internal_frame_height) function running HandTracker on the connected device.
+    """
+    from hand_tracker_edge import HandTracker
+    def measure(internal_fps, internal_frame_height):
+        tracker = HandTracker(lm_model=lm_model, xyz=xyz, resolution=resolution, crop=crop,
+                    internal_fps=internal_fps, internal_frame_height=internal_frame_height, use_profile=False)
+        start = monotonic()
+        while monotonic() - start < warmup:
+            tracker.next_frame()
+        nb_frames = 0
+        dropped_start = tracker.nb_dropped_frames
+        start = monotonic()
+        while monotonic() - start < duration:
+            tracker.next_frame()
+            nb_frames += 1
+        elapsed = monotonic() - start
+        nb_dropped = tracker.nb_dropped_frames - dropped_start
+        tracker.exit()
+        result = {'fps': nb_frames / elapsed, 'drop_rate': nb_dropped / (nb_frames + nb_dropped)}
+        print(f"FPS {internal_fps:3d} - height {internal_frame_height:4d} : output FPS = {result['fps']:.1f} - drop rate = {result['drop_rate']:.2f}")
+        return result
+    return measure
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Calibrate the internal FPS and frame height of the connected OAK device")
+    parser.add_argument('--lm_model', default="lite", choices=["full", "lite", "sparse"], help="Landmark model (default=%(default)s)")
+    parser.add_argument('--xyz', action="store_true", help="Calibrate with depth enabled")
+    parser.add_argument('--resolution', default="full", choices=["full", "ultra"], help="Sensor resolution (default=%(default)s)")
+    parser.add_argument('--crop', action="store_true", help="Calibrate in crop mode")
+    parser.add_argument('--fps', type=int, nargs='+', default=DEFAULT_FPS_VALUES, help="FPS values to try (default=%(default)s)")
+    parser.add_argument('--heights', type=int, nargs='+', help="Frame heights to try (default: valid heights between 432 and 720)")
+    parser.add_argument('--duration', type=float, default=8, help="Duration in s of each measure (default=%(default)s)")
+    parser.add_argument('--max_drop_rate', type=float, default=0.05, help="Maximum acceptable ratio of dropped frames (default=%(default)s)")
+    parser.add_argument('--profile_file', default=PROFILE_FILE, help="Profile file (default=%(default)s)")
+    parser.add_argument('--simulate', choices=["SUPER", "HIGH"], help="Run the search on a simulated device with the given USB speed, nothing is saved")
+    args = parser.parse_args()
+
+    heights = args.heights or candidate_heights(RESOLUTIONS[args.resolution], 432, 720, args.crop)
+    if args.simulate:
+        device = SimulatedDevice(usb_speed=args.simulate, crop=args.crop)
+        mxid, usb_speed = device.mxid, device.usb_speed
+        measure = device.measure
+    else:
+        import depthai as dai
+        with dai.Device() as device:
+            mxid = device.getMxId()
+            usb_speed = str(device.getUsbSpeed()).split('.')[-1]
+        measure = measure_device(args.lm_model, args.xyz, args.resolution, args.crop, args.duration)
+    print(f"Calibrating device {mxid} (USB speed: {usb_speed}) - heights: {heights}")
+
+    results = sweep(measure, args.fps, heights)
+    setting = best_setting(results, args.max_drop_rate)
+    print(f"Best setting: {setting}")
+    if setting and not args.simulate:
+        save_profile(mxid, usb_speed, args.lm_model, args.xyz, setting, args.resolution, args.crop, args.profile_file)
+        print(f"Profile saved in {args.profile_file}")
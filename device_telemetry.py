@@ -0,0 +1,225 @@
+"""
+Resource telemetry of the OAK device
+
+TelemetrySampler periodically reads from the device (from a daemon thread):
+    - the chip temperatures (average, CSS, MSS, UPA, DSS) in degrees C,
+    - the CPU usage (0-1) of the LEON CSS (runs the script node and the device firmware)
+      and of the LEON MSS (media subsystem: ISP, ImageManip),
+    - the DDR and CMX memory used and total (bytes).
+The samples are kept in a fixed-size ring (numpy array, one row per sample, columns FIELDS),
+so the memory does not grow with the session duration. HandTracker exposes the sampler
+as tracker.telemetry and prints its report with the stats.
+
+With the tracker stats (FPS, inference counts), this tells whether FPS drops come from
+the script node (CSS CPU at 100%), the media processing (MSS CPU) or thermal throttling
+(temperature rising above ~95 C).
+
+SimulatedDevice gives the same telemetry API without a device:
+> python3 device_telemetry.py --simulate [--duration 5] [--interval 0.2]
+"""
+import threading
+from time import monotonic
+from types import SimpleNamespace
+import numpy as np
+
+FIELDS = ["time", "temp_average", "temp_css", "temp_mss", "temp_upa", "temp_dss",
+        "css_cpu", "mss_cpu", "ddr_used", "ddr_total", "cmx_used", "cmx_total"]
+FIELD_INDEX = {f: i for i, f in enumerate(FIELDS)}
+
+def read_device(device):
+    """
+    Returns the values of FIELDS (but 'time') read from 'device' (depthai.Device or SimulatedDevice)
+    """
+    temp = device.getChipTemperature()
+    ddr = device.getDdrMemoryUsage()
+    cmx = device.getCmxMemoryUsage()
+    return (temp.average, temp.css, temp.mss, temp.upa, temp.dss,
+            device.getLeonCssCpuUsage().average, device.getLeonMssCpuUsage().average,
+            ddr.used, ddr.total, cmx.used, cmx.total)
+
+class TelemetrySampler:
+    """
+    - device: depthai.Device (or SimulatedDevice). Can be replaced (or set to None to pause the sampling),
+              eg when the pipeline is restarted,
+    - interval: sampling period in s,
+    - size: number of samples kept in the ring,
+    - metrics: a metrics.MetricsRegistry. When not None, the device gauges are updated on every sample,
+    - start: when True, start the sampling thread.
+    """
+    def __init__(self, device, interval=1.0, size=600, metrics=None, start=True):
+        self.device = device
+        self.interval = interval
+        self.ring = np.zeros((size, len(FIELDS)))
+        # Total number of samples (the last one is at index (nb_samples - 1) % size)
+        self.nb_samples = 0
+        self.nb_errors = 0
+        self.last_error = None
+        self.metrics = metrics
+        if metrics:
+            self.m_gauges = {
+                "temp_average": metrics.gauge("device_temperature_celsius", "Average chip temperature"),
+                "css_cpu": metrics.gauge("device_cpu_usage_ratio", "LEON CPU usage", cpu="css"),
+                "mss_cpu": metrics.gauge("device_cpu_usage_ratio", "LEON CPU usage", cpu="mss"),
+                "ddr_used": metrics.gauge("device_memory_used_bytes", "Device memory used", memory="ddr"),
+                "cmx_used": metrics.gauge("device_memory_used_bytes", "Device memory used", memory="cmx"),
+            }
+        self.stop_event = threading.Event()
+        self.thread = None
+        if start: self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Read the device once and append the values to the ring. Returns False if the device could not be read
+        """
+        device = self.device
+        if device is None: return False
+        try:
+            values = read_device(device)
+        except Exception as e:
+            # Device closed or restarted: keep sampling, the next read may succeed
+            self.nb_errors += 1
+            self.last_error = e
+            return False
+        row = self.ring[self.nb_samples % len(self.ring)]
+        row[0] = monotonic()
+        row[1:] = values
+        # The row is complete before it becomes visible to the readers
+        self.nb_samples += 1
+        if self.metrics:
+            for field, gauge in self.m_gauges.items():
+                gauge.set(row[FIELD_INDEX[field]])
+        return True
+
+    def samples(self):
+        """
+        Copy of the samples of the ring, in chronological order (array (N, len(FIELDS)))
+        """
+        nb_samples = self.nb_samples
+        size = len(self.ring)
+        if nb_samples <= size:
+            return self.ring[:nb_samples].copy()
+        start = nb_samples % size
+        return np.concatenate((self.ring[start:], self.ring[:start]))
+
+    def latest(self):
+        """
+        Last sample as a dict {field: value}, or None
+        """
+        if self.nb_samples == 0: return None
+        return dict(zip(FIELDS, self.ring[(self.nb_samples - 1) % len(self.ring)].tolist()))
+
+    def summary(self):
+        """
+        {field: (min, mean, max)} over the samples of the ring (fields other than 'time')
+        """
+        samples = self.samples()
+        if len(samples) == 0: return {}
+        return {f: (samples[:,i].min(), samples[:,i].mean(), samples[:,i].max()) for i, f in enumerate(FIELDS) if f != "time"}
+
+    def print_report(self):
+        samples = self.samples()
+        if len(samples) == 0:
+            print("Device telemetry : no sample")
+            return
+        summary = self.summary()
+        duration = samples[-1,0] - samples[0,0]
+        print(f"Device telemetry : {len(samples)} samples over {duration:.1f} s (min / mean / max)" +
+                (f" - {self.nb_errors} read errors" if self.nb_errors else ""))
+        for name, field, scale, unit in [("Chip temperature", "temp_average", 1, "C"), ("LEON CSS CPU", "css_cpu", 100, "%"),
+                                        ("LEON MSS CPU", "mss_cpu", 100, "%"), ("DDR used", "ddr_used", 1/2**20, "MiB"),
+                                        ("CMX used", "cmx_used", 1/2**10, "KiB")]:
+            low, mean, high = (v * scale for v in summary[field])
+            print(f"    {name:16s} {low:8.1f} / {mean:8.1f} / {high:8.1f} {unit}")
+        total = self.latest()
+        print(f"    DDR total {total['ddr_total'] / 2**20:.1f} MiB - CMX total {total['cmx_total'] / 2**10:.1f} KiB")
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class SimulatedDevice:
+    """
+    Stand-in of depthai.Device for the telemetry API, without camera.
+    - load: CPU load (0-1) of the CSS. The MSS load is 'load' * 0.8,
+    - ambient, max_temp: the temperature goes from 'ambient' to 'ambient' + load * ('max_temp' - 'ambient')
+                        with a time constant of 'time_constant' s,
+    - noise: amplitude of the random variations.
+    """
+    DDR_TOTAL = 343 * 2**20
+    CMX_TOTAL = 2 * 2**20
+
+    def __init__(self, load=0.5, ambient=40.0, max_temp=95.0, time_constant=60.0, noise=0.05, seed=None):
+        self.load = load
+        self.ambient = ambient
+        self.max_temp = max_temp
+        self.time_constant = time_constant
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.start_time = monotonic()
+        self.closed = False
+
+    def check(self):
+        if self.closed: raise RuntimeError("Device closed")
+
+    def getChipTemperature(self):
+        self.check()
+        elapsed = monotonic() - self.start_time
+        steady = self.ambient + self.load * (self.max_temp - self.ambient)
+        average = steady + (self.ambient - steady) * np.exp(-elapsed / self.time_constant)
+        temps = average + self.rng.normal(0, self.noise * 10, 4)
+        return SimpleNamespace(average=float(temps.mean()), css=float(temps[0]), mss=float(temps[1]), upa=float(temps[2]), dss=float(temps[3]))
+
+    def cpu_usage(self, load):
+        return SimpleNamespace(average=float(np.clip(load + self.rng.normal(0, self.noise), 0, 1)), msTime=1000)
+
+    def getLeonCssCpuUsage(self):
+        self.check()
+        return self.cpu_usage(self.load)
+
+    def getLeonMssCpuUsage(self):
+        self.check()
+        return self.cpu_usage(self.load * 0.8)
+
+    def getDdrMemoryUsage(self):
+        self.check()
+        used = int(self.DDR_TOTAL * (0.3 + 0.2 * self.load))
+        return SimpleNamespace(used=used, remaining=self.DDR_TOTAL - used, total=self.DDR_TOTAL)
+
+    def getCmxMemoryUsage(self):
+        self.check()
+        used = int(self.CMX_TOTAL * (0.5 + 0.3 * self.load))
+        return SimpleNamespace(used=used, remaining=self.CMX_TOTAL - used, total=self.CMX_TOTAL)
+
+    def close(self):
+        self.closed = True
+
+
+if __name__ == "__main__":
+    import argparse
+    from time import sleep
+    parser = argparse.ArgumentParser(description="Sample the resource telemetry of an OAK device")
+    parser.add_argument('--simulate', action="store_true", help="Use a simulated device")
+    parser.add_argument('--duration', type=float, default=10, help="Duration in s (default=%(default)s)")
+    parser.add_argument('--interval', type=float, default=1, help="Sampling period in s (default=%(default)s)")
+    args = parser.parse_args()
+
+    if args.simulate:
+        device = SimulatedDevice(time_constant=args.duration / 2)
+    else:
+        import depthai as dai
+        device = dai.Device()
+    sampler = TelemetrySampler(device, interval=args.interval)
+    sleep(args.duration)
+    sampler.close()
+    device.close()
+    sampler.print_report()
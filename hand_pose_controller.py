@@ -1,5 +1,7 @@
 import sys
+import inspect
 import datetime
+import numpy as np
 from time import monotonic
 
 ALL_POSES = ["ONE","TWO","THREE","FOUR","FIVE","FIST","PEACE","OK"]
@@ -14,6 +16,12 @@ DEFAULT_CONFIG = {
         "first_trigger_delay": 0.3, 
         "next_trigger_delay": 0.3, 
         "max_missing_frames": 3,
+        # Dead zone of the continuous actions: the event of a frame is not generated when the landmark
+        # 'delta_landmark' (default: index finger tip) has moved less than 'min_delta' pixels since the
+        # last event of the action (0 = an event every frame). Not suited to callbacks that feed a smoother
+        # (eg cursor moves): the smoothed output would freeze before it reaches the hand position
+        "min_delta": 0,
+        "delta_landmark": 8,
     },
 
     'tracker': 
@@ -24,8 +32,15 @@ DEFAULT_CONFIG = {
             'pd_nms_thresh': 0.3,
             'lm_score_thresh': 0.5, 
             'solo': True, # track only a single hand
-            'internal_fps': 30,
-            'internal_frame_height': 640,
+            # internal_fps and internal_frame_height come from the device profile (see device_profile.py),
+            # the fallback values are used when the device has no profile
+            'fallback_internal_fps': 30,
+            'fallback_frame_height': 640,
+            # 'pd_frame_height': 256 gives a small frame to the palm detection and takes the landmark crops
+            # from the internal_frame_height video (see benchmark_resolutions.py)
+            # 'lm_decimation': 'adaptive' skips the landmark inference when the hand is nearly still,
+            # the hands of the skipped frames are extrapolated (hand.synthetic is True, see lm_decimation.py)
+            # 'telemetry_interval': 1 samples the device temperature, CPU and memory usage (see device_telemetry.py)
             'use_gesture': True
         },
     },
@@ -38,6 +53,103 @@ DEFAULT_CONFIG = {
         {
             'output': None,
         }
+    },
+
+    'preview':
+    {
+        # When enabled, the frames with the hand overlay are served as an MJPEG stream 
+        # on http://host:port/ (see preview_server.py). Frames are only drawn and encoded 
+        # while a client is connected. Needs a tracker in a non laconic mode.
+        'enable': False,
+
+        'args':
+        {
+            'host': '127.0.0.1',
+            'port': 8080,
+            'width': 480,
+            'fps': 10,
+        }
+    },
+
+    'multi_hand':
+    {
+        # When enabled, the hands are associated into tracks (hand.track_id, see track_association.py)
+        # and the pose actions are triggered independently for each track.
+        # When disabled (solo mode), only the first hand is considered.
+        'enable': False,
+
+        'args':
+        {
+            'max_distance': 0.8,
+            'max_missing_frames': 10,
+        }
+    },
+
+    'devices':
+    {
+        # When enabled, one HandTracker (with the args of 'tracker') is created for each device of 'device_ids'
+        # (MX ids) and their hands are merged by a MultiHandTracker (see multi_hand_tracker.py).
+        # The renderer and the preview show the frame of the first device.
+        'enable': False,
+
+        'args':
+        {
+            'device_ids': [],
+            'transforms': {},
+            'dedup_radius': 60,
+            'max_age': 0.2,
+        }
+    },
+
+    'log':
+    {
+        # When enabled, the tracked hands are written in a columnar session log (see landmark_log.py)
+        'enable': False,
+
+        'args':
+        {
+            'directory': 'session_log',
+        }
+    },
+
+    'profile':
+    {
+        # When enabled, the time (and optionally the memory) spent in each stage of the loop
+        # is measured during 'window' seconds (see profiler.py)
+        'enable': False,
+
+        'args':
+        {
+            'mode': 'timers', # 'timers', 'cprofile', 'sample' or 'tracemalloc'
+            'window': 30,
+            'output': 'profile',
+        }
+    },
+
+    'metrics':
+    {
+        # When enabled, the counters of the tracker and the controller are served
+        # in the Prometheus text format on http://host:port/metrics (see metrics.py)
+        'enable': False,
+
+        'args':
+        {
+            'host': '127.0.0.1',
+            'port': 9100,
+        }
+    },
+
+    'latency_budget':
+    {
+        # When enabled, the landmark model and the camera FPS are adapted at runtime
+        # to keep the measured FPS and latency within budget (see latency_controller.py)
+        'enable': False,
+
+        'args':
+        {
+            'max_latency': 0.1,
+            'min_fps': 20,
+        }
     }
 }
 
@@ -60,12 +172,69 @@ class PoseEvent(Event):
     def __init__(self, hand, pose_action, trigger):
         super().__init__("Pose", hand, pose_action, trigger = trigger)
 
+# Trigger codes of the event state arrays
+TRIGGERS = ["continuous", "enter", "enter_leave", "periodic"]
+# Event codes (0 = no event)
+EVENT_NAMES = [None, "continuous", "enter", "periodic", "leave"]
+NO_EVENT, CONTINUOUS, ENTER, PERIODIC, LEAVE = range(5)
+
 class EventHist:
+    """
+    State of one pose action in solo mode (scalar path of generate_events())
+    """
     def __init__(self, triggered=False, first_triggered=False, time=0, frame_nb=0):
         self.triggered = triggered
         self.first_triggered = first_triggered
         self.time = time
         self.frame_nb = frame_nb
+        # Position of the dead zone landmark at the last continuous event (None = no event yet)
+        self.last_xy = None
+
+class EventState:
+    """
+    State of the pose actions for each track in multi-hand mode, in arrays of shape (nb slots, nb actions).
+    A slot holds the state of one track, slots are added when needed.
+    """
+    def __init__(self, nb_actions, nb_slots=1):
+        self.nb_actions = nb_actions
+        self.triggered = np.zeros((nb_slots, nb_actions), dtype=bool)
+        self.first_triggered = np.zeros((nb_slots, nb_actions), dtype=bool)
+        self.time = np.zeros((nb_slots, nb_actions), dtype=np.float64)
+        self.frame_nb = np.zeros((nb_slots, nb_actions), dtype=np.int64)
+        # Position of the dead zone landmark at the last continuous event (NaN = no event yet)
+        self.last_xy = np.full((nb_slots, nb_actions, 2), np.nan)
+        # track id -> slot, and slot -> track id
+        self.slots = {}
+        self.track_ids = [0] * nb_slots
+        self.free_slots = list(range(nb_slots))
+
+    def grow(self):
+        nb_slots = len(self.triggered)
+        for name in ["triggered", "first_triggered", "time", "frame_nb"]:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.last_xy = np.concatenate([self.last_xy, np.full_like(self.last_xy, np.nan)])
+        self.track_ids.extend([None] * nb_slots)
+        self.free_slots.extend(range(nb_slots, 2 * nb_slots))
+
+    def slot(self, track_id):
+        slot = self.slots.get(track_id)
+        if slot is None:
+            if not self.free_slots:
+                self.grow()
+            slot = self.slots[track_id] = self.free_slots.pop(0)
+            self.track_ids[slot] = track_id
+        return slot
+
+    def release(self, track_id):
+        slot = self.slots.pop(track_id)
+        self.triggered[slot] = self.first_triggered[slot] = False
+        self.time[slot] = 0
+        self.frame_nb[slot] = 0
+        self.last_xy[slot] = np.nan
+        self.track_ids[slot] = None
+        self.free_slots.append(slot)
+        return slot
 
 def merge_dicts(d1, d2):
     #Merge 2 dictionaries. The 2nd dictionary's values overwrites those from the first
@@ -88,7 +257,14 @@ def config_handler(c1, c2):
     return merged_config
 
 class HandController:
-    def __init__(self, config={}):
+    """
+    - config: user defined config, merged with DEFAULT_CONFIG,
+    - tracker: an already created tracker object (with a next_frame() method). 
+                When None, a HandTracker is created with the args of config['tracker'].
+    - backend: input injection backend used by the callbacks (see input_backend.py), or None.
+                Its flush() method is called once per frame after the callbacks, and close() at exit.
+    """
+    def __init__(self, config={}, tracker=None, backend=None):
         self.config = config_handler(DEFAULT_CONFIG, config)
 
         # HandController runs callback functions defined in the calling app
@@ -97,14 +273,64 @@ class HandController:
         # Parse pose configurations
         self.parse_poses()
 
-        # Store previous poses 
-        self.poses_hist = [EventHist() for i in range(len(self.pose_actions))]
+        # Event state of each pose action (solo mode), or of each (track, pose action) (multi-hand mode)
+        self.poses_hist = [EventHist() for _ in self.pose_actions]
+        self.event_state = None
+        self.associator = None
+        if self.config['multi_hand']['enable']:
+            from track_association import HandTrackAssociator
+            self.associator = HandTrackAssociator(**self.config['multi_hand']['args'])
+            self.event_state = EventState(len(self.pose_actions))
 
-        # Load HandTracker
-        from hand_tracker_edge import HandTracker
+        # Latency budget controller: the tracker starts with the settings of the controller's current level
+        self.latency_controller = None
+        if self.config['latency_budget']['enable']:
+            from latency_controller import LatencyBudgetController
+            tracker_args = self.config['tracker']['args']
+            budget_args = merge_dicts({'xyz': tracker_args.get('xyz', False)}, self.config['latency_budget']['args'])
+            self.latency_controller = LatencyBudgetController(**budget_args)
+            pinned = [k for k in self.latency_controller.settings if k in config.get('tracker', {}).get('args', {})]
+            if pinned:
+                print(f"Warning: with latency_budget enabled, the tracker args {', '.join(pinned)} are set by the ladder of the controller " 
+                        f"(starting with {self.latency_controller.settings})")
+            tracker_args.update(self.latency_controller.settings)
        
+        # Live metrics
+        self.metrics = None
+        if self.config['metrics']['enable']:
+            from metrics import MetricsRegistry, MetricsServer
+            self.metrics = MetricsRegistry()
+            self.metrics_server = MetricsServer(self.metrics, **self.config['metrics']['args'])
+            self.m_fps = self.metrics.gauge("fps", "Frames processed per second by the controller loop")
+            self.m_loop_time = self.metrics.gauge("loop_seconds", "Host processing time of the last frame")
+            self.m_events = {}
+            self.m_suppressed = {a: self.metrics.counter("suppressed_events_total", "Continuous events suppressed by the dead zone (min_delta)",
+                                                        pose_action=self.pose_actions[a]["name"]) for a in np.flatnonzero(self.dead_zone)}
+            self.fps_frame_nb = 0
+            self.fps_time = monotonic()
+
         # Initialize tracker
-        self.tracker = HandTracker(**self.config['tracker']['args'])
+        if tracker is None:
+            tracker_args = self.config['tracker']['args']
+            if self.metrics:
+                tracker_args = merge_dicts(tracker_args, {'metrics': self.metrics})
+            use_devices = self.config['devices']['enable']
+            # Frames are converted on every frame only when the renderer draws them, otherwise on demand.
+            # MultiHandTracker has no get_frame(): the frames of the primary device are converted when they are shown
+            if 'frame_mode' not in tracker_args:
+                array_mode = self.config['renderer']['enable'] or (use_devices and self.config['preview']['enable'])
+                tracker_args = merge_dicts(tracker_args, {'frame_mode': 'array' if array_mode else 'lazy'})
+            if use_devices:
+                if self.latency_controller:
+                    print("Error: latency_budget is not supported with several devices")
+                    sys.exit(1)
+                from multi_hand_tracker import MultiHandTracker
+                tracker = MultiHandTracker(tracker_args=tracker_args, **self.config['devices']['args'])
+            else:
+                from hand_tracker_edge import HandTracker
+                tracker = HandTracker(**tracker_args)
+        self.tracker = tracker
+        self.backend = backend
 
         # Activate renderer to show live video preview with hand skeleton
         self.use_renderer = self.config['renderer']['enable']
@@ -112,6 +338,29 @@ class HandController:
             from hand_tracker_renderer import HandTrackerRenderer
             self.renderer = HandTrackerRenderer(self.tracker, **self.config['renderer']['args'])
 
+        # Preview server. The overlay is drawn by the renderer when enabled, or by a draw-only renderer
+        self.preview = None
+        if self.config['preview']['enable']:
+            from preview_server import PreviewServer
+            self.preview = PreviewServer(**self.config['preview']['args'])
+            if self.use_renderer:
+                self.preview_renderer = None
+            else:
+                from hand_tracker_renderer import HandTrackerRenderer
+                self.preview_renderer = HandTrackerRenderer(self.tracker)
+
+        # Session log
+        self.log = None
+        if self.config['log']['enable']:
+            from landmark_log import LandmarkLogWriter
+            self.log = LandmarkLogWriter(**self.config['log']['args'])
+
+        # Profiler
+        self.profiler = None
+        if self.config['profile']['enable']:
+            from profiler import LoopProfiler
+            self.profiler = LoopProfiler(**self.config['profile']['args'])
+
         self.frame_nb = 0
         
 
@@ -130,13 +379,61 @@ class HandController:
                 mandatory_args = { k:pa[k] for k in mandatory_keys}
                 all_args = merge_dicts(mandatory_args, optional_args)
                 self.pose_actions.append(all_args)
+        # Parameters of the pose actions as arrays, used by generate_events()
+        pas = self.pose_actions
+        self.pa_trigger = np.array([TRIGGERS.index(pa['trigger']) for pa in pas], dtype=np.int8)
+        self.pa_hand = np.array([["any", "right", "left"].index(pa['hand']) for pa in pas], dtype=np.int8)
+        self.pa_first_delay = np.array([pa['first_trigger_delay'] for pa in pas], dtype=np.float64)
+        self.pa_next_delay = np.array([pa['next_trigger_delay'] for pa in pas], dtype=np.float64)
+        self.pa_max_missing = np.array([pa['max_missing_frames'] for pa in pas], dtype=np.int64)
+        self.pa_min_delta = np.array([pa['min_delta'] for pa in pas], dtype=np.float64)
+        self.pa_delta_landmark = np.array([pa['delta_landmark'] for pa in pas], dtype=np.int64)
+        # Continuous actions with a dead zone, and number of events suppressed by the dead zone per action
+        self.dead_zone = (self.pa_trigger == 0) & (self.pa_min_delta > 0)
+        self.nb_suppressed_events = np.zeros(len(pas), dtype=np.int64)
+        # pa_poses[g, a] is True if the pose of index g in ALL_POSES triggers the action a
+        # (last row: hand without pose)
+        self.pa_poses = np.zeros((len(ALL_POSES) + 1, len(pas)), dtype=bool)
+        for a, pa in enumerate(pas):
+            for pose in pa['pose']:
+                self.pa_poses[ALL_POSES.index(pose), a] = True
+        self.pose_index = {pose: i for i, pose in enumerate(ALL_POSES)}
             
+    def assign_slots(self, hands):
+        """
+        Multi-hand mode: returns the list of the hands of each slot of the event state (None for a slot 
+        without hand) and the list of (slot, track id) of the dropped tracks
+        """
+        state = self.event_state
+        slot_hands = [None] * len(state.triggered)
+        dropped = self.associator.update(hands, self.frame_nb)
+        dropped_slots = [(state.slots[track_id], track_id) for track_id in dropped if track_id in state.slots]
+        for hand in hands:
+            slot = state.slot(hand.track_id)
+            if slot >= len(slot_hands):
+                slot_hands.extend([None] * (len(state.triggered) - len(slot_hands)))
+            slot_hands[slot] = hand
+        return slot_hands, dropped_slots
+
     def generate_events(self, hands):
+        """
+        Update the state of the pose actions and returns the events of the frame
+        """
+        if self.associator is None:
+            return self.generate_solo_events(hands)
+        return self.generate_track_events(hands)
 
+    def generate_solo_events(self, hands):
+        """
+        Solo mode: state machine of each pose action on the first hand, with scalar operations
+        (a few microseconds per frame, much cheaper than the array operations for a single track)
+        """
         events = []
 
         # in solo mode: either hands=[] or hands=[hand]
         hand = hands[0] if hands else None
+        if hand:
+            hand.track_id = 0
 
         for i, pa in enumerate(self.pose_actions):
             hist = self.poses_hist[i]
@@ -145,7 +442,8 @@ class HandController:
                 (hand.label == pa['hand'] or pa['hand'] == 'any') and \
                 hand.gesture in pa['pose']:
                 if trigger == "continuous":
-                    events.append(PoseEvent(hand, pa, "continuous"))
+                    if pa['min_delta'] <= 0 or not self.in_dead_zone(hist, hand, i):
+                        events.append(PoseEvent(hand, pa, "continuous"))
                 else: # trigger in ["enter", "enter_leave", "periodic"]:
                     if not hist.triggered:
                         if hist.time != 0 and (self.frame_nb - hist.frame_nb <= pa['max_missing_frames']):
@@ -174,34 +472,334 @@ class HandController:
                 hist.frame_nb = self.frame_nb
 
             else:
+                # When the pose is lost, the next continuous event is generated whatever the position
+                hist.last_xy = None
                 if hist.triggered and self.frame_nb - hist.frame_nb > pa['max_missing_frames']:
                     hist.time = self.now
                     hist.triggered = False
                     hist.first_triggered = False 
                     if trigger == "enter_leave":
                         events.append(PoseEvent(hand, pa, "leave")) 
+        for event in events:
+            event.track_id = 0
         return events    
 
+    def in_dead_zone(self, hist, hand, i):
+        """
+        Solo mode: True when the continuous event of the action i is suppressed by the dead zone
+        (its landmark moved less than min_delta pixels since the last event)
+        """
+        pa = self.pose_actions[i]
+        x, y = hand.landmarks[pa['delta_landmark'], :2].tolist()
+        if hist.last_xy is not None:
+            last_x, last_y = hist.last_xy
+            if (x - last_x)**2 + (y - last_y)**2 < pa['min_delta']**2:
+                self.nb_suppressed_events[i] += 1
+                if self.metrics: self.m_suppressed[i].inc()
+                return True
+        hist.last_xy = (x, y)
+        return False
+
+    def generate_track_events(self, hands):
+        """
+        Multi-hand mode: update the state of each (track, pose action) and returns the events of the frame.
+        All the (track, action) pairs are processed at once with array operations.
+        """
+        events = []
+        state = self.event_state
+        slot_hands, dropped_slots = self.assign_slots(hands)
+        # Dropped tracks: 'leave' events for the 'enter_leave' actions still triggered
+        for slot, track_id in dropped_slots:
+            for a in np.nonzero(state.triggered[slot] & (self.pa_trigger == 2))[0]:
+                event = PoseEvent(None, self.pose_actions[a], "leave")
+                event.track_id = track_id
+                events.append(event)
+            state.release(track_id)
+
+        # Pose and handedness of the hand of each slot (-1 = no pose)
+        nb_slots = len(state.triggered)
+        gestures = np.full(nb_slots, -1)
+        labels = np.zeros(nb_slots, dtype=np.int8)
+        for slot, hand in enumerate(slot_hands):
+            if hand and hand.gesture:
+                gestures[slot] = self.pose_index.get(hand.gesture, -1)
+                labels[slot] = 1 if hand.label == "right" else 2
+        match = self.pa_poses[gestures] & ((self.pa_hand == 0) | (self.pa_hand == labels[:,None]))
+
+        # Same logic as the former per-action state machine, on all the (slot, action) pairs
+        trigger = self.pa_trigger
+        continuous = trigger == 0
+        since = self.frame_nb - state.frame_nb
+        elapsed = self.now - state.time
+        waiting = match & ~continuous & ~state.triggered
+        recent = waiting & (state.time != 0) & (since <= self.pa_max_missing)
+        delay_ok = recent & np.where(state.first_triggered, elapsed > self.pa_next_delay, elapsed > self.pa_first_delay)
+        fire_enter = delay_ok & ((trigger == 1) | (trigger == 2))
+        fire_periodic = delay_ok & (trigger == 3)
+        restart = waiting & ~recent
+        expire = state.triggered & (since > self.pa_max_missing)
+
+        codes = np.zeros(match.shape, dtype=np.int8)
+        codes[match & continuous] = CONTINUOUS
+        codes[fire_enter] = ENTER
+        codes[fire_periodic] = PERIODIC
+        codes[expire & (trigger == 2)] = LEAVE
+        if self.dead_zone.any():
+            self.apply_dead_zone(codes, match, slot_hands)
+        state.triggered[fire_enter] = True
+        state.time[fire_periodic | restart | expire] = self.now
+        state.first_triggered[fire_periodic] = True
+        state.first_triggered[restart | expire] = False
+        state.triggered[expire] = False
+        state.frame_nb[match] = self.frame_nb
+
+        for slot, a in zip(*np.nonzero(codes)):
+            hand = slot_hands[slot]
+            event = PoseEvent(hand, self.pose_actions[a], EVENT_NAMES[codes[slot, a]])
+            event.track_id = state.track_ids[slot]
+            events.append(event)
+        return events    
+
+    def apply_dead_zone(self, codes, match, slot_hands):
+        """
+        Cancel (in 'codes') the continuous events whose landmark has moved less than min_delta pixels 
+        since the last event of the same (track, action). Evaluated on the raw landmarks, 
+        before the event objects are created.
+        """
+        state = self.event_state
+        last_xy = state.last_xy
+        # Usually a single (track, action) pair: scalar arithmetic is cheaper than array operations
+        for slot, a in zip(*np.nonzero(self.dead_zone & (codes == CONTINUOUS))):
+            x, y = slot_hands[slot].landmarks[self.pa_delta_landmark[a], :2].tolist()
+            last_x, last_y = last_xy[slot, a].tolist()
+            # No previous event (NaN): the comparison is False, the event is generated
+            if (x - last_x)**2 + (y - last_y)**2 < self.pa_min_delta[a]**2:
+                codes[slot, a] = NO_EVENT
+                self.nb_suppressed_events[a] += 1
+                if self.metrics: self.m_suppressed[a].inc()
+            else:
+                last_xy[slot, a] = x, y
+        # When the pose of the action is lost, the next event is generated whatever the position
+        last_xy[self.dead_zone & ~match] = np.nan
+
     def process_events(self, events):
+        """
+        Run the callbacks of the events. A callback is either a callable, or the name of a function
+        of the module which created the HandController. Returns the list of the awaitables returned 
+        by coroutine callbacks (only supported with stream() and run())
+        """
+        awaitables = []
         for e in events:
-            self.caller_globals[e.callback](e)
+            if self.metrics:
+                self.count_event(e)
+            callback = e.callback if callable(e.callback) else self.caller_globals[e.callback]
+            result = callback(e)
+            if inspect.isawaitable(result):
+                awaitables.append(result)
+        return awaitables
+
+    def count_event(self, event):
+        key = (event.name, event.trigger)
+        counter = self.m_events.get(key)
+        if counter is None:
+            counter = self.m_events[key] = self.metrics.counter("events_total", "Events dispatched to the callbacks", 
+                                                                pose_action=event.name, trigger=event.trigger)
+        counter.inc()
+
+    def update_metrics(self):
+        self.m_loop_time.set(monotonic() - self.now)
+        if self.now - self.fps_time >= 1:
+            self.m_fps.set((self.frame_nb - self.fps_frame_nb) / (self.now - self.fps_time))
+            self.fps_frame_nb = self.frame_nb
+            self.fps_time = self.now
+
+    def begin_frame(self, prof, t):
+        """
+        Start the processing of a new frame. Returns (new latency budget settings or None, t)
+        """
+        self.frame_nb += 1
+        settings = None
+        if self.latency_controller:
+            settings = self.latency_controller.update(self.now, self.tracker.latency)
+            if prof: t = prof.lap("latency budget", t)
+        return settings, t
+
+    def dispatch(self, hands, prof, t):
+        """
+        Generate the events of the frame and run their callbacks. Returns (awaitables, t)
+        """
+        events = self.generate_events(hands)
+        if prof: t = prof.lap("generate events", t)
+        awaitables = self.process_events(events)
+        if prof: t = prof.lap("callbacks", t)
+        return awaitables, t
+
+    def end_frame(self, frame, hands, prof, t, frame_copied=False):
+        """
+        Outputs of the frame (input backend, log, renderer, preview, metrics).
+        frame_copied: True when 'frame' is a private copy of the frame of 'hands' (see read_stream_frame()).
+        Returns False when the user asked to quit from the renderer window
+        """
+        if self.backend:
+            self.backend.flush()
+            if prof: t = prof.lap("input", t)
+        if self.log:
+            for hand in hands:
+                self.log.append(self.frame_nb, self.now, hand)
+            if prof: t = prof.lap("log", t)
+
+        if self.use_renderer:
+            frame = self.renderer.draw(frame, hands)
+            key = self.renderer.waitKey(delay=1)
+            if prof: t = prof.lap("renderer", t)
+            if key == 27 or key == ord('q'):
+                return False
+        if self.preview and self.preview.wants_frame(self.now):
+            if not frame_copied:
+                if hasattr(self.tracker, 'get_frame'):
+                    frame = self.tracker.get_frame()
+                # The encoder thread may still use the frame after the tracker has recycled its pool buffer
+                frame = frame.copy()
+            if self.preview_renderer:
+                frame = self.preview_renderer.draw(frame, hands)
+            self.preview.submit(frame, self.now)
+            if prof: t = prof.lap("preview", t)
+        if self.metrics:
+            self.update_metrics()
+        if prof and prof.end_frame():
+            self.profiler = None
+        return True
 
     def loop(self):
         while True:
             self.now = monotonic()
+            prof = self.profiler
+            t = prof.start_frame() if prof else None
             frame, hands, _ = self.tracker.next_frame()
+            if prof: t = prof.lap("tracker", t)
             if frame is None: break
-            self.frame_nb += 1
-            events = self.generate_events(hands)
-            self.process_events(events)
+            settings, t = self.begin_frame(prof, t)
+            if settings:
+                self.tracker.restart_pipeline(**settings)
+            awaitables, t = self.dispatch(hands, prof, t)
+            if awaitables:
+                print("Error: coroutine callbacks need HandController.run() or stream()")
+                sys.exit(1)
+            if not self.end_frame(frame, hands, prof, t): break
+        self.close()
 
-            if self.use_renderer:
-                frame = self.renderer.draw(frame, hands)
-                key = self.renderer.waitKey(delay=1)
-                if key == 27 or key == ord('q'):
-                    break
-        self.renderer.exit()
-        self.tracker.exit()
-            
+    def read_stream_frame(self):
+        """
+        tracker.next_frame() for stream(), called in the reader thread.
+        While a frame waits in the queue or is processed, the reader goes on and the tracker recycles 
+        its frame buffers: the frame used by the outputs (renderer, preview with clients) is converted 
+        and copied here, so that it stays the frame of its hands.
+        Returns (frame, hands, True if the frame is a copy)
+        """
+        frame, hands, _ = self.tracker.next_frame()
+        if frame is None or not (self.use_renderer or (self.preview and self.preview.nb_clients)):
+            return frame, hands, False
+        if hasattr(self.tracker, 'get_frame'):
+            frame = self.tracker.get_frame()
+        return frame.copy(), hands, True
 
+    async def stream(self, queue_size=1, close_timeout=1.0):
+        """
+        Asynchronous generator of the hands of each frame: 
+            async for hands in controller.stream(): ...
+        Frames are read from the tracker in a worker thread, and go through a queue of 'queue_size' 
+        frames: when the consumer is slower than the tracker, the oldest frames are dropped 
+        (counted in self.nb_stale_frames) instead of accumulating latency.
+        The events are processed as in loop(), and coroutine callbacks are awaited.
+        The tracker and the outputs are closed when the generator ends. To leave the loop early 
+        and close them immediately, use: async with contextlib.aclosing(controller.stream()) as hands_stream: ...
+        An exception raised by the tracker in the reader thread is re-raised by the generator.
+        At the end, the read in progress is awaited at most 'close_timeout' s (without blocking the event loop),
+        then the tracker is closed, which also ends a read blocked on a device that stopped sending.
+        """
+        import asyncio
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        event_loop = asyncio.get_running_loop()
+        def init_reader():
+            # The tracker runs in the reader thread: the 'sample' profiler must sample it too
+            if self.profiler:
+                self.profiler.add_thread(threading.get_ident(), "reader")
+        # A single worker: all the calls to the tracker are serialized
+        executor = ThreadPoolExecutor(max_workers=1, initializer=init_reader)
+        queue = asyncio.Queue(maxsize=queue_size)
+        self.nb_stale_frames = 0
+        reading = None
 
+        async def read_frames():
+            nonlocal reading
+            while True:
+                reading = executor.submit(self.read_stream_frame)
+                try:
+                    item = await asyncio.wrap_future(reading)
+                except Exception as e:
+                    # Handed to the consumer, which re-raises it (otherwise it would wait forever)
+                    item = e
+                if queue.full():
+                    queue.get_nowait()
+                    self.nb_stale_frames += 1
+                queue.put_nowait(item)
+                if isinstance(item, Exception) or item[0] is None: break
+
+        reader = asyncio.create_task(read_frames())
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                frame, hands, frame_copied = item
+                self.now = monotonic()
+                if frame is None: break
+                prof = self.profiler
+                t = prof.start_frame() if prof else None
+                settings, t = self.begin_frame(prof, t)
+                if settings:
+                    await event_loop.run_in_executor(executor, lambda: self.tracker.restart_pipeline(**settings))
+                awaitables, t = self.dispatch(hands, prof, t)
+                if awaitables:
+                    await asyncio.gather(*awaitables)
+                if not self.end_frame(frame, hands, prof, t, frame_copied): break
+                yield hands
+        finally:
+            reader.cancel()
+            # Cancelling the reader does not stop a read running in the worker thread
+            executor.shutdown(wait=False)
+            if reading is not None and not reading.done():
+                read = asyncio.wrap_future(reading)
+                # The result (or the error of a read ended by the device closing) is not used
+                read.add_done_callback(lambda f: f.cancelled() or f.exception())
+                await asyncio.wait([read], timeout=close_timeout)
+            if self.nb_stale_frames:
+                print(f"Stale frames dropped: {self.nb_stale_frames}")
+            self.close()
+
+    async def run(self, queue_size=1):
+        """
+        Asynchronous equivalent of loop()
+        """
+        async for _ in self.stream(queue_size):
+            pass
+
+    def close(self):
+        if self.dead_zone.any():
+            print("Events suppressed by the dead zone: " + 
+                    ", ".join(f"{self.pose_actions[a]['name']}: {self.nb_suppressed_events[a]}" for a in np.flatnonzero(self.dead_zone)))
+        if self.profiler:
+            self.profiler.finish()
+        if self.use_renderer:
+            self.renderer.exit()
+        if self.preview:
+            self.preview.close()
+        if self.metrics:
+            self.metrics_server.close()
+        if self.backend:
+            self.backend.close()
+        self.tracker.exit()
+        # Last: re-raises the error of the log writer thread, if any
+        if self.log:
+            self.log.close()
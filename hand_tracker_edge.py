@@ -1,10 +1,15 @@
 import numpy as np
 import mediapipe as mp
 import depthai as dai
+from device_profile import load_profile, default_internal_fps
+from lm_decimation import HandExtrapolator, manager_params
 from pathlib import Path
 import sys
+import os
+import hashlib
 from string import Template
 import marshal
+from time import monotonic
 
 
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -14,7 +19,14 @@ LANDMARK_MODEL_LITE = str(SCRIPT_DIR / "models/hand_landmark_lite_sh4.blob")
 LANDMARK_MODEL_SPARSE = str(SCRIPT_DIR / "models/hand_landmark_sparse_sh4.blob")
 DETECTION_POSTPROCESSING_MODEL = str(SCRIPT_DIR / "custom_models/PDPostProcessing_top2_sh1.blob")
 MANAGER_HAND_SOLO = str(SCRIPT_DIR / "manager_hand_solo.py")
+# Rendered manager scripts, keyed by a hash of the template and of the substitution parameters
+MANAGER_SCRIPT_CACHE = SCRIPT_DIR / ".manager_script_cache"
 
+LANDMARK_MODELS = {
+    "full": LANDMARK_MODEL_FULL,
+    "lite": LANDMARK_MODEL_LITE,
+    "sparse": LANDMARK_MODEL_SPARSE,
+}
 
 class HandTracker:
     """
@@ -44,11 +56,34 @@ class HandTracker:
     - solo: boolean, when True detect one hand max (much faster since we run the pose detection model only if no hand was detected in the previous frame)
                     On edge mode, always True
     - xyz : boolean, when True calculate the (x, y, z) coords of the detected palms.
+    - xyz_async : boolean (only used when xyz is True). When True, the manager script does not wait for 
+                    the depth of the current frame: the ROI of frame N is submitted to the SpatialLocationCalculator 
+                    and its result is attached to a later result. hand.xyz_age gives the age (in frames) of the depth
+                    measure (0 in synchronous mode, -1 when no measure has been received yet).
     - crop : boolean which indicates if square cropping on source images is applied or not
     - internal_fps : when using the internal color camera as input source, set its FPS to this value (calling setFps()).
+                    When None, the value of the device profile (see device_profile.py) is used if any, 
+                    otherwise fallback_internal_fps.
     - resolution : sensor resolution "full" (1920x1080) or "ultra" (3840x2160),
     - internal_frame_height : when using the internal color camera, set the frame height (calling setIspScale()).
                     The width is calculated accordingly to height and depends on value of 'crop'
+                    When None, the value of the device profile is used if any, otherwise fallback_frame_height.
+    - pd_frame_height : when None, the palm detection and the landmark crops use the same frame (cam.preview,
+                    of height internal_frame_height). Otherwise, the palm detection branch gets a preview downscaled 
+                    to this height (same aspect ratio), as it only needs 128 pixels, and the landmark crops are taken 
+                    from cam.video at internal_frame_height. A high internal_frame_height (even with resolution "ultra") 
+                    then helps the landmarks of far away hands without slowing down the palm detection branch.
+    - use_profile : boolean, when True, load the calibrated internal_fps and internal_frame_height 
+                    of the device (keyed by MX id and USB speed) from the profile file written by device_profile.py
+    - fallback_internal_fps : internal_fps when it is None and no profile is found. When None, a default value
+                    depending on lm_model and xyz (see device_profile.default_internal_fps()).
+    - fallback_frame_height : internal_frame_height when it is None and no profile is found.
+    - lm_decimation : "off", "alternate" or "adaptive" (see lm_decimation.py). When not "off", the manager script skips
+                    the landmark inference on some frames while a hand is tracked: one frame out of two ("alternate"),
+                    or when the hand ROI moves less than lm_skip_motion per frame (relative to the ROI size), 
+                    up to lm_max_skips consecutive frames ("adaptive"). The hands of the skipped frames are 
+                    extrapolated from the last 2 inferences and have hand.synthetic = True (False for the inferred hands).
+    - lm_skip_motion, lm_max_skips : parameters of the "adaptive" decimation.
     - use_gesture : boolean, when True, recognize hand poses froma predefined set of poses
                     (ONE, TWO, THREE, FOUR, FIVE, OK, PEACE, FIST)
     - use_handedness_average : boolean, when True the handedness is the average of the last collected handednesses.
@@ -63,7 +98,21 @@ class HandTracker:
     - use_same_image (Edge Duo mode only) : boolean, when True, use the same image when inferring the landmarks of the 2 hands
                     (setReusePreviousImage(True) in the ImageManip node before the landmark model). 
                     When True, the FPS is significantly higher but the skeleton may appear shifted on one of the 2 hands.
-    - stats : boolean, when True, display some statistics when exiting.   
+    - device_id : MX id of the device to use. When None, the first available device is used.
+    - metrics : a metrics.MetricsRegistry. When not None, the frame, inference and drop counters 
+                    and the latency gauge of the registry are updated on every frame (independently of 'stats').
+    - frame_mode : how next_frame() returns the video frame:
+                    - "array": the BGR frame, converted into a buffer of a pool of 'frame_pool_size' buffers
+                      (no allocation per frame). A frame stays valid during the 'frame_pool_size'-1 next calls:
+                      a frame handed to another thread must be copied, unless that thread is done with it by then,
+                    - "lazy": a shared read-only black frame (sentinel). The BGR conversion is done only if get_frame() 
+                      is called, which is useful when the frames are only occasionally needed (eg preview server).
+                    In laconic mode, no frame is received: "array" gives a (pooled) black frame, "lazy" the sentinel.
+    - frame_pool_size : number of buffers of the frame pool.
+    - telemetry_interval : when not None, sampling period in s of the device resources (chip temperature, 
+                    LEON CSS/MSS CPU usage, DDR/CMX memory, see device_telemetry.py), sampled in a background thread.
+                    The samples are available in self.telemetry and summarized with the stats.
+    - stats : boolean, when True, display some statistics (including FPS and latency) when exiting.   
     - trace : int, 0 = no trace, otherwise print some debug messages or show output of ImageManip nodes
             if trace & 1, print application level info like number of palm detections,
             if trace & 2, print lower level info like when a message is sent or received by the manager script node,
@@ -82,15 +131,28 @@ class HandTracker:
                 pp_model = DETECTION_POSTPROCESSING_MODEL,
                 solo=True,
                 xyz=False,
+                xyz_async=False,
                 crop=False,
                 internal_fps=None,
                 resolution="full",
-                internal_frame_height=640,
+                internal_frame_height=None,
+                pd_frame_height=None,
+                use_profile=True,
+                fallback_internal_fps=None,
+                fallback_frame_height=640,
+                lm_decimation="off",
+                lm_skip_motion=0.02,
+                lm_max_skips=2,
                 use_gesture=False,
                 use_handedness_average=True,
                 single_hand_tolerance_thresh=10,
                 use_same_image=True,
                 lm_nb_threads=2,
+                device_id=None,
+                metrics=None,
+                frame_mode="array",
+                frame_pool_size=4,
+                telemetry_interval=None,
                 stats=False,
                 trace=0
                 ):
@@ -99,14 +161,7 @@ class HandTracker:
         
         self.pd_model = pd_model
         #print(f"Palm detection blob     : {self.pd_model}")
-        if lm_model == "full":
-            self.lm_model = LANDMARK_MODEL_FULL
-        elif lm_model == "lite":
-            self.lm_model = LANDMARK_MODEL_LITE
-        elif lm_model == "sparse":
-                self.lm_model = LANDMARK_MODEL_SPARSE
-        else:
-            self.lm_model = lm_model
+        self.lm_model = LANDMARK_MODELS.get(lm_model, lm_model)
         #print(f"Landmark blob           : {self.lm_model}")
         self.pd_score_thresh = pd_score_thresh
         self.pd_nms_thresh = pd_nms_thresh
@@ -121,6 +176,7 @@ class HandTracker:
             assert lm_nb_threads in [1, 2]
             self.lm_nb_threads = lm_nb_threads
         self.xyz = False
+        self.xyz_async = xyz_async
         self.crop = crop 
         self.use_world_landmarks = use_world_landmarks
            
@@ -130,8 +186,17 @@ class HandTracker:
         self.use_handedness_average = use_handedness_average
         self.single_hand_tolerance_thresh = single_hand_tolerance_thresh
         self.use_same_image = use_same_image
+        self.lm_decimation = lm_decimation
+        self.lm_skip_motion, self.lm_max_skips = manager_params(lm_decimation, lm_skip_motion, lm_max_skips)
+        self.extrapolator = HandExtrapolator()
+
+        # Startup timeline: list of (phase, duration in s)
+        self.startup_phases = []
+        self.startup_time = self.startup_last = monotonic()
 
-        self.device = dai.Device()
+        self.device_id = device_id
+        self.device = self.open_device()
+        self.mark_startup("open device")
 
         if input_src == None or input_src == "rgb" or input_src == "rgb_laconic":
             self.input_type = "rgb" # OAK* internal color camera
@@ -153,27 +218,25 @@ class HandTracker:
                 else:
                     print("Warning: depth unavailable on this device, 'xyz' argument is ignored")
 
+            profile = None
+            if use_profile and (internal_fps is None or internal_frame_height is None):
+                profile = load_profile(self.device.getMxId(), str(self.device.getUsbSpeed()).split('.')[-1], 
+                                    lm_model, self.xyz, resolution, self.crop)
+                if profile:
+                    print(f"Device profile loaded: {profile}")
             if internal_fps is None:
-                if lm_model == "full":
-                    if self.xyz:
-                        self.internal_fps = 22 
-                    else:
-                        self.internal_fps = 26 
-                elif lm_model == "lite":
-                    if self.xyz:
-                        self.internal_fps = 29 
-                    else:
-                        self.internal_fps = 36 
-                elif lm_model == "sparse":
-                    if self.xyz:
-                        self.internal_fps = 24 
-                    else:
-                        self.internal_fps = 29
+                if profile:
+                    self.internal_fps = profile['internal_fps']
+                elif fallback_internal_fps is not None:
+                    self.internal_fps = fallback_internal_fps
                 else:
-                    self.internal_fps = 39
+                    self.internal_fps = default_internal_fps(lm_model, self.xyz)
             else:
                 self.internal_fps = internal_fps 
             print(f"Internal camera FPS set to: {self.internal_fps}") 
+            if internal_frame_height is None:
+                internal_frame_height = profile['internal_frame_height'] if profile else fallback_frame_height
+            self.mark_startup("device profile")
 
 
             if self.crop:
@@ -191,20 +254,36 @@ class HandTracker:
                 self.crop_w = 0
         
             print(f"Internal camera image size: {self.img_w} x {self.img_h}")
+            # Size of the frames of the palm detection branch (cam.preview)
+            self.pd_frame_height = pd_frame_height
+            if pd_frame_height is None:
+                self.pd_frame_w, self.pd_frame_h = (self.frame_size, self.frame_size) if self.crop else (self.img_w, self.img_h)
+            else:
+                if pd_frame_height > self.img_h:
+                    print(f"Error: pd_frame_height ({pd_frame_height}) must not be greater than the frame height ({self.img_h}) !")
+                    sys.exit()
+                self.pd_frame_h = pd_frame_height
+                self.pd_frame_w = pd_frame_height if self.crop else 2 * int(round(pd_frame_height * self.img_w / self.img_h / 2))
+                print(f"Palm detection frame size: {self.pd_frame_w} x {self.pd_frame_h} - landmark crops from the {self.img_w} x {self.img_h} video")
 
         else:
             print("Invalid input source:", input_src)
             sys.exit()
         
-        # Define and start pipeline
-        usb_speed = self.device.getUsbSpeed()
-        self.device.startPipeline(self.create_pipeline())
-        print(f"\nPipeline started - USB speed: {str(usb_speed).split('.')[-1]}\n")
-
-        # Define data queues 
-        if not self.laconic:
-            self.q_video = self.device.getOutputQueue(name="cam_out", maxSize=1, blocking=False)
-        self.q_manager_out = self.device.getOutputQueue(name="manager_out", maxSize=1, blocking=False)
+        self.start_pipeline()
+        # Capture-to-host latency (in s) of the last frame (None in laconic mode)
+        self.latency = None
+
+        # Frames: pool of BGR buffers (allocated on first use) and shared read-only sentinel
+        assert frame_mode in ["array", "lazy"], f"Unknown frame mode {frame_mode}"
+        self.frame_mode = frame_mode
+        self.frame_pool = [None] * frame_pool_size
+        self.frame_pool_idx = 0
+        self.sentinel_frame = np.zeros((self.img_h, self.img_w, 3), dtype=np.uint8)
+        self.sentinel_frame.flags.writeable = False
+        # Last ImgFrame received and its conversion (None until get_frame() is called in lazy mode)
+        self.in_video = None
+        self.frame = None
         
 
 
@@ -215,8 +294,78 @@ class HandTracker:
         self.nb_failed_lm_inferences = 0
         self.nb_frames_lm_inference_after_landmarks_ROI = 0
         self.nb_frames_no_hand = 0
+        self.nb_frames_lm_skipped = 0
+        # Frames dropped before reaching the host (detected with gaps in sequence numbers)
+        self.nb_dropped_frames = 0
+        self.last_seq_num = None
+        self.nb_frames = 0
+        self.nb_xyz = 0
+        self.xyz_age_sum = 0
+        self.nb_latency = 0
+        self.latency_sum = 0
+        self.start_time = None
+
+        # Live metrics
+        self.metrics = metrics
+        if metrics:
+            self.m_frames = metrics.counter("frames_total", "Results received from the device")
+            self.m_pd_inferences = metrics.counter("pd_inferences_total", "Frames on which palm detection has run")
+            self.m_lm_inferences = metrics.counter("lm_inferences_total", "Landmark inferences")
+            self.m_failed_lm_inferences = metrics.counter("failed_lm_inferences_total", "Landmark inferences that did not confirm a hand")
+            self.m_frames_no_hand = metrics.counter("frames_no_hand_total", "Frames without hand")
+            self.m_lm_skipped = metrics.counter("lm_skipped_total", "Frames whose landmark inference was skipped (extrapolated hands)")
+            self.m_dropped_frames = metrics.counter("dropped_frames_total", "Video frames dropped before reaching the host")
+            self.m_latency = metrics.gauge("latency_seconds", "Capture to host latency of the last frame")
+
+        # Device resources telemetry
+        self.telemetry = None
+        if telemetry_interval is not None:
+            from device_telemetry import TelemetrySampler
+            self.telemetry = TelemetrySampler(self.device, interval=telemetry_interval, metrics=metrics)
         
 
+    def open_device(self):
+        if self.device_id is None:
+            return dai.Device()
+        found, device_info = dai.Device.getDeviceByMxId(self.device_id)
+        if not found:
+            print(f"Error: device {self.device_id} not found !")
+            sys.exit()
+        return dai.Device(dai.OpenVINO.Version.VERSION_2021_4, device_info)
+
+    def start_pipeline(self):
+        # Define and start pipeline
+        usb_speed = self.device.getUsbSpeed()
+        pipeline = self.create_pipeline()
+        self.mark_startup("create pipeline")
+        self.device.startPipeline(pipeline)
+        self.mark_startup("start pipeline")
+        print(f"\nPipeline started - USB speed: {str(usb_speed).split('.')[-1]}\n")
+
+        # Define data queues 
+        if not self.laconic:
+            self.q_video = self.device.getOutputQueue(name="cam_out", maxSize=1, blocking=False)
+        self.q_manager_out = self.device.getOutputQueue(name="manager_out", maxSize=1, blocking=False)
+
+    def restart_pipeline(self, lm_model=None, internal_fps=None):
+        """
+        Rebuild and restart the device pipeline with another landmark model 
+        and/or another camera FPS. Only the device side is rebuilt: 
+        the tracker object, its settings and its statistics are kept.
+        """
+        if lm_model is not None:
+            self.lm_model = LANDMARK_MODELS.get(lm_model, lm_model)
+        if internal_fps is not None:
+            self.internal_fps = internal_fps
+        print(f"Restarting pipeline - landmark model: {self.lm_model} - internal camera FPS: {self.internal_fps}")
+        if self.telemetry: self.telemetry.device = None
+        self.device.close()
+        self.device = self.open_device()
+        self.start_pipeline()
+        if self.telemetry: self.telemetry.device = self.device
+        self.last_seq_num = None
+        self.extrapolator.reset()
+
     def create_pipeline(self):
         print("\nCreating pipeline...")
         # Start defining a pipeline
@@ -238,10 +387,10 @@ class HandTracker:
 
         if self.crop:
             cam.setVideoSize(self.frame_size, self.frame_size)
-            cam.setPreviewSize(self.frame_size, self.frame_size)
         else: 
             cam.setVideoSize(self.img_w, self.img_h)
-            cam.setPreviewSize(self.img_w, self.img_h)
+        # The preview feeds the palm detection branch (and the landmark branch when pd_frame_height is None)
+        cam.setPreviewSize(self.pd_frame_w, self.pd_frame_h)
 
         if not self.laconic:
             cam_out = pipeline.createXLinkOut()
@@ -253,6 +402,11 @@ class HandTracker:
         # Define manager script node
         manager_script = pipeline.create(dai.node.Script)
         manager_script.setScript(self.build_manager_script())
+        if self.lm_decimation != "off":
+            # Paces the manager on the frames whose landmark inference is skipped
+            manager_script.inputs['frame_sync'].setQueueSize(1)
+            manager_script.inputs['frame_sync'].setBlocking(False)
+            cam.preview.link(manager_script.inputs['frame_sync'])
 
         if self.xyz:
             print("Creating MonoCameras, Stereo and SpatialLocationCalculator nodes...")
@@ -334,7 +488,11 @@ class HandTracker:
         pre_lm_manip.setWaitForConfigInput(True)
         pre_lm_manip.inputImage.setQueueSize(1)
         pre_lm_manip.inputImage.setBlocking(False)
-        cam.preview.link(pre_lm_manip.inputImage)
+        if self.pd_frame_height is None:
+            cam.preview.link(pre_lm_manip.inputImage)
+        else:
+            # Crops from the full resolution video (NV12, converted to BGR planar by the manip, see the manager script)
+            cam.video.link(pre_lm_manip.inputImage)
        
         manager_script.outputs['pre_lm_manip_cfg'].link(pre_lm_manip.inputConfig)
 
@@ -356,12 +514,7 @@ class HandTracker:
             - the video frame shape
         So we build this code from the content of the file template_manager_script_*.py which is a python template
         '''
-        # Read the template
-        with open(MANAGER_HAND_SOLO, 'r') as file:
-            template = Template(file.read())
-        
-        # Perform the substitution
-        code = template.substitute(
+        params = dict(
                     _TRACE1 = "node.warn" if self.trace & 1 else "#",
                     _TRACE2 = "node.warn" if self.trace & 2 else "#",
                     _pd_score_thresh = self.pd_score_thresh,
@@ -372,19 +525,57 @@ class HandTracker:
                     _frame_size = self.frame_size,
                     _crop_w = self.crop_w,
                     _IF_XYZ = "" if self.xyz else '"""',
+                    _IF_XYZ_SYNC = "" if self.xyz and not self.xyz_async else '"""',
+                    _IF_XYZ_ASYNC = "" if self.xyz and self.xyz_async else '"""',
                     _IF_USE_HANDEDNESS_AVERAGE = "" if self.use_handedness_average else '"""',
                     _single_hand_tolerance_thresh= self.single_hand_tolerance_thresh,
                     _IF_USE_SAME_IMAGE = "" if self.use_same_image else '"""',
                     _IF_USE_WORLD_LANDMARKS = "" if self.use_world_landmarks else '"""',
+                    _IF_LM_FROM_VIDEO = "" if self.pd_frame_height is not None else '"""',
+                    _IF_LM_DECIMATION = "" if self.lm_decimation != "off" else '"""',
+                    _lm_skip_motion = self.lm_skip_motion,
+                    _lm_max_skips = self.lm_max_skips,
         )
+        # The rendered code is cached on disk. The key includes the template modification time 
+        # and size, so the template is not even read on a cache hit
+        template_stat = os.stat(MANAGER_HAND_SOLO)
+        key = hashlib.sha1(repr((template_stat.st_mtime_ns, template_stat.st_size, sorted(params.items()))).encode()).hexdigest()
+        cache_file = MANAGER_SCRIPT_CACHE / f"{key}.py"
+        try:
+            return cache_file.read_text()
+        except OSError:
+            pass
+
+        # Read the template
+        with open(MANAGER_HAND_SOLO, 'r') as file:
+            template = Template(file.read())
+        
+        # Perform the substitution
+        code = template.substitute(**params)
         # Remove comments and empty lines
         import re
         code = re.sub(r'"{3}.*?"{3}', '', code, flags=re.DOTALL)
         code = re.sub(r'#.*', '', code)
         code = re.sub('\n\s*\n', '\n', code)
 
+        try:
+            MANAGER_SCRIPT_CACHE.mkdir(exist_ok=True)
+            # Write then rename, so that a concurrent start never reads a partial file
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            tmp_file.write_text(code)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: manager script not cached ({e})")
         return code
 
+    def mark_startup(self, phase, last=False):
+        # Record the duration of a startup phase. The timeline ends with the first result
+        # (pipeline restarts are not recorded)
+        if self.startup_last is None: return
+        now = monotonic()
+        self.startup_phases.append((phase, now - self.startup_last))
+        self.startup_last = None if last else now
+
     def extract_hand_data(self, res, hand_idx):
         hand = mp.HandRegion()
         hand.rect_x_center_a = res["rect_center_x"][hand_idx] * self.frame_size
@@ -400,6 +591,7 @@ class HandTracker:
         if self.xyz:
             hand.xyz = np.array(res["xyz"][hand_idx])
             hand.xyz_zone = res["xyz_zone"][hand_idx]
+            hand.xyz_age = res["xyz_age"][hand_idx]
         # If we added padding to make the image square, we need to remove this padding from landmark coordinates and from rect_points
         if self.pad_h > 0:
             hand.landmarks[:,1] -= self.pad_h
@@ -420,35 +612,138 @@ class HandTracker:
 
     def next_frame(self):
 
-        if self.laconic:
-            video_frame = np.zeros((self.img_h, self.img_w, 3), dtype=np.uint8)
-        else:
-            in_video = self.q_video.get()
-            video_frame = in_video.getCvFrame()       
+        self.frame = None
+        if not self.laconic:
+            in_video = self.in_video = self.q_video.get()
+            if self.startup_last is not None: self.mark_startup("first frame")
+            seq_num = in_video.getSequenceNum()
+            if self.last_seq_num is not None and seq_num > self.last_seq_num:
+                nb_dropped = seq_num - self.last_seq_num - 1
+                self.nb_dropped_frames += nb_dropped
+                if self.metrics: self.m_dropped_frames.inc(nb_dropped)
+            self.last_seq_num = seq_num
+            # Latency between frame capture and its availability on the host
+            self.latency = (dai.Clock.now() - in_video.getTimestamp()).total_seconds()
+            if self.stats:
+                self.latency_sum += self.latency
+                self.nb_latency += 1
         
+        video_frame = self.get_frame() if self.frame_mode == "array" else self.sentinel_frame
+
         # Get result from device
         res = marshal.loads(self.q_manager_out.get().getData())
-        hands = []
-        for i in range(len(res.get("lm_score",[]))):
-            hand = self.extract_hand_data(res, i)
-            hands.append(hand)
+        if self.startup_last is not None: self.mark_startup("first result", last=True)
+        lm_skipped = res.get("lm_skipped", False)
+        if lm_skipped:
+            hands = self.extrapolator.extrapolate()
+        else:
+            hands = []
+            for i in range(len(res.get("lm_score",[]))):
+                hand = self.extract_hand_data(res, i)
+                hand.synthetic = False
+                hands.append(hand)
+            if self.lm_decimation != "off":
+                self.extrapolator.update(hands)
 
         # Statistics
         if self.stats:
+            if self.start_time is None:
+                self.start_time = monotonic()
+            self.nb_frames += 1
+            if self.xyz:
+                for hand in hands:
+                    if hand.xyz_age >= 0:
+                        self.nb_xyz += 1
+                        self.xyz_age_sum += hand.xyz_age
             if res["pd_inf"]:
                 self.nb_frames_pd_inference += 1
             else:
                 if res["nb_lm_inf"] > 0:
                      self.nb_frames_lm_inference_after_landmarks_ROI += 1
-            if res["nb_lm_inf"] == 0:
+            if lm_skipped:
+                self.nb_frames_lm_skipped += 1
+            elif res["nb_lm_inf"] == 0:
                 self.nb_frames_no_hand += 1
             else:
                 self.nb_frames_lm_inference += 1
                 self.nb_lm_inferences += res["nb_lm_inf"]
                 self.nb_failed_lm_inferences += res["nb_lm_inf"] - len(hands)
 
+        if self.metrics:
+            self.m_frames.inc()
+            if res["pd_inf"]:
+                self.m_pd_inferences.inc()
+            if lm_skipped:
+                self.m_lm_skipped.inc()
+            elif res["nb_lm_inf"] == 0:
+                self.m_frames_no_hand.inc()
+            else:
+                self.m_lm_inferences.inc(res["nb_lm_inf"])
+                self.m_failed_lm_inferences.inc(res["nb_lm_inf"] - len(hands))
+            if self.latency is not None:
+                self.m_latency.set(self.latency)
+
         return video_frame, hands, None
 
 
     def exit(self):
-        self.device.close()
\ No newline at end of file
+        if self.telemetry: self.telemetry.close()
+        self.device.close()
+        if self.stats:
+            self.print_stats()
+        elif self.telemetry:
+            self.telemetry.print_report()
+
+    def next_pool_buffer(self):
+        self.frame_pool_idx = (self.frame_pool_idx + 1) % len(self.frame_pool)
+        buffer = self.frame_pool[self.frame_pool_idx]
+        if buffer is None:
+            buffer = self.frame_pool[self.frame_pool_idx] = np.empty((self.img_h, self.img_w, 3), dtype=np.uint8)
+        return buffer
+
+    def get_frame(self):
+        """
+        Returns the BGR frame of the last next_frame() call, converted (once) into a pool buffer
+        """
+        if self.frame is None:
+            self.frame = self.next_pool_buffer()
+            if self.laconic:
+                self.frame.fill(0)
+            else:
+                import cv2
+                data = self.in_video.getData()
+                if data.size == self.img_w * self.img_h * 3 // 2:
+                    # cam.video frames are NV12: convert in place instead of getCvFrame() which allocates
+                    cv2.cvtColor(data.reshape(self.img_h * 3 // 2, self.img_w), cv2.COLOR_YUV2BGR_NV12, dst=self.frame)
+                else:
+                    # Line stride or plane padding: getCvFrame() knows the layout
+                    self.frame[:] = self.in_video.getCvFrame()
+        return self.frame
+
+    def print_startup(self):
+        print(f"Startup timeline (total: {sum(d for _, d in self.startup_phases):.3f} s)")
+        for phase, duration in self.startup_phases:
+            print(f"    {phase:16s} {duration:7.3f} s")
+
+    def print_stats(self):
+        self.print_startup()
+        # The first frame is only used to start the clock
+        if self.start_time is not None and self.nb_frames > 1:
+            print(f"FPS : {(self.nb_frames - 1) / (monotonic() - self.start_time):.1f} f/s (# frames = {self.nb_frames})")
+        if self.nb_latency:
+            print(f"Average frame latency : {self.latency_sum / self.nb_latency * 1000:.1f} ms")
+        print(f"# frames with palm detection : {self.nb_frames_pd_inference}")
+        print(f"# frames with landmark inference : {self.nb_frames_lm_inference} - # after landmarks ROI prediction : {self.nb_frames_lm_inference_after_landmarks_ROI}")
+        print(f"# frames without hand : {self.nb_frames_no_hand}")
+        if self.lm_decimation != "off":
+            print(f"# frames with skipped landmark inference ({self.lm_decimation}) : {self.nb_frames_lm_skipped}")
+        if self.nb_lm_inferences:
+            print(f"# landmark inferences : {self.nb_lm_inferences} - # failed : {self.nb_failed_lm_inferences}")
+        if self.xyz:
+            mode = "asynchronous" if self.xyz_async else "synchronous"
+            if self.nb_xyz:
+                print(f"xyz ({mode}) : average age of the depth measure = {self.xyz_age_sum / self.nb_xyz:.2f} frames")
+            else:
+                print(f"xyz ({mode}) : no depth measure received")
+        if self.telemetry:
+            self.telemetry.print_report()
\ No newline at end of file
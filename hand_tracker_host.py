@@ -0,0 +1,185 @@
+import numpy as np
+import cv2
+import mediapipe as mp
+from pathlib import Path
+from math import sin, cos
+import sys
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PALM_DETECTION_ONNX = str(SCRIPT_DIR / "models/palm_detection.onnx")
+HOST_PALM_MODELS = {
+    "float": PALM_DETECTION_ONNX,
+}
+HOST_LANDMARK_MODELS = {
+    "full": str(SCRIPT_DIR / "models/hand_landmark_full.onnx"),
+    "lite": str(SCRIPT_DIR / "models/hand_landmark_lite.onnx"),
+    "sparse": str(SCRIPT_DIR / "models/hand_landmark_sparse.onnx"),
+}
+# Quantized variants generated by custom_models/quantize_host_models.py
+# (eg 'int8' for the palm detection, 'lite_int8' or 'full_fp16' for the landmarks)
+QUANTIZED_VARIANTS = ["int8", "fp16"]
+HOST_PALM_MODELS.update({v: PALM_DETECTION_ONNX.replace(".onnx", f"_{v}.onnx") for v in QUANTIZED_VARIANTS})
+HOST_LANDMARK_MODELS.update({f"{name}_{v}": path.replace(".onnx", f"_{v}.onnx")
+                            for name, path in list(HOST_LANDMARK_MODELS.items()) for v in QUANTIZED_VARIANTS})
+
+# Names of the model outputs (same as the layers read in the manager script in edge mode)
+PD_OUTPUTS = ["classificators", "regressors"]
+LM_OUTPUTS = ["Identity_dense/BiasAdd/Add", "Identity_1", "Identity_2", "Identity_3_dense/BiasAdd/Add"]
+
+
+class HostHandTracker:
+    """
+    Mediapipe Hand Tracker running on the host with onnxruntime (no OAK device needed).
+    Used to process recorded videos. The models are ONNX exports of the same models as the blobs
+    (input: BGR planar image NCHW with values in [0,255], same output names).
+    Unlike HandTracker (edge mode), there is no tracking between frames: the palm detection
+    runs on every frame, so the result of a frame does not depend on the previous frames.
+    Arguments:
+    - pd_model: 'float', 'int8', 'fp16' (see HOST_PALM_MODELS) or a path of an ONNX file,
+    - pd_score_thresh, pd_nms_thresh, lm_score_thresh: same as HandTracker,
+    - lm_model: 'full', 'lite', 'sparse', a quantized variant like 'lite_int8' (see HOST_LANDMARK_MODELS)
+                or a path of an ONNX file,
+    - max_hands: max number of hands per frame,
+    - use_gesture: boolean, when True, recognize hand poses,
+    - use_world_landmarks: boolean, when True, hand.world_landmarks is set,
+    - nb_threads: number of threads of each onnxruntime session.
+    """
+    def __init__(self,
+                pd_model="float",
+                pd_score_thresh=0.5, pd_nms_thresh=0.3,
+                lm_model="lite",
+                lm_score_thresh=0.5,
+                max_hands=2,
+                use_gesture=True,
+                use_world_landmarks=False,
+                nb_threads=1):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = nb_threads
+        options.inter_op_num_threads = 1
+        self.pd_model = HOST_PALM_MODELS.get(pd_model, pd_model)
+        self.lm_model = HOST_LANDMARK_MODELS.get(lm_model, lm_model)
+        for model in [self.pd_model, self.lm_model]:
+            if not Path(model).exists():
+                print(f"Model {model} not found")
+                if model in HOST_PALM_MODELS.values() or model in HOST_LANDMARK_MODELS.values():
+                    print("The quantized variants are generated by custom_models/quantize_host_models.py")
+                sys.exit(1)
+        self.pd_sess = ort.InferenceSession(self.pd_model, options, providers=["CPUExecutionProvider"])
+        self.lm_sess = ort.InferenceSession(self.lm_model, options, providers=["CPUExecutionProvider"])
+        self.pd_input_name = self.pd_sess.get_inputs()[0].name
+        self.lm_input_name = self.lm_sess.get_inputs()[0].name
+        # Models exported with a fixed batch size of 1 are run image by image
+        self.pd_batch = not isinstance(self.pd_sess.get_inputs()[0].shape[0], int)
+        self.lm_batch = not isinstance(self.lm_sess.get_inputs()[0].shape[0], int)
+        self.pd_input_length = 128
+        self.lm_input_length = 224
+        self.anchors = mp.generate_handtracker_anchors()
+        self.pd_score_thresh = pd_score_thresh
+        self.pd_nms_thresh = pd_nms_thresh
+        self.lm_score_thresh = lm_score_thresh
+        self.max_hands = max_hands
+        self.use_gesture = use_gesture
+        self.use_world_landmarks = use_world_landmarks
+
+    def run(self, sess, input_name, output_names, batch, inputs):
+        # Run a model on a batch of inputs of shape (B,3,H,W)
+        if batch:
+            return sess.run(output_names, {input_name: inputs})
+        results = [sess.run(output_names, {input_name: inputs[i:i+1]}) for i in range(len(inputs))]
+        return [np.concatenate(r) for r in zip(*results)]
+
+    def palm_inputs(self, frames, frame_size, pad_w, pad_h):
+        # Palm detection inputs (B,3,128,128): the padded squared images, resized
+        pd_inputs = np.empty((len(frames), 3, self.pd_input_length, self.pd_input_length), dtype=np.float32)
+        for i, frame in enumerate(frames):
+            img_h, img_w = frame.shape[:2]
+            square = cv2.copyMakeBorder(frame, pad_h, frame_size - img_h - pad_h, pad_w, frame_size - img_w - pad_w, cv2.BORDER_CONSTANT)
+            pd_inputs[i] = cv2.resize(square, (self.pd_input_length, self.pd_input_length), interpolation=cv2.INTER_AREA).transpose(2,0,1)
+        return pd_inputs
+
+    def detect_palms(self, frames):
+        """
+        frames: list of BGR images of the same size
+        Returns (pd_inputs, regions, lm_inputs, (frame_size, pad_w, pad_h)), where 'regions' is
+        the list of (frame index, detection) of the palms kept by NMS, and 'lm_inputs' the list
+        of the corresponding landmark model inputs (3,224,224)
+        """
+        img_h, img_w = frames[0].shape[:2]
+        frame_size = max(img_h, img_w)
+        pad_h = (frame_size - img_h) // 2
+        pad_w = (frame_size - img_w) // 2
+        pd_inputs = self.palm_inputs(frames, frame_size, pad_w, pad_h)
+        scores, bboxes = self.run(self.pd_sess, self.pd_input_name, PD_OUTPUTS, self.pd_batch, pd_inputs)
+
+        regions = []
+        lm_inputs = []
+        for i, frame in enumerate(frames):
+            detections = mp.decode_bboxes(self.pd_score_thresh, scores[i], bboxes[i], self.anchors, self.pd_input_length)
+            detections = mp.non_max_suppression(detections, self.pd_nms_thresh)[:self.max_hands]
+            for r in detections:
+                mp.detection_to_rect(r)
+                lm_inputs.append(self.crop_hand(frame, r, frame_size, pad_w, pad_h).transpose(2,0,1))
+                regions.append((i, r))
+        return pd_inputs, regions, lm_inputs, (frame_size, pad_w, pad_h)
+
+    def process_batch(self, frames):
+        """
+        frames: list of BGR images of the same size
+        Returns a list (one element per frame) of lists of HandRegion,
+        with the same attributes as the hands of HandTracker.next_frame()
+        """
+        if len(frames) == 0: return []
+        # Palm detection on the padded squared images, then landmark regression
+        # on the crops of all the detected palms of the batch
+        _, regions, lm_inputs, (frame_size, pad_w, pad_h) = self.detect_palms(frames)
+        hands = [[] for _ in frames]
+        if not regions: return hands
+        lm_outputs = self.run(self.lm_sess, self.lm_input_name, LM_OUTPUTS if self.use_world_landmarks else LM_OUTPUTS[:3],
+                            self.lm_batch, np.array(lm_inputs, dtype=np.float32))
+        landmarks, lm_scores, handedness = [o.reshape(len(regions), -1) for o in lm_outputs[:3]]
+
+        kept = np.nonzero(lm_scores[:,0] > self.lm_score_thresh)[0]
+        rrn_lms = landmarks[kept].reshape(-1, 21, 3) / self.lm_input_length
+        if self.use_gesture:
+            finger_states, gesture_codes = mp.recognize_gestures(rrn_lms)
+        for k, idx in enumerate(kept):
+            frame_idx, r = regions[idx]
+            hand = self.build_hand(r, rrn_lms[k], lm_scores[idx,0], handedness[idx,0], frame_size, pad_w, pad_h)
+            if self.use_world_landmarks:
+                hand.world_landmarks = lm_outputs[3][idx].reshape(-1, 3)
+            if self.use_gesture:
+                hand.thumb_state, hand.index_state, hand.middle_state, hand.ring_state, hand.little_state = finger_states[k].tolist()
+                hand.gesture = mp.GESTURES[gesture_codes[k]] if gesture_codes[k] >= 0 else None
+            hands[frame_idx].append(hand)
+        return hands
+
+    def rect_matrix(self, r, frame_size, pad_w, pad_h):
+        # Affine transformation from the landmark model input (crop) to the image coordinates
+        a = r.rect_size * frame_size / self.lm_input_length
+        cos_rot = cos(r.rotation)
+        sin_rot = sin(r.rotation)
+        half = self.lm_input_length / 2
+        return np.array([
+            [a*cos_rot, -a*sin_rot, r.rect_x_center*frame_size - pad_w - half*a*(cos_rot - sin_rot)],
+            [a*sin_rot, a*cos_rot, r.rect_y_center*frame_size - pad_h - half*a*(sin_rot + cos_rot)]])
+
+    def crop_hand(self, frame, r, frame_size, pad_w, pad_h):
+        return cv2.warpAffine(frame, self.rect_matrix(r, frame_size, pad_w, pad_h), (self.lm_input_length, self.lm_input_length),
+                            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT)
+
+    def build_hand(self, r, rrn_lms, lm_score, handedness, frame_size, pad_w, pad_h):
+        hand = mp.HandRegion(r.pd_score, r.pd_box, r.pd_kps)
+        hand.rect_x_center_a = r.rect_x_center * frame_size
+        hand.rect_y_center_a = r.rect_y_center * frame_size
+        hand.rect_w_a = hand.rect_h_a = r.rect_size * frame_size
+        hand.rotation = r.rotation
+        hand.rect_points = mp.rotated_rect_to_points(hand.rect_x_center_a - pad_w, hand.rect_y_center_a - pad_h, hand.rect_w_a, hand.rect_h_a, hand.rotation)
+        hand.lm_score = float(lm_score)
+        hand.handedness = float(handedness)
+        hand.label = "right" if hand.handedness > 0.5 else "left"
+        hand.norm_landmarks = rrn_lms
+        m = self.rect_matrix(r, frame_size, pad_w, pad_h)
+        xy = rrn_lms[:,:2] * self.lm_input_length
+        hand.landmarks = (xy @ m[:,:2].T + m[:,2]).astype(np.int32)
+        return hand
@@ -1,5 +1,8 @@
 import cv2
 import numpy as np
+import threading
+import queue
+from collections import deque
 
 LINES_HAND = [[0,1],[1,2],[2,3],[3,4], 
             [0,5],[5,6],[6,7],[7,8],
@@ -7,10 +10,34 @@ LINES_HAND = [[0,1],[1,2],[2,3],[3,4],
             [9,13],[13,14],[14,15],[15,16],
             [13,17],[17,18],[18,19],[19,20],[0,17]]
 
+# Precomputed index arrays: the endpoints of all the bones are gathered with one fancy indexing
+BONES = np.array(LINES_HAND, dtype=np.int32)
+# Landmark index ranges of the per-finger color groups (wrist, thumb, index, middle, ring, little)
+FINGER_GROUPS = [(0,1), (1,5), (5,9), (9,13), (13,17), (17,21)]
+# Color depending on finger state (1=open, 0=close, -1=unknown)
+STATE_COLORS = { 1: (0,255,0), 0: (0,0,255), -1:(0,255,255)}
+
 class HandTrackerRenderer:
+    """
+    - tracker: the tracker object whose frames are rendered,
+    - output: path of the video file where the rendered frames are recorded (MJPG), or None,
+    - threaded: boolean. When True, the display (cv2.imshow/cv2.waitKey) runs in a worker thread 
+                    fed by a latest-wins slot, so that a slow display never throttles the tracking loop.
+                    The keys pressed in the window are relayed back by waitKey().
+                    HighGUI does not support windows outside the main thread on macOS, and the Qt
+                    backend warns and misbehaves, so the default is False: display in waitKey(),
+                    on the calling thread.
+    - output_queue_size: the video is encoded in a writer thread fed by a bounded queue of this size 
+                    (frames are dropped and counted when the queue is full), so that a slow disk never 
+                    throttles the tracking loop. 0 to write the frames in waitKey(), on the calling thread.
+    The frames handed to the display and writer threads are copies, since the tracker reuses 
+    its frame buffers (see HandTracker frame_mode).
+    """
     def __init__(self, 
                 tracker,
-                output=None):
+                output=None,
+                threaded=False,
+                output_queue_size=30):
 
         self.tracker = tracker
 
@@ -24,38 +51,43 @@ class HandTrackerRenderer:
             self.output = None
         else:
             fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-            self.output = cv2.VideoWriter(output,fourcc,self.tracker.video_fps,(self.tracker.img_w, self.tracker.img_h)) 
+            self.output = cv2.VideoWriter(output,fourcc,self.tracker.internal_fps,(self.tracker.img_w, self.tracker.img_h)) 
+
+        self.threaded = threaded
+        self.display_thread = None
+        self.display_frame = None
+        self.display_cond = threading.Condition()
+        self.keys = deque()
+        self.nb_display_skipped = 0
+        self.nb_output_dropped = 0
+        self.output_queue = None
+        if self.output and output_queue_size > 0:
+            self.output_queue = queue.Queue(maxsize=output_queue_size)
+            self.output_thread = threading.Thread(target=self.output_worker, daemon=True)
+            self.output_thread.start()
+
+        # Reused buffer of the bone endpoints
+        self.bones = np.empty((len(BONES), 2, 2), dtype=np.int32)
 
     def draw_hand(self, hand):
             dynamic_size = hand.rect_w_a / 400 # adapt size of landmarks to size of hand
             if hand.lm_score > self.tracker.lm_score_thresh:
                 if self.show_landmarks:
-                    lines = [np.array([hand.landmarks[point] for point in line]).astype(np.int32) for line in LINES_HAND]
-                    color = (255, 0, 0)
-                    cv2.polylines(self.frame, lines, False, color, int(1+dynamic_size*3), cv2.LINE_AA)
+                    np.take(hand.landmarks, BONES, axis=0, out=self.bones)
+                    cv2.polylines(self.frame, self.bones, False, (255,0,0), int(1+dynamic_size*3), cv2.LINE_AA)
                     radius = int(1+dynamic_size*5)
+                    # Points as Python ints (cv2 parses them faster than numpy scalars)
+                    points = hand.landmarks.tolist()
                     if self.tracker.use_gesture:
-                        # color depending on finger state (1=open, 0=close, -1=unknown)
-                        color = { 1: (0,255,0), 0: (0,0,255), -1:(0,255,255)}
-                        cv2.circle(self.frame, (hand.landmarks[0][0], hand.landmarks[0][1]), radius, color[-1], -1)
-                        # draw thumb landmarks
-                        for i in range(1,5):
-                            cv2.circle(self.frame, (hand.landmarks[i][0], hand.landmarks[i][1]), radius, color[hand.thumb_state], -1)
-                        # draw index finger landmarks
-                        for i in range(5,9):
-                            cv2.circle(self.frame, (hand.landmarks[i][0], hand.landmarks[i][1]), radius, color[hand.index_state], -1)
-                        # draw middle finger landmarks
-                        for i in range(9,13):
-                            cv2.circle(self.frame, (hand.landmarks[i][0], hand.landmarks[i][1]), radius, color[hand.middle_state], -1)
-                        # draw ring finger landmarks
-                        for i in range(13,17):
-                            cv2.circle(self.frame, (hand.landmarks[i][0], hand.landmarks[i][1]), radius, color[hand.ring_state], -1)
-                        # draw little finger landmarks
-                        for i in range(17,21):
-                            cv2.circle(self.frame, (hand.landmarks[i][0], hand.landmarks[i][1]), radius, color[hand.little_state], -1)
+                        # Wrist is always drawn with the 'unknown' color
+                        states = (-1, hand.thumb_state, hand.index_state, hand.middle_state, hand.ring_state, hand.little_state)
+                        for (start, end), state in zip(FINGER_GROUPS, states):
+                            color = STATE_COLORS[state]
+                            for point in points[start:end]:
+                                cv2.circle(self.frame, point, radius, color, -1)
                     else:
-                        for x,y in hand.landmarks[:,:2]:
-                            cv2.circle(self.frame, (int(x), int(y)), radius, color, -1)
+                        for point in points:
+                            cv2.circle(self.frame, point, radius, (255,0,0), -1)
         
     def draw(self, frame, hands):
         self.frame = frame
@@ -63,18 +95,80 @@ class HandTrackerRenderer:
             self.draw_hand(hand)
         return self.frame
 
+    def handle_key(self, key):
+        if key == 32: # Pause on space bar
+            key = cv2.waitKey(0)
+        elif key == ord('l') and self.tracker.use_lm:
+            self.show_landmarks = not self.show_landmarks
+        return key
+
+    def display_worker(self):
+        # cv2 windows must be created, refreshed and destroyed by the same thread
+        while True:
+            with self.display_cond:
+                while self.display_frame is None and self.display_running:
+                    self.display_cond.wait()
+                if not self.display_running: break
+                frame = self.display_frame
+                self.display_frame = None
+            cv2.imshow("Hand tracking", frame)
+            key = self.handle_key(cv2.waitKey(1))
+            if key != -1:
+                self.keys.append(key)
+        cv2.destroyAllWindows()
+
+    def output_worker(self):
+        while True:
+            frame = self.output_queue.get()
+            if frame is None: break
+            self.output.write(frame)
+
     def exit(self):
+        if self.display_thread:
+            with self.display_cond:
+                self.display_running = False
+                self.display_cond.notify()
+            self.display_thread.join()
+        if self.nb_display_skipped:
+            print(f"Display: {self.nb_display_skipped} frames skipped (display too slow)")
         if self.output:
+            if self.output_queue:
+                self.output_queue.put(None)
+                self.output_thread.join()
+                if self.nb_output_dropped:
+                    print(f"Video output: {self.nb_output_dropped} frames dropped (writer too slow)")
             self.output.release()
         cv2.destroyAllWindows()
 
     def waitKey(self, delay=1):
-        cv2.imshow("Hand tracking", self.frame)
-        if self.output:
+        """
+        Show (and record) the last drawn frame. Returns the key pressed or -1.
+        In threaded mode, 'delay' is ignored and the call does not block: 
+        the key is the oldest key pressed since the previous call.
+        """
+        self.record()
+        if not self.threaded:
+            cv2.imshow("Hand tracking", self.frame)
+            return self.handle_key(cv2.waitKey(delay))
+
+        if self.display_thread is None:
+            # Started lazily, so that a renderer used only for drawing never opens a window
+            self.display_running = True
+            self.display_thread = threading.Thread(target=self.display_worker, daemon=True)
+            self.display_thread.start()
+        with self.display_cond:
+            if self.display_frame is not None:
+                self.nb_display_skipped += 1
+            self.display_frame = self.frame.copy()
+            self.display_cond.notify()
+        return self.keys.popleft() if self.keys else -1
+
+    def record(self):
+        if not self.output: return
+        if self.output_queue is None:
             self.output.write(self.frame)
-        key = cv2.waitKey(delay) 
-        if key == 32: # Pause on space bar
-            key = cv2.waitKey(0)
-        elif key == ord('l') and self.tracker.use_lm:
-            self.show_landmarks = not self.show_landmarks
-        return key
+        # Single producer: the queue cannot become full between the test and the put
+        elif self.output_queue.full():
+            self.nb_output_dropped += 1
+        else:
+            self.output_queue.put_nowait(self.frame.copy())
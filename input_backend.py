@@ -0,0 +1,113 @@
+"""
+Input injection backends used by the HandController callbacks
+
+All the backends have the same interface:
+    - move(x, y): move the pointer to (x, y) in desktop pixels,
+    - click(button="left"): press and release a button ("left", "right" or "middle"),
+    - scroll(dx, dy): scroll by (dx, dy) steps,
+    - flush(): called by HandController once per frame, after the callbacks,
+    - close().
+Backends:
+    - NullBackend: does nothing (benchmarks, headless tests),
+    - RecordingBackend: keeps a timestamped log of the actions, for replay assertions,
+    - PynputBackend: injects the actions in the desktop session with pynput. Pointer moves are
+      batched: only the last position of a frame is written, at flush(), and only if it differs
+      from the last position written.
+"""
+import json
+from time import monotonic
+
+class NullBackend:
+    def move(self, x, y):
+        pass
+
+    def click(self, button="left"):
+        pass
+
+    def scroll(self, dx, dy):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class RecordingBackend:
+    """
+    - output: path of a JSON lines file where the actions are written at close(), or None,
+    - clock: function giving the timestamp of the actions.
+    The actions are stored in self.actions as (timestamp, action, args) tuples.
+    """
+    def __init__(self, output=None, clock=monotonic):
+        self.output = output
+        self.clock = clock
+        self.actions = []
+
+    def move(self, x, y):
+        # Python ints: the callbacks may give numpy scalars, which json cannot serialize
+        self.actions.append((self.clock(), "move", (int(x), int(y))))
+
+    def click(self, button="left"):
+        self.actions.append((self.clock(), "click", (button,)))
+
+    def scroll(self, dx, dy):
+        self.actions.append((self.clock(), "scroll", (int(dx), int(dy))))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.output:
+            with open(self.output, "w") as file:
+                for timestamp, action, args in self.actions:
+                    file.write(json.dumps({"time": timestamp, "action": action, "args": args}) + "\n")
+            print(f"{len(self.actions)} input actions saved in {self.output}")
+
+def load_actions(path):
+    """
+    Read a file written by RecordingBackend. Returns a list of (timestamp, action, args)
+    """
+    with open(path) as file:
+        return [(a["time"], a["action"], tuple(a["args"])) for a in map(json.loads, file)]
+
+class PynputBackend:
+    def __init__(self):
+        from pynput.mouse import Button, Controller
+        self.mouse = Controller()
+        self.buttons = {"left": Button.left, "right": Button.right, "middle": Button.middle}
+        self.pending = None
+        self.last_written = None
+        self.nb_writes = 0
+        self.nb_skipped = 0
+
+    def move(self, x, y):
+        self.pending = (x, y)
+
+    def write_pending(self):
+        if self.pending is None: return
+        if self.pending == self.last_written:
+            self.nb_skipped += 1
+        else:
+            self.mouse.position = self.pending
+            self.last_written = self.pending
+            self.nb_writes += 1
+        self.pending = None
+
+    def click(self, button="left"):
+        # The pointer must be at its new position before clicking
+        self.write_pending()
+        self.mouse.press(self.buttons[button])
+        self.mouse.release(self.buttons[button])
+
+    def scroll(self, dx, dy):
+        self.write_pending()
+        self.mouse.scroll(dx, dy)
+
+    def flush(self):
+        self.write_pending()
+
+    def close(self):
+        print(f"Pointer positions written: {self.nb_writes} - skipped (unchanged): {self.nb_skipped}")
+
+BACKENDS = {"null": NullBackend, "record": RecordingBackend, "pynput": PynputBackend}
@@ -0,0 +1,229 @@
+"""
+Columnar session log of the tracked hands
+
+A log is a directory containing:
+    - header.json: the dtype and the shape of the columns,
+    - one raw binary file per column (<name>.bin), rows appended one after the other.
+One row is written per hand and per frame. The columns have fixed dtypes so that
+the reader can map them in memory (np.memmap) and slice time ranges without loading
+the files. Analytics functions work on whole columns with numpy.
+
+LandmarkLogWriter copies the hand data into preallocated blocks (a few microseconds
+per hand) and the full blocks are written to disk by a background thread,
+so the tracking loop never waits for the disk.
+"""
+import json
+import os
+import threading
+import queue
+import numpy as np
+import mediapipe as mp
+
+FORMAT_VERSION = 1
+
+COLUMNS = {
+    "frame": (np.int32, ()),
+    "timestamp": (np.float64, ()),          # s
+    "gesture": (np.int8, ()),               # index in mediapipe.GESTURES, -1 if no gesture
+    "lm_score": (np.float32, ()),
+    "handedness": (np.float32, ()),
+    "landmarks": (np.float32, (21, 3)),     # x, y in pixels, z normalized (from hand.norm_landmarks)
+}
+
+GESTURE_CODES = {g: i for i, g in enumerate(mp.GESTURES)}
+
+def write_header(directory):
+    os.makedirs(directory, exist_ok=True)
+    header = {"version": FORMAT_VERSION,
+            "columns": {name: {"dtype": np.dtype(dtype).str, "shape": list(shape)} for name, (dtype, shape) in COLUMNS.items()}}
+    with open(os.path.join(directory, "header.json"), "w") as file:
+        json.dump(header, file, indent=4)
+
+def new_log_directory(directory):
+    """
+    Returns 'directory' if it does not contain a log, otherwise the first free 'directory.N' (N = 1, 2, ...).
+    A log holds a single session: the timestamps (monotonic clock) and the frame numbers restart
+    with each session, so appending to an existing log would break the time ordering
+    """
+    path = directory
+    n = 0
+    while os.path.exists(os.path.join(path, "header.json")):
+        n += 1
+        path = f"{directory}.{n}"
+    return path
+
+def write_log(directory, columns):
+    """
+    Write whole columns (dict {name: array}) in a new log
+    """
+    write_header(directory)
+    for name, (dtype, _) in COLUMNS.items():
+        np.ascontiguousarray(columns[name], dtype=dtype).tofile(os.path.join(directory, f"{name}.bin"))
+
+
+class LandmarkLogWriter:
+    """
+    Streaming writer of a session log.
+    - directory: directory of the log (created if needed). If it already contains a log,
+                the session is written in the first free 'directory.N' (see new_log_directory()),
+    - block_size: number of rows per block written to disk.
+    """
+    def __init__(self, directory, block_size=4096):
+        self.directory = new_log_directory(directory)
+        if self.directory != directory:
+            print(f"Session log: {directory} already contains a log, writing in {self.directory}")
+        directory = self.directory
+        self.block_size = block_size
+        write_header(directory)
+        self.files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in COLUMNS}
+        # 2 blocks are enough: one is filled while the other one is written
+        self.free_blocks = queue.Queue()
+        for _ in range(2):
+            self.free_blocks.put(self.new_block())
+        self.full_blocks = queue.Queue()
+        self.block = self.free_blocks.get()
+        self.nb_rows = 0
+        self.nb_rows_total = 0
+        # Exception raised in the writer thread, re-raised by append() and close()
+        self.error = None
+        self.thread = threading.Thread(target=self.write_blocks, daemon=True)
+        self.thread.start()
+
+    def new_block(self):
+        return {name: np.zeros((self.block_size,) + shape, dtype=dtype) for name, (dtype, shape) in COLUMNS.items()}
+
+    def append(self, frame_nb, timestamp, hand):
+        if self.error is not None:
+            raise self.error
+        b = self.block
+        i = self.nb_rows
+        b["frame"][i] = frame_nb
+        b["timestamp"][i] = timestamp
+        b["gesture"][i] = GESTURE_CODES.get(getattr(hand, "gesture", None), -1)
+        b["lm_score"][i] = hand.lm_score
+        b["handedness"][i] = hand.handedness
+        b["landmarks"][i,:,:2] = hand.landmarks[:,:2]
+        b["landmarks"][i,:,2] = hand.norm_landmarks[:,2]
+        self.nb_rows += 1
+        if self.nb_rows == self.block_size:
+            self.flush()
+
+    def flush(self):
+        # Hand the current block to the writer thread
+        if self.nb_rows == 0: return
+        self.full_blocks.put((self.block, self.nb_rows))
+        self.nb_rows_total += self.nb_rows
+        self.nb_rows = 0
+        # The writer thread gives the block back once written. If it died, it never will:
+        # wait with a timeout to notice it
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.block = self.free_blocks.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+
+    def write_blocks(self):
+        try:
+            while True:
+                item = self.full_blocks.get()
+                if item is None: break
+                block, nb_rows = item
+                for name, file in self.files.items():
+                    file.write(block[name][:nb_rows].tobytes())
+                    file.flush()
+                self.free_blocks.put(block)
+        except Exception as e:
+            print(f"Session log: error while writing in {self.directory}: {e!r}")
+            self.error = e
+
+    def close(self):
+        try:
+            if self.error is None:
+                self.flush()
+        finally:
+            self.full_blocks.put(None)
+            self.thread.join()
+            for file in self.files.values():
+                file.close()
+        if self.error is not None:
+            raise self.error
+
+
+class LandmarkLogReader:
+    """
+    Memory mapped reader of a session log.
+    reader["landmarks"] is a np.memmap of shape (nb_rows, 21, 3), nothing is loaded until accessed.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "header.json")) as file:
+            header = json.load(file)
+        self.dtypes = {name: (np.dtype(c["dtype"]), tuple(c["shape"])) for name, c in header["columns"].items()}
+        # The number of rows is given by the smallest column file (the last block may be partially written)
+        sizes = []
+        for name, (dtype, shape) in self.dtypes.items():
+            row_size = dtype.itemsize * int(np.prod(shape))
+            sizes.append(os.path.getsize(os.path.join(directory, f"{name}.bin")) // row_size)
+        self.nb_rows = min(sizes)
+        self.columns = {}
+        for name, (dtype, shape) in self.dtypes.items():
+            if self.nb_rows == 0:
+                self.columns[name] = np.zeros((0,) + shape, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype, mode="r", shape=(self.nb_rows,) + shape)
+
+    def __len__(self):
+        return self.nb_rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def time_slice(self, t_start=None, t_end=None):
+        """
+        Returns the slice of the rows with t_start <= timestamp < t_end (timestamps are increasing)
+        """
+        timestamp = self.columns["timestamp"]
+        start = 0 if t_start is None else int(np.searchsorted(timestamp, t_start, side="left"))
+        end = self.nb_rows if t_end is None else int(np.searchsorted(timestamp, t_end, side="left"))
+        return slice(start, end)
+
+    def time_range(self, t_start=None, t_end=None):
+        """
+        Returns a dict {name: memmap view} of the rows between t_start and t_end
+        """
+        s = self.time_slice(t_start, t_end)
+        return {name: column[s] for name, column in self.columns.items()}
+
+
+# Analytics
+
+def gesture_counts(gesture):
+    """
+    Number of rows per gesture code. Returns an array of len(GESTURES)+1, the last element is for 'no gesture'
+    """
+    counts = np.bincount(np.asarray(gesture, dtype=np.int64) % (len(mp.GESTURES) + 1), minlength=len(mp.GESTURES) + 1)
+    return counts
+
+def gesture_segments(gesture, timestamp):
+    """
+    Run length encoding of the gesture column.
+    Returns (codes, start_times, durations) of the segments of consecutive identical gestures
+    """
+    gesture = np.asarray(gesture)
+    timestamp = np.asarray(timestamp)
+    if gesture.size == 0:
+        return gesture, timestamp, timestamp
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(gesture)) + 1))
+    ends = np.concatenate((starts[1:], [gesture.size]))
+    return gesture[starts], timestamp[starts], timestamp[ends - 1] - timestamp[starts]
+
+def landmark_speed(landmarks, timestamp, landmark_id=8):
+    """
+    Speed in pixels/s of one landmark (default: index finger tip) between consecutive rows
+    """
+    xy = np.asarray(landmarks[:, landmark_id, :2], dtype=np.float64)
+    dt = np.diff(np.asarray(timestamp))
+    return np.linalg.norm(np.diff(xy, axis=0), axis=1) / np.where(dt > 0, dt, np.inf)
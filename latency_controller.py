@@ -0,0 +1,214 @@
+"""
+Latency budget controller
+
+Watches the FPS and the latency measured by the tracker and, when the budget
+is exceeded, steps the tracker down a ladder of (landmark model, internal FPS) settings
+(and back up when there is enough headroom again).
+
+Changing the landmark model or the camera FPS requires to restart the device
+pipeline (HandTracker.restart_pipeline()), so switches are rare by design:
+    - a switch down needs 'down_windows' consecutive windows over budget,
+    - a switch up needs 'up_windows' consecutive windows well under budget
+      (latency < up_margin * max_latency and fps >= keep_up * internal_fps of the current
+      settings, i.e. the tracker keeps up with the camera; fps > min_fps / up_margin when the
+      settings have no 'internal_fps'),
+    - the windows measured during 'cooldown' seconds after a switch are ignored
+      (restarting the pipeline creates a latency spike),
+    - each time a switch up is followed by a switch down, the number of windows
+      needed before the next switch up is doubled.
+"""
+
+from device_profile import default_internal_fps
+
+def default_ladder(xyz=False):
+    """
+    Ladder of settings, from the most expensive to the cheapest: the full and lite models at their
+    default FPS (which depends on xyz, see default_internal_fps()), then the lite model at 5/6 and 2/3 of its default FPS
+    """
+    full_fps = default_internal_fps("full", xyz)
+    lite_fps = default_internal_fps("lite", xyz)
+    return [
+        {"lm_model": "full", "internal_fps": full_fps},
+        {"lm_model": "lite", "internal_fps": lite_fps},
+        {"lm_model": "lite", "internal_fps": round(lite_fps * 5 / 6)},
+        {"lm_model": "lite", "internal_fps": round(lite_fps * 2 / 3)},
+    ]
+
+# Without depth: full 26, lite 36, 30, 24 FPS
+DEFAULT_LADDER = default_ladder()
+
+class LatencyBudgetController:
+    """
+    Arguments:
+    - ladder: list of dicts of HandTracker settings (keys 'lm_model', 'internal_fps'),
+                from the most expensive to the cheapest. When None, default_ladder(xyz),
+    - xyz: boolean, True when the tracker computes the depth (lower FPS for each model),
+    - level: index in the ladder of the initial settings,
+    - max_latency: latency budget in seconds (ignored when the tracker does not measure latency),
+    - min_fps: minimum acceptable FPS,
+    - window: number of frames of a measurement window,
+    - down_windows, up_windows, up_margin, keep_up, cooldown: hysteresis parameters (see above).
+    """
+    def __init__(self,
+                ladder=None,
+                xyz=False,
+                level=0,
+                max_latency=0.1,
+                min_fps=20,
+                window=30,
+                down_windows=2,
+                up_windows=10,
+                up_margin=0.7,
+                keep_up=0.9,
+                cooldown=3.0):
+        if ladder is None:
+            ladder = default_ladder(xyz)
+        assert 0 <= level < len(ladder)
+        self.ladder = ladder
+        self.level = level
+        self.max_latency = max_latency
+        self.min_fps = min_fps
+        self.window = window
+        self.down_windows = down_windows
+        self.up_windows = up_windows
+        self.up_margin = up_margin
+        self.keep_up = keep_up
+        self.cooldown = cooldown
+
+        self.nb_over = 0
+        self.nb_under = 0
+        self.last_switch_time = None
+        self.last_switch_up = False
+        self.nb_switches = 0
+        self._reset_window()
+
+    @property
+    def settings(self):
+        return self.ladder[self.level]
+
+    def _reset_window(self):
+        self.window_start = None
+        self.window_frames = 0
+        self.window_latency_sum = 0
+        self.window_nb_latency = 0
+
+    def update(self, now, latency=None):
+        """
+        To be called once per frame with the current time (monotonic, in s)
+        and the latency of the frame (in s, or None if not measured).
+        Returns the new settings when a switch is decided, None otherwise.
+        """
+        if self.window_start is None:
+            self.window_start = now
+            return None
+        self.window_frames += 1
+        if latency is not None:
+            self.window_latency_sum += latency
+            self.window_nb_latency += 1
+        if self.window_frames < self.window:
+            return None
+
+        fps = self.window_frames / (now - self.window_start) if now > self.window_start else float("inf")
+        latency = self.window_latency_sum / self.window_nb_latency if self.window_nb_latency else None
+        self._reset_window()
+        self.window_start = now
+        if self.last_switch_time is not None and now - self.last_switch_time < self.cooldown:
+            return None
+        return self.evaluate(now, fps, latency)
+
+    def evaluate(self, now, fps, latency):
+        """
+        Decide a switch from the FPS and average latency measured on a window.
+        Returns the new settings when a switch is decided, None otherwise.
+        """
+        # The FPS is capped by the camera FPS of the current settings, which can be below min_fps / up_margin,
+        # or even below min_fps (then the settings are over budget only when the tracker does not keep up)
+        camera_fps = self.settings.get("internal_fps")
+        min_fps = min(self.min_fps, self.keep_up * camera_fps) if camera_fps else self.min_fps
+        over = fps < min_fps or (latency is not None and latency > self.max_latency)
+        fps_ok = fps >= self.keep_up * camera_fps if camera_fps else fps > self.min_fps / self.up_margin
+        under = fps_ok and (latency is None or latency < self.up_margin * self.max_latency)
+        if over:
+            self.nb_over += 1
+            self.nb_under = 0
+        elif under:
+            self.nb_under += 1
+            self.nb_over = 0
+        else:
+            self.nb_over = self.nb_under = 0
+
+        if self.nb_over >= self.down_windows and self.level < len(self.ladder) - 1:
+            if self.last_switch_up:
+                # The previous switch up was too optimistic
+                self.up_windows *= 2
+            return self._switch(now, self.level + 1, up=False)
+        if self.nb_under >= self.up_windows and self.level > 0:
+            return self._switch(now, self.level - 1, up=True)
+        return None
+
+    def _switch(self, now, level, up):
+        self.level = level
+        self.nb_over = self.nb_under = 0
+        self.last_switch_time = now
+        self.last_switch_up = up
+        self.nb_switches += 1
+        # The current window contains frames of the previous settings
+        self._reset_window()
+        return self.settings
+
+
+class SimulatedTracker:
+    """
+    Timing model stand-in of a HandTracker, used to exercise LatencyBudgetController
+    without a device. Time is virtual: each call to next_frame() advances 'clock'
+    by the duration of a frame.
+    - nn_time: time in s spent by the device for one frame, per landmark model,
+    - host_load: multiplicative factor applied to nn_time (can be changed during a simulation),
+    - restart_time: virtual time in s spent in restart_pipeline().
+    """
+    def __init__(self,
+                lm_model="lite",
+                internal_fps=36,
+                nn_time={"full": 0.040, "lite": 0.027, "sparse": 0.034},
+                host_load=1.0,
+                restart_time=2.0):
+        self.lm_model = lm_model
+        self.internal_fps = internal_fps
+        self.nn_time = nn_time
+        self.host_load = host_load
+        self.restart_time = restart_time
+        self.clock = 0.0
+        self.latency = None
+        self.nb_restarts = 0
+
+    def next_frame(self):
+        process_time = self.nn_time[self.lm_model] * self.host_load
+        frame_period = 1 / self.internal_fps
+        # When the processing is slower than the camera, frames wait in queues
+        # (size 1) before being processed: the latency grows by one frame period
+        self.latency = process_time + (frame_period if process_time > frame_period else 0)
+        self.clock += max(frame_period, process_time)
+        return None, [], None
+
+    def restart_pipeline(self, lm_model=None, internal_fps=None):
+        if lm_model is not None:
+            self.lm_model = lm_model
+        if internal_fps is not None:
+            self.internal_fps = internal_fps
+        self.clock += self.restart_time
+        self.nb_restarts += 1
+
+
+def simulate(controller, tracker, nb_frames):
+    """
+    Run 'controller' on 'tracker' (typically a SimulatedTracker) for 'nb_frames' frames.
+    Returns the list of (clock, level) of the switches.
+    """
+    switches = []
+    for _ in range(nb_frames):
+        tracker.next_frame()
+        settings = controller.update(tracker.clock, tracker.latency)
+        if settings:
+            tracker.restart_pipeline(**settings)
+            switches.append((tracker.clock, controller.level))
+    return switches
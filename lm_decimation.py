@@ -0,0 +1,186 @@
+"""
+Landmark inference decimation (edge mode, solo)
+
+When a hand is tracked, the manager script can skip the landmark inference on some frames:
+    - "alternate": one frame out of two,
+    - "adaptive": when the motion of the hand ROI between the last two inferences is below
+      'skip_motion' (per frame, relative to the ROI size), up to 'max_skips' consecutive frames.
+On a skipped frame, the manager waits for the next camera frame (frame_sync input), moves the ROI
+with its last motion and sends a result {"lm_skipped": True}. The host builds the hand of
+this frame by linear extrapolation of the landmarks of the last two inferences (HandExtrapolator),
+and marks it as synthetic (hand.synthetic = True).
+
+The accuracy cost is measured on replayed sessions (see landmark_log.py):
+> python3 lm_decimation.py session_log_dir [--modes alternate adaptive] [--skip_motion 0.02] [--max_skips 2]
+For each mode, the decisions of the manager are replayed on the recorded landmarks, and the
+extrapolated landmarks of the skipped frames are compared with the recorded ones.
+"""
+import copy
+import numpy as np
+
+DECIMATION_MODES = ["off", "alternate", "adaptive"]
+# Same landmarks as the manager script for the ROI bounding box
+IDS_FOR_BOUNDING_BOX = [0, 1, 2, 3, 5, 6, 9, 10, 13, 14, 17, 18]
+
+def manager_params(mode, skip_motion=0.02, max_skips=2):
+    """
+    Returns the (skip_motion, max_skips) used by the manager script for 'mode'
+    ("alternate" is "adaptive" without motion condition and 1 skip max, "off" never skips)
+    """
+    assert mode in DECIMATION_MODES, f"Unknown landmark decimation mode {mode}"
+    if mode == "alternate":
+        return 1e9, 1
+    if mode == "off":
+        return 0, 0
+    return skip_motion, max_skips
+
+def extrapolate_landmarks(prev, last, ratio):
+    """
+    Linear extrapolation of the landmarks: last + (last - prev) * ratio
+    """
+    prev = np.asarray(prev, dtype=np.float64)
+    last = np.asarray(last, dtype=np.float64)
+    return last + (last - prev) * ratio
+
+class HandExtrapolator:
+    """
+    Keeps the last 2 inferred hands (solo mode) and builds the synthetic hands of the skipped frames
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.prev = None
+        self.last = None
+        # Number of frames between prev and last, and since last
+        self.gap = 1
+        self.since = 0
+
+    def update(self, hands):
+        """
+        Called with the hands of each frame with landmark inference
+        """
+        if len(hands) != 1:
+            self.reset()
+            return
+        self.prev = self.last
+        self.gap = self.since + 1
+        self.last = hands[0]
+        self.since = 0
+
+    def extrapolate(self):
+        """
+        Returns the list of the hands of a skipped frame (empty or 1 synthetic hand)
+        """
+        if self.last is None: return []
+        self.since += 1
+        hand = copy.copy(self.last)
+        hand.synthetic = True
+        if self.prev is None: return [hand]
+        ratio = self.since / self.gap
+        landmarks = extrapolate_landmarks(self.prev.landmarks, self.last.landmarks, ratio)
+        hand.landmarks = landmarks.round().astype(np.int32)
+        # The rectangle follows the wrist
+        dx, dy = (landmarks[0] - self.last.landmarks[0]).tolist()
+        hand.rect_x_center_a = self.last.rect_x_center_a + dx
+        hand.rect_y_center_a = self.last.rect_y_center_a + dy
+        hand.rect_points = [[int(x + dx), int(y + dy)] for x, y in self.last.rect_points]
+        if getattr(self.last, "xyz_age", -1) >= 0:
+            hand.xyz_age = self.last.xyz_age + self.since
+        return [hand]
+
+
+# Replay
+
+def roi_from_landmarks(landmarks):
+    """
+    ROI centers (N,2) and sizes (N,) computed from landmarks (N,21,2+) like the manager script
+    (bounding box of IDS_FOR_BOUNDING_BOX, without rotation)
+    """
+    xy = np.asarray(landmarks, dtype=np.float64)[:, IDS_FOR_BOUNDING_BOX, :2]
+    mins, maxs = xy.min(axis=1), xy.max(axis=1)
+    return (mins + maxs) / 2, 2 * (maxs - mins).max(axis=1)
+
+def skip_decisions(centers, sizes, skip_motion, max_skips):
+    """
+    Replays the decisions of the manager script on a continuous track (one ROI per frame).
+    Returns a boolean array, True for the frames whose landmark inference is skipped
+    """
+    skipped = np.zeros(len(centers), dtype=bool)
+    last = None         # Index of the last inferred frame
+    tracked = False     # At least 2 inferences on the track
+    motion = None
+    nb_skipped = 0
+    skip_next = False
+    for i in range(len(centers)):
+        if skip_next:
+            skipped[i] = True
+            nb_skipped += 1
+            skip_next = nb_skipped < max_skips and motion < skip_motion
+            continue
+        if last is not None:
+            motion = np.linalg.norm(centers[i] - centers[last]) / (nb_skipped + 1) / sizes[i]
+            tracked = True
+        last = i
+        nb_skipped = 0
+        skip_next = tracked and max_skips > 0 and motion < skip_motion
+    return skipped
+
+def track_segments(frames):
+    """
+    Slices of the rows of consecutive frames (one hand per frame)
+    """
+    breaks = np.flatnonzero(np.diff(np.asarray(frames)) != 1) + 1
+    bounds = np.concatenate(([0], breaks, [len(frames)]))
+    return [slice(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:])]
+
+def evaluate(frames, landmarks, mode, skip_motion=0.02, max_skips=2):
+    """
+    Returns a dict with the ratio of skipped frames and the errors (pixels) of the extrapolated landmarks
+    """
+    skip_motion, max_skips = manager_params(mode, skip_motion, max_skips)
+    landmarks = np.asarray(landmarks, dtype=np.float64)[:, :, :2]
+    errors = []
+    nb_skipped = 0
+    for s in track_segments(frames):
+        lms = landmarks[s]
+        centers, sizes = roi_from_landmarks(lms)
+        skipped = skip_decisions(centers, sizes, skip_motion, max_skips)
+        nb_skipped += int(skipped.sum())
+        inferred = np.flatnonzero(~skipped)
+        for i in np.flatnonzero(skipped):
+            # Last 2 inferences before frame i
+            before = inferred[inferred < i][-2:]
+            if len(before) == 2:
+                predicted = extrapolate_landmarks(lms[before[0]], lms[before[1]], (i - before[1]) / (before[1] - before[0]))
+            else:
+                predicted = lms[before[-1]]
+            errors.append(np.linalg.norm(predicted - lms[i], axis=1))
+    errors = np.concatenate(errors) if errors else np.zeros(0)
+    return {
+        'skip_ratio': nb_skipped / len(frames) if len(frames) else 0,
+        'mean_error': float(errors.mean()) if errors.size else 0,
+        'p95_error': float(np.percentile(errors, 95)) if errors.size else 0,
+        'max_error': float(errors.max()) if errors.size else 0,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from landmark_log import LandmarkLogReader
+    parser = argparse.ArgumentParser(description="Accuracy cost of the landmark inference decimation on replayed sessions")
+    parser.add_argument('logs', nargs='+', help="Session log directories (solo mode, see landmark_log.py)")
+    parser.add_argument('--modes', nargs='+', default=["alternate", "adaptive"], choices=DECIMATION_MODES[1:], help="Modes (default=%(default)s)")
+    parser.add_argument('--skip_motion', type=float, nargs='+', default=[0.01, 0.02, 0.05], help="Motion thresholds of the adaptive mode (default=%(default)s)")
+    parser.add_argument('--max_skips', type=int, default=2, help="Max consecutive skipped frames in adaptive mode (default=%(default)i)")
+    args = parser.parse_args()
+
+    print(f"{'log':30s} {'mode':18s} {'skipped':>8s} {'mean err':>9s} {'p95 err':>8s} {'max err':>8s} (pixels)")
+    for log in args.logs:
+        reader = LandmarkLogReader(log)
+        frames, landmarks = np.asarray(reader["frame"]), np.asarray(reader["landmarks"])
+        for mode in args.modes:
+            for skip_motion in (args.skip_motion if mode == "adaptive" else [None]):
+                r = evaluate(frames, landmarks, mode, skip_motion, args.max_skips)
+                name = mode if skip_motion is None else f"{mode} {skip_motion:g}"
+                print(f"{log[-30:]:30s} {name:18s} {r['skip_ratio']:8.1%} {r['mean_error']:9.2f} {r['p95_error']:8.2f} {r['max_error']:8.2f}")
@@ -7,7 +7,7 @@ rrn_ : normalized [0:1] coordinates in rotated rectangle coordinate systems
 sqn_ : normalized [0:1] coordinates in squared input image
 """
 import marshal
-from math import sin, cos, atan2, pi, degrees, floor
+from math import sin, cos, atan2, pi, degrees, floor, hypot
 
 
 pad_h = ${_pad_h}
@@ -68,12 +68,36 @@ def send_result_no_hand(pd_inf, nb_lm_inf):
     result = dict([("pd_inf", pd_inf), ("nb_lm_inf", nb_lm_inf)])
     send_result(result)
 
-def send_result_hand(pd_inf, nb_lm_inf, lm_score=0, handedness=0, rect_center_x=0, rect_center_y=0, rect_size=0, rotation=0, rrn_lms=0, sqn_lms=0, world_lms=0, xyz=0, xyz_zone=0):
+def send_result_hand(pd_inf, nb_lm_inf, lm_score=0, handedness=0, rect_center_x=0, rect_center_y=0, rect_size=0, rotation=0, rrn_lms=0, sqn_lms=0, world_lms=0, xyz=0, xyz_zone=0, xyz_age=0):
     result = dict([("pd_inf", pd_inf), ("nb_lm_inf", nb_lm_inf), ("lm_score", [lm_score]), ("handedness", [handedness]), ("rotation", [rotation]),
             ("rect_center_x", [rect_center_x]), ("rect_center_y", [rect_center_y]), ("rect_size", [rect_size]), 
-            ("rrn_lms", [rrn_lms]), ('sqn_lms', [sqn_lms]), ('world_lms', [world_lms]), ("xyz", [xyz]), ("xyz_zone", [xyz_zone])])
+            ("rrn_lms", [rrn_lms]), ('sqn_lms', [sqn_lms]), ('world_lms', [world_lms]), ("xyz", [xyz]), ("xyz_zone", [xyz_zone]), ("xyz_age", [xyz_age])])
     send_result(result)
 
+${_IF_XYZ}
+def send_spatial_config(sqn_lms, sqn_rr_size):
+    # Ask the SpatialLocationCalculator for the depth of a zone centered on the wrist
+    conf_data = SpatialLocationCalculatorConfigData()
+    conf_data.depthThresholds.lowerThreshold = 100
+    conf_data.depthThresholds.upperThreshold = 10000
+    zone_size = max(int(sqn_rr_size * frame_size / 10), 8)
+    c_x = int(sqn_lms[0] * frame_size -zone_size/2 + crop_w)
+    c_y = int(sqn_lms[1] * frame_size -zone_size/2 - pad_h)
+    rect_center = Point2f(c_x, c_y)
+    rect_size = Size2f(zone_size, zone_size)
+    conf_data.roi = Rect(rect_center, rect_size)
+    cfg = SpatialLocationCalculatorConfig()
+    cfg.addROI(conf_data)
+    node.io['spatial_location_config'].send(cfg)
+    ${_TRACE2} ("Manager sent ROI to spatial_location_config")
+
+def read_spatial_data(spatial_msg):
+    xyz_data = spatial_msg.getSpatialLocations()
+    coords = xyz_data[0].spatialCoordinates
+    roi = xyz_data[0].config.roi
+    return [coords.x, coords.y, coords.z], [int(roi.topLeft().x - crop_w), int(roi.topLeft().y), int(roi.bottomRight().x - crop_w), int(roi.bottomRight().y)]
+${_IF_XYZ}
+
 def rr2img(rrn_x, rrn_y):
     # Convert a point (rrn_x, rrn_y) expressed in normalized rotated rectangle (rrn)
     # into (X, Y) expressed in normalized image (sqn)
@@ -100,9 +124,48 @@ ids_for_bounding_box = [0, 1, 2, 3, 5, 6, 9, 10, 13, 14, 17, 18]
 
 lm_input_size = 224
 
+# Frame counter, used to measure the age of asynchronous xyz measures
+frame_nb = 0
+${_IF_XYZ_ASYNC}
+xyz_pending = False
+xyz_pending_frame = -1
+last_xyz_frame = -1
+last_xyz = 0
+last_xyz_zone = 0
+${_IF_XYZ_ASYNC}
+
+${_IF_LM_DECIMATION}
+# Landmark inference decimation (see lm_decimation.py): when the ROI moved less than lm_skip_motion
+# (per frame, relative to the ROI size) between the last 2 inferences, skip up to lm_max_skips frames
+lm_skip_motion = ${_lm_skip_motion}
+lm_max_skips = ${_lm_max_skips}
+lm_skip_next = False
+nb_lm_skipped = 0
+last_lm_seq = -1
+roi_tracked = False
+roi_dx = roi_dy = 0
+roi_motion = 0
+${_IF_LM_DECIMATION}
 
 while True:
     nb_lm_inf = 0
+    frame_nb += 1
+    ${_IF_LM_DECIMATION}
+    if send_new_frame_to_branch == 2 and lm_skip_next:
+        # Wait for a frame more recent than the last processed one (the frames are not sent to the manips)
+        while True:
+            sync_seq = node.io['frame_sync'].get().getSequenceNum()
+            if sync_seq > last_lm_seq: break
+        last_lm_seq = sync_seq
+        nb_lm_skipped += 1
+        # Move the ROI of the next inference with the last ROI motion
+        sqn_rr_center_x += roi_dx
+        sqn_rr_center_y += roi_dy
+        send_result(dict([("pd_inf", False), ("nb_lm_inf", 0), ("lm_skipped", True)]))
+        lm_skip_next = nb_lm_skipped < lm_max_skips and roi_motion < lm_skip_motion
+        ${_TRACE1} (f"Landmarks - inference skipped")
+        continue
+    ${_IF_LM_DECIMATION}
     if send_new_frame_to_branch == 1: # Routing frame to pd branch
         node.io['pre_pd_manip_cfg'].send(cfg_pre_pd)
         ${_TRACE2} ("Manager sent thumbnail config to pre_pd manip")
@@ -141,6 +204,10 @@ while True:
     cfg = ImageManipConfig()
     cfg.setCropRotatedRect(rr, True)
     cfg.setResize(lm_input_size, lm_input_size)
+    ${_IF_LM_FROM_VIDEO}
+    # The crop is taken from the video (NV12): the landmark model needs BGR planar
+    cfg.setFrameType(ImgFrame.Type.BGR888p)
+    ${_IF_LM_FROM_VIDEO}
     node.io['pre_lm_manip_cfg'].send(cfg)
     nb_lm_inf += 1
     ${_TRACE2} ("Manager sent config to pre_lm manip")
@@ -148,6 +215,9 @@ while True:
     # Wait for lm's result
     lm_result = node.io['from_lm_nn'].get()
     ${_TRACE2} ("Manager received result from lm nn")
+    ${_IF_LM_DECIMATION}
+    last_lm_seq = lm_result.getSequenceNum()
+    ${_IF_LM_DECIMATION}
     lm_score = lm_result.getLayerFp16("Identity_1")[0]
     if lm_score > ${_lm_score_thresh}:
         handedness = lm_result.getLayerFp16("Identity_2")[0]
@@ -171,32 +241,38 @@ while True:
             sqn_lms += [sqn_x, sqn_y]
         xyz = 0
         xyz_zone = 0
+        xyz_age = 0
         # Query xyz
-        ${_IF_XYZ}
-        conf_data = SpatialLocationCalculatorConfigData()
-        conf_data.depthThresholds.lowerThreshold = 100
-        conf_data.depthThresholds.upperThreshold = 10000
-        zone_size = max(int(sqn_rr_size * frame_size / 10), 8)
-        c_x = int(sqn_lms[0] * frame_size -zone_size/2 + crop_w)
-        c_y = int(sqn_lms[1] * frame_size -zone_size/2 - pad_h)
-        rect_center = Point2f(c_x, c_y)
-        rect_size = Size2f(zone_size, zone_size)
-        conf_data.roi = Rect(rect_center, rect_size)
-        cfg = SpatialLocationCalculatorConfig()
-        cfg.addROI(conf_data)
-        node.io['spatial_location_config'].send(cfg)
-        ${_TRACE2} ("Manager sent ROI to spatial_location_config")
+        ${_IF_XYZ_SYNC}
+        send_spatial_config(sqn_lms, sqn_rr_size)
         # Wait xyz response
-        xyz_data = node.io['spatial_data'].get().getSpatialLocations()
+        xyz, xyz_zone = read_spatial_data(node.io['spatial_data'].get())
         ${_TRACE2} ("Manager received spatial_location")
-        coords = xyz_data[0].spatialCoordinates
-        xyz = [coords.x, coords.y, coords.z]
-        roi = xyz_data[0].config.roi
-        xyz_zone = [int(roi.topLeft().x - crop_w), int(roi.topLeft().y), int(roi.bottomRight().x - crop_w), int(roi.bottomRight().y)]
-        ${_IF_XYZ}
+        ${_IF_XYZ_SYNC}
+        ${_IF_XYZ_ASYNC}
+        # Don't wait for the depth of this frame: pick up the response to a ROI 
+        # submitted on a previous frame (if arrived) and submit a new ROI only 
+        # when the calculator is idle. xyz_age tells the host how many frames old the depth is.
+        spatial_msg = node.io['spatial_data'].tryGet()
+        if spatial_msg is not None:
+            last_xyz, last_xyz_zone = read_spatial_data(spatial_msg)
+            last_xyz_frame = xyz_pending_frame
+            xyz_pending = False
+            ${_TRACE2} ("Manager received spatial_location")
+        if not xyz_pending:
+            send_spatial_config(sqn_lms, sqn_rr_size)
+            xyz_pending = True
+            xyz_pending_frame = frame_nb
+        if last_xyz_frame >= 0:
+            xyz = last_xyz
+            xyz_zone = last_xyz_zone
+            xyz_age = frame_nb - last_xyz_frame
+        else:
+            xyz_age = -1
+        ${_IF_XYZ_ASYNC}
 
         # Send result to host
-        send_result_hand(send_new_frame_to_branch==1, nb_lm_inf, lm_score, handedness, sqn_rr_center_x, sqn_rr_center_y, sqn_rr_size, rotation, rrn_lms, sqn_lms, world_lms, xyz, xyz_zone)
+        send_result_hand(send_new_frame_to_branch==1, nb_lm_inf, lm_score, handedness, sqn_rr_center_x, sqn_rr_center_y, sqn_rr_size, rotation, rrn_lms, sqn_lms, world_lms, xyz, xyz_zone, xyz_age)
         send_new_frame_to_branch = 2 
 
         # Calculate the ROI for next frame
@@ -241,11 +317,28 @@ while True:
         sqn_rr_size = 2 * max(width, height) 
         sqn_rr_center_x = (center_x + 0.1 * height * sin_rot) 
         sqn_rr_center_y = (center_y - 0.1 * height * cos_rot) 
+        ${_IF_LM_DECIMATION}
+        # ROI motion per frame since the previous inference
+        if roi_tracked:
+            roi_dx = (sqn_rr_center_x - roi_last_x) / (nb_lm_skipped + 1)
+            roi_dy = (sqn_rr_center_y - roi_last_y) / (nb_lm_skipped + 1)
+            roi_motion = hypot(roi_dx, roi_dy) / sqn_rr_size
+        roi_last_x = sqn_rr_center_x
+        roi_last_y = sqn_rr_center_y
+        lm_skip_next = roi_tracked and lm_max_skips > 0 and roi_motion < lm_skip_motion
+        roi_tracked = True
+        nb_lm_skipped = 0
+        ${_IF_LM_DECIMATION}
         ${_TRACE1} (f"Landmarks - hand confirmed")
     else:
         send_result_no_hand(send_new_frame_to_branch==1, nb_lm_inf)
         send_new_frame_to_branch = 1
         ${_TRACE1} (f"Landmarks - hand not confirmed")
+        ${_IF_LM_DECIMATION}
+        roi_tracked = False
+        lm_skip_next = False
+        nb_lm_skipped = 0
+        ${_IF_LM_DECIMATION}
          ${_IF_USE_HANDEDNESS_AVERAGE}
         handedness_avg.reset()
         ${_IF_USE_HANDEDNESS_AVERAGE}
\ No newline at end of file
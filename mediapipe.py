@@ -1,7 +1,6 @@
-import cv2
 import numpy as np
 from collections import namedtuple
-from math import sin, cos, gcd
+from math import sin, cos, gcd, sqrt, ceil, floor, atan2, pi
 
 class HandRegion:
     """
@@ -61,32 +60,144 @@ SSDAnchorOptions = namedtuple('SSDAnchorOptions',[
         'interpolated_scale_aspect_ratio',
         'fixed_anchor_size'])
 
-# Starting from opencv 4.5.4, cv2.dnn.NMSBoxes output format changed
-import re
-cv2_version = cv2.__version__.split('.')
-v0 = int(cv2_version[0])
-v1 = int(cv2_version[1])
-v2 = int(re.sub(r'\D+', '', cv2_version[2]))
-if  v0 > 4 or (v0 == 4 and (v1 > 5 or (v1 == 5 and v2 >= 4))):
-    def non_max_suppression(regions, nms_thresh):
-        # cv2.dnn.NMSBoxes(boxes, scores, 0, nms_thresh) needs:
-        # boxes = [ [x, y, w, h], ...] with x, y, w, h of type int
-        # Currently, x, y, w, h are float between 0 and 1, so we arbitrarily multiply by 1000 and cast to int
-        # boxes = [r.box for r in regions]
-        boxes = [ [int(x*1000) for x in r.pd_box] for r in regions]        
-        scores = [r.pd_score for r in regions]
-        indices = cv2.dnn.NMSBoxes(boxes, scores, 0, nms_thresh) # Not using top_k=2 here because it does not give expected result. Bug ?
-        return [regions[i] for i in indices]
-else:
-    def non_max_suppression(regions, nms_thresh):
-        # cv2.dnn.NMSBoxes(boxes, scores, 0, nms_thresh) needs:
-        # boxes = [ [x, y, w, h], ...] with x, y, w, h of type int
-        # Currently, x, y, w, h are float between 0 and 1, so we arbitrarily multiply by 1000 and cast to int
-        # boxes = [r.box for r in regions]
-        boxes = [ [int(x*1000) for x in r.pd_box] for r in regions]        
-        scores = [r.pd_score for r in regions]
-        indices = cv2.dnn.NMSBoxes(boxes, scores, 0, nms_thresh) # Not using top_k=2 here because it does not give expected result. Bug ?
-        return [regions[i[0]] for i in indices]
+def calculate_scale(min_scale, max_scale, stride_index, num_strides):
+    if num_strides == 1:
+        return (min_scale + max_scale) / 2
+    else:
+        return min_scale + (max_scale - min_scale) * stride_index / (num_strides - 1)
+
+def generate_anchors(options):
+    """
+    option : SSDAnchorOptions
+    # https://github.com/google/mediapipe/blob/master/mediapipe/calculators/tflite/ssd_anchors_calculator.cc
+    Returns an array of shape (nb_anchors, 4) of [x_center, y_center, width, height]
+    """
+    anchors = []
+    layer_id = 0
+    n_strides = len(options.strides)
+    while layer_id < n_strides:
+        anchor_height = []
+        anchor_width = []
+        aspect_ratios = []
+        scales = []
+        # For same strides, we merge the anchors in the same order.
+        last_same_stride_layer = layer_id
+        while last_same_stride_layer < n_strides and \
+                options.strides[last_same_stride_layer] == options.strides[layer_id]:
+            scale = calculate_scale(options.min_scale, options.max_scale, last_same_stride_layer, n_strides)
+            if last_same_stride_layer == 0 and options.reduce_boxes_in_lowest_layer:
+                # For first layer, it can be specified to use predefined anchors.
+                aspect_ratios += [1.0, 2.0, 0.5]
+                scales += [0.1, scale, scale]
+            else:
+                aspect_ratios += options.aspect_ratios
+                scales += [scale] * len(options.aspect_ratios)
+                if options.interpolated_scale_aspect_ratio > 0:
+                    if last_same_stride_layer == n_strides -1:
+                        scale_next = 1.0
+                    else:
+                        scale_next = calculate_scale(options.min_scale, options.max_scale, last_same_stride_layer+1, n_strides)
+                    scales.append(sqrt(scale * scale_next))
+                    aspect_ratios.append(options.interpolated_scale_aspect_ratio)
+            last_same_stride_layer += 1
+
+        for i,r in enumerate(aspect_ratios):
+            ratio_sqrts = sqrt(r)
+            anchor_height.append(scales[i] / ratio_sqrts)
+            anchor_width.append(scales[i] * ratio_sqrts)
+
+        stride = options.strides[layer_id]
+        feature_map_height = ceil(options.input_size_height / stride)
+        feature_map_width = ceil(options.input_size_width / stride)
+
+        for y in range(feature_map_height):
+            for x in range(feature_map_width):
+                for anchor_id in range(len(anchor_height)):
+                    x_center = (x + options.anchor_offset_x) / feature_map_width
+                    y_center = (y + options.anchor_offset_y) / feature_map_height
+                    if options.fixed_anchor_size:
+                        new_anchor = [x_center, y_center, 1.0, 1.0]
+                    else:
+                        new_anchor = [x_center, y_center, anchor_width[anchor_id], anchor_height[anchor_id]]
+                    anchors.append(new_anchor)
+
+        layer_id = last_same_stride_layer
+    return np.array(anchors)
+
+def generate_handtracker_anchors():
+    # Anchors of the palm detection model (input 128x128, 896 anchors)
+    anchor_options = SSDAnchorOptions(num_layers=4, 
+                            min_scale=0.1484375,
+                            max_scale=0.75,
+                            input_size_height=128,
+                            input_size_width=128,
+                            anchor_offset_x=0.5,
+                            anchor_offset_y=0.5,
+                            strides=[8, 16, 16, 16],
+                            aspect_ratios= [1.0],
+                            reduce_boxes_in_lowest_layer=False,
+                            interpolated_scale_aspect_ratio=1.0,
+                            fixed_anchor_size=True)
+    return generate_anchors(anchor_options)
+
+def decode_bboxes(score_thresh, scores, bboxes, anchors, scale=128):
+    """
+    Decode the outputs of the palm detection model (same computation as PDPostProcessing 
+    in custom_models/generate_postproc_onnx.py, without the NMS)
+    scores: raw scores of shape (N,) or (N,1) (before sigmoid)
+    bboxes: raw regressors of shape (N,18)
+    anchors: array of shape (N,4)
+    Returns a list of HandRegion (pd_score, pd_box, pd_kps) for the scores above score_thresh
+    """
+    scores = 1 / (1 + np.exp(-np.clip(np.asarray(scores).reshape(-1), -100, 100)))
+    detection_mask = scores > score_thresh
+    det_scores = scores[detection_mask]
+    if det_scores.size == 0: return []
+    det_bboxes = bboxes[detection_mask] / scale
+    det_anchors = anchors[detection_mask]
+    # Box center and the 7 keypoints are offsets relative to the anchor center
+    # (anchors have a fixed size of 1 so the width and height are not scaled)
+    centers = np.tile(det_anchors[:,:2], 9)
+    centers[:,2:4] = 0
+    det_bboxes = det_bboxes + centers
+    regions = []
+    for score, det in zip(det_scores, det_bboxes):
+        cx, cy, w, h = det[:4]
+        box = [cx - w*0.5, cy - h*0.5, w, h]
+        kps = [det[4+2*k:6+2*k] for k in range(7)]
+        regions.append(HandRegion(float(score), box, kps))
+    return regions
+
+def detection_to_rect(region):
+    """
+    Compute the rotated rectangle (in the normalized squared image) used to crop the hand 
+    for the landmark model, from a palm detection. Same computation as in the manager script.
+    Sets region.rotation, region.rect_x_center, region.rect_y_center, region.rect_size (normalized)
+    """
+    box_x, box_y, box_size = region.pd_box[0] + region.pd_box[2]*0.5, region.pd_box[1] + region.pd_box[3]*0.5, region.pd_box[2]
+    kp0_x, kp0_y = region.pd_kps[0]
+    kp2_x, kp2_y = region.pd_kps[2]
+    rotation = normalize_radians(0.5 * pi - atan2(-(kp2_y - kp0_y), kp2_x - kp0_x))
+    region.rotation = rotation
+    region.rect_size = 2.9 * box_size
+    region.rect_x_center = box_x + 0.5*box_size*sin(rotation)
+    region.rect_y_center = box_y - 0.5*box_size*cos(rotation)
+
+def normalize_radians(angle):
+    return angle - 2 * pi * floor((angle + pi) / (2 * pi))
+
+def non_max_suppression(regions, nms_thresh):
+    # cv2.dnn.NMSBoxes(boxes, scores, 0, nms_thresh) needs:
+    # boxes = [ [x, y, w, h], ...] with x, y, w, h of type int
+    # Currently, x, y, w, h are float between 0 and 1, so we arbitrarily multiply by 1000 and cast to int
+    # boxes = [r.box for r in regions]
+    # cv2 is imported on first use: importing this module should not pay for it
+    import cv2
+    boxes = [ [int(x*1000) for x in r.pd_box] for r in regions]        
+    scores = [r.pd_score for r in regions]
+    indices = cv2.dnn.NMSBoxes(boxes, scores, 0, nms_thresh) # Not using top_k=2 here because it does not give expected result. Bug ?
+    # Starting from opencv 4.5.4, cv2.dnn.NMSBoxes returns a flat array of indices instead of a (N,1) array
+    return [regions[int(i)] for i in np.asarray(indices).reshape(-1)]
 
 def rotated_rect_to_points(cx, cy, w, h, rotation):
     b = cos(rotation) * 0.5
@@ -223,4 +334,50 @@ def recognize_gesture(hand):
         hand.gesture = "FOUR"
     else:
         hand.gesture = None
-       
\ No newline at end of file
+
+
+# Finger states (thumb, index, middle, ring, little) of each gesture,
+# in the order of the tests of recognize_gesture()
+GESTURES = ["FIVE", "FIST", "OK", "PEACE", "ONE", "TWO", "THREE", "FOUR"]
+GESTURE_FINGER_STATES = np.array([
+    [1, 1, 1, 1, 1],
+    [0, 0, 0, 0, 0],
+    [1, 0, 0, 0, 0],
+    [0, 1, 1, 0, 0],
+    [0, 1, 0, 0, 0],
+    [1, 1, 0, 0, 0],
+    [1, 1, 1, 0, 0],
+    [0, 1, 1, 1, 1],
+])
+
+def _angles(a, b, c):
+    # Vectorized angle(): a, b, c of shape (N,3), returns angles in degrees of shape (N,)
+    ba = a - b
+    bc = c - b
+    cosine_angle = np.sum(ba * bc, axis=-1) / (np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1))
+    return np.degrees(np.arccos(cosine_angle))
+
+def recognize_gestures(norm_landmarks):
+    """
+    Vectorized version of recognize_gesture() for a batch of hands.
+    norm_landmarks: array of shape (N,21,3)
+    Returns:
+        - finger_states: int array of shape (N,5) (thumb, index, middle, ring, little), -1=unknown, 0=close, 1=open
+        - gesture_codes: int array of shape (N,), index in GESTURES or -1 if no gesture recognized
+    """
+    lms = np.asarray(norm_landmarks, dtype=np.float64)
+    n = lms.shape[0]
+    finger_states = np.empty((n, 5), dtype=np.int32)
+    d_3_5 = np.linalg.norm(lms[:,3] - lms[:,5], axis=-1)
+    d_2_3 = np.linalg.norm(lms[:,2] - lms[:,3], axis=-1)
+    thumb_angle = _angles(lms[:,0], lms[:,1], lms[:,2]) + _angles(lms[:,1], lms[:,2], lms[:,3]) + _angles(lms[:,2], lms[:,3], lms[:,4])
+    finger_states[:,0] = (thumb_angle > 460) & (d_3_5 / d_2_3 > 1.2)
+    y = lms[:,:,1]
+    for f, base in enumerate([6, 10, 14, 18]):
+        # base: PIP joint, base+1: DIP joint, base+2: tip
+        is_open = (y[:,base+2] < y[:,base+1]) & (y[:,base+1] < y[:,base])
+        is_close = y[:,base] < y[:,base+2]
+        finger_states[:,f+1] = np.where(is_open, 1, np.where(is_close, 0, -1))
+    matches = np.all(finger_states[:,None,:] == GESTURE_FINGER_STATES[None], axis=-1)
+    gesture_codes = np.where(matches.any(axis=1), matches.argmax(axis=1), -1)
+    return finger_states, gesture_codes
@@ -0,0 +1,105 @@
+"""
+Live metrics of the tracker and the controller, served in the Prometheus text format
+
+Each metric has a single writer (the loop thread), so counters and gauges are plain
+attributes updated without lock: under the GIL, the HTTP server thread always reads
+a consistent (possibly one update old) value.
+
+Usage:
+> curl http://127.0.0.1:9100/metrics
+"""
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class Counter:
+    __slots__ = ("value",)
+    type = "counter"
+    def __init__(self):
+        self.value = 0
+    def inc(self, n=1):
+        self.value += n
+
+class Gauge:
+    __slots__ = ("value",)
+    type = "gauge"
+    def __init__(self):
+        self.value = 0
+    def set(self, value):
+        self.value = value
+
+def escape_help(text):
+    # Text format: backslash and line feed are escaped in the HELP text
+    return str(text).replace("\\", "\\\\").replace("\n", "\\n")
+
+def escape_label_value(value):
+    # Text format: backslash, double quote and line feed are escaped in the label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsRegistry:
+    def __init__(self, prefix="handtracker_"):
+        self.prefix = prefix
+        # name -> (type, help, {labels tuple: metric})
+        self.metrics = {}
+
+    def _get(self, cls, name, help, labels):
+        name = self.prefix + name
+        if name not in self.metrics:
+            self.metrics[name] = (cls.type, help, {})
+        family = self.metrics[name][2]
+        key = tuple(sorted(labels.items())) if labels else ()
+        metric = family.get(key)
+        if metric is None:
+            # Copy the family so that a concurrent render() never iterates a dict being modified
+            family = dict(family)
+            metric = family[key] = cls()
+            self.metrics[name] = (cls.type, help, family)
+        return metric
+
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def render(self):
+        lines = []
+        for name, (type, help, family) in list(self.metrics.items()):
+            if help:
+                lines.append(f"# HELP {name} {escape_help(help)}")
+            lines.append(f"# TYPE {name} {type}")
+            for labels, metric in family.items():
+                label_str = "{" + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in labels) + "}" if labels else ""
+                lines.append(f"{name}{label_str} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Serve the metrics of 'registry' on http://host:port/metrics from a daemon thread
+    """
+    def __init__(self, registry, host="127.0.0.1", port=9100):
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Metrics served on http://{host}:{self.server.server_port}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
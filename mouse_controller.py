@@ -15,133 +15,53 @@ The pointer scrolls when your hand is doing the PEACE pose (or just index + midd
 
 print(INSTRUCTIONS)
 
-import numpy as np
 import time
 import argparse
-from screeninfo import get_monitors
-from pynput.mouse import Button, Controller
-
-from hand_pose_controller import HandController
 
 # Initialize the parser
 parser = argparse.ArgumentParser(description="Sample argument parser")
 parser.add_argument('-r', '--enable-renderer', action='store_true', help='Enable renderer')
-
-# Parse the arguments
+parser.add_argument('--backend', choices=['pynput', 'null', 'record'], default='pynput', 
+                    help='Input injection backend: pynput (desktop), null (no action), record (action log) (default=%(default)s)')
+parser.add_argument('--record_output', default='input_actions.jsonl', help='Output file of the record backend (default=%(default)s)')
+parser.add_argument('--monitor', type=int, help='Index of the only monitor to control (default: all the monitors)')
+parser.add_argument('--log', metavar='DIRECTORY', help='Write the tracked hands in a session log in DIRECTORY')
+parser.add_argument('--profile', nargs='?', const='timers', choices=['timers', 'cprofile', 'sample', 'tracemalloc'], 
+                    help='Profile the loop stages (default mode: timers)')
+parser.add_argument('--profile_window', type=float, default=30, help='Duration in s of the profiling (default=%(default)s)')
+parser.add_argument('--profile_output', default='profile', help='Prefix of the profiling output files (default=%(default)s)')
+parser.add_argument('--preview_port', type=int, help='Serve a preview of the tracked frames as an MJPEG stream on http://127.0.0.1:PORT/')
+parser.add_argument('--metrics_port', type=int, help='Serve live metrics in Prometheus text format on http://127.0.0.1:PORT/metrics')
+
+# Parse the arguments before the heavy imports, so that --help or a wrong argument fails fast
 args = parser.parse_args()
 
+from hand_pose_controller import HandController
+from smoothing import DoubleExponentialSmoothing
+from screen_mapping import ScreenMapper
+from input_backend import BACKENDS, RecordingBackend
+
 # Check if '-r' was used
 if args.enable_renderer:
     enable_flag = True
 else:
     enable_flag = False
     
-# Control mouse
-mouse = Controller()
-
-# Get screen resolution 
-monitor = get_monitors()[0] # Replace '0' by the index of your screen in case of multiscreen
-print(monitor)
-
-# Smoothing filter
-class DoubleExponentialSmoothing:
-    def __init__(self,smoothing=0.65, correction=1.0, prediction=0.85, jitter_radius=250., max_deviation_radius=540., out_int=False):
-        self.smoothing = smoothing
-        self.correction = correction
-        self.prediction = prediction
-        self.jitter_radius = jitter_radius
-        self.max_deviation_radius = max_deviation_radius
-        self.count = 0
-        self.filtered_pos = 0
-        self.trend = 0
-        self.raw_pos = 0
-        self.out_int = out_int
-        self.enable_scrollbars = False
-    
-    def reset(self):
-        self.count = 0
-        self.filtered_pos = 0
-        self.trend = 0
-        self.raw_pos = 0
-    
-    def update(self, pos):
-        raw_pos = np.asanyarray(pos)
-        if self.count > 0:
-            prev_filtered_pos = self.filtered_pos
-            prev_trend = self.trend
-            prev_raw_pos = self.raw_pos
-        if self.count == 0:
-            self.shape = raw_pos.shape
-            filtered_pos = raw_pos
-            trend = np.zeros(self.shape)
-            self.count = 1
-        elif self.count == 1:
-            filtered_pos = (raw_pos + prev_raw_pos)/2
-            diff = filtered_pos - prev_filtered_pos
-            trend = diff*self.correction + prev_trend*(1-self.correction)
-            self.count = 2
-        else:
-            # First apply jitter filter
-            diff = raw_pos - prev_filtered_pos
-            length_diff = np.linalg.norm(diff)
-            if length_diff <= self.jitter_radius:
-                alpha = pow(length_diff/self.jitter_radius,1.5)
-                # alpha = length_diff/self.jitter_radius
-                filtered_pos = raw_pos*alpha \
-                                + prev_filtered_pos*(1-alpha)
-            else:
-                filtered_pos = raw_pos
-            # Now the double exponential smoothing filter
-            filtered_pos = filtered_pos*(1-self.smoothing) \
-                        + self.smoothing*(prev_filtered_pos+prev_trend)
-            diff = filtered_pos - prev_filtered_pos
-            trend = self.correction*diff + (1-self.correction)*prev_trend
-        # Predict into the future to reduce the latency
-        predicted_pos = filtered_pos + self.prediction*trend
-        # Check that we are not too far away from raw data
-        diff = predicted_pos - raw_pos
-        length_diff = np.linalg.norm(diff)
-        if length_diff > self.max_deviation_radius:
-            predicted_pos = predicted_pos*self.max_deviation_radius/length_diff \
-                        + raw_pos*(1-self.max_deviation_radius/length_diff)
-        # Save the data for this frame
-        self.raw_pos = raw_pos
-        self.filtered_pos = filtered_pos
-        self.trend = trend
-        # Output the data
-        if self.out_int:
-            return predicted_pos.astype(int)
-        else:
-            return predicted_pos
+# Control mouse (through the input backend)
+mouse = RecordingBackend(args.record_output) if args.backend == 'record' else BACKENDS[args.backend]()
 
 smooth = DoubleExponentialSmoothing(smoothing=0.3, prediction=0.1, jitter_radius=700, out_int=True)
 
-# Camera image size with aspect ratio 16:9
-cam_width = 1152
-cam_height = 648
-
+# Mapping from camera image to the virtual desktop, created once the tracker image size is known
+mapper = None
 
 def move(event):
     # Use location of index
-    x, y = event.hand.landmarks[8,:2]
-    x /= cam_width
-    x = 1 - x
-    y /= cam_height
-    e = 0.15
-    p1 = monitor.width/(1-2*e)
-    q1 = -p1*e
-    mx = int(max(0, min(monitor.width-1, p1*x+q1)))
-    et = 0.05
-    eb= 0.4
-    p2 = monitor.height/(1-et-eb)
-    q2 = -p2*et
-    my = int(max(0, min(monitor.height-1, p2*y+q2)))
-    mx,my = smooth.update((mx,my))
-    mouse.position = (mx+monitor.x, my+monitor.y)
+    mx, my = mapper.map(event.hand.landmarks[8])
+    mouse.move(*smooth.update((mx,my)))
 
 def click(event):
-    mouse.press(Button.left)
-    mouse.release(Button.left)
+    mouse.click("left")
 
 last_y_position = 0
 
@@ -150,7 +70,7 @@ def scroll(event):
     
     # Use the Y location of the middle finger for scrolling
     _, current_y = event.hand.landmarks[12, :2]  # Assuming landmark 12 is the middle finger tip
-    current_y /= cam_height
+    current_y /= mapper.img_h
 
     # Calculate the change in Y position
     delta_y = last_y_position - current_y
@@ -162,23 +82,36 @@ def scroll(event):
     if abs(delta_y) > scroll_threshold:
         scroll_speed = int(delta_y * 500)  # Convert to an integer scroll value; adjust the multiplier as needed (higher number = faster scrolling)
         mouse.scroll(0, scroll_speed)  # Scrolling action, with horizontal scroll = 0
+        # Small delay to make continuous scrolling smoother (only after an actual scroll)
+        time.sleep(0.01)
 
     # Update the last Y position
     last_y_position = current_y
-
-    # Small delay to make continuous scrolling smoother
-    time.sleep(0.01)
     
     
 config = {
     'renderer' : {'enable': enable_flag},
+    'preview' : {'enable': args.preview_port is not None, 'args': {'port': args.preview_port}},
+    'log' : {'enable': args.log is not None, 'args': {'directory': args.log}},
+    'metrics' : {'enable': args.metrics_port is not None, 'args': {'port': args.metrics_port}},
+    'profile' : {'enable': args.profile is not None, 'args': {'mode': args.profile, 'window': args.profile_window, 'output': args.profile_output}},
     
     'pose_actions' : [
 
         {'name': 'MOVE', 'pose':'FIVE', 'callback': 'move', "trigger":"continuous", "first_trigger_delay":0.1,},
         {'name': 'CLICK', 'pose':'FIST', 'callback': 'click', "trigger":"enter_leave", "first_trigger_delay":0.1},
-        {'name': 'SCROLL', 'pose':'PEACE', 'callback': 'scroll', "trigger":"continuous", "first_trigger_delay":0.1},
+        {'name': 'SCROLL', 'pose':'PEACE', 'callback': 'scroll', "trigger":"continuous", "first_trigger_delay":0.1, "min_delta":2, "delta_landmark":12},
     ]
 }
 
-HandController(config).loop()
\ No newline at end of file
+controller = HandController(config, backend=mouse)
+try:
+    mapper = ScreenMapper(controller.tracker.img_w, controller.tracker.img_h, monitor_index=args.monitor)
+except Exception as e:
+    if args.backend == 'pynput': raise
+    # No desktop session (null or record backend): map to a single 1920x1080 monitor
+    print(f"Warning: monitors not available ({e}), using a 1920x1080 desktop")
+    mapper = ScreenMapper(controller.tracker.img_w, controller.tracker.img_h, monitors=[(0, 0, 1920, 1080)])
+print(f"Monitors: {mapper.monitors}")
+controller.loop()
+mapper.close()
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Aggregation of several HandTrackers (one per OAK device) in a single host process
+
+Each tracker is read by its own thread, so a blocking get() on one device
+never delays the others. MultiHandTracker.next_frame() returns as soon as
+one device has produced a new result, with the hands of the new results
+of all the devices merged in a common screen space:
+    - each device has a calibration transform (3x3 homography) that maps its
+      pixel coordinates into the common screen space,
+    - a hand seen by several devices is kept only once (the one with the
+      best landmark score).
+It can replace HandTracker in HandController (config section 'devices').
+The frame returned by next_frame() is the frame of the primary device (the first
+of device_ids), and img_w, img_h, internal_fps... are those of the primary tracker.
+"""
+import threading
+from time import monotonic, sleep
+import numpy as np
+import mediapipe as mp
+
+class MultiHandTracker:
+    """
+    Arguments:
+    - device_ids: list of the MX ids of the devices,
+    - transforms: dict {device_id: 3x3 homography} from the pixel coordinates of a device
+                    to the common screen space. Identity for the devices not in the dict.
+    - dedup_radius: 2 hands of different devices with the same label are considered as the same hand
+                    if the distance between their wrists in the screen space is smaller than dedup_radius,
+    - max_age: results older than max_age seconds are not merged anymore,
+    - tracker_args: arguments of each HandTracker,
+    - tracker_factory: function(device_id=..., **tracker_args) creating a tracker.
+                    Default is HandTracker. FakeHandTracker can be used to run without devices.
+    If the tracker of a device raises an error, next_frame() raises it.
+    """
+    def __init__(self, device_ids,
+                transforms={},
+                dedup_radius=60,
+                max_age=0.2,
+                tracker_args={},
+                tracker_factory=None):
+        if tracker_factory is None:
+            from hand_tracker_edge import HandTracker
+            tracker_factory = HandTracker
+        self.device_ids = list(device_ids)
+        self.transforms = {d: np.asarray(transforms.get(d, np.eye(3)), dtype=np.float64) for d in self.device_ids}
+        self.dedup_radius = dedup_radius
+        self.max_age = max_age
+        self.trackers = {d: tracker_factory(device_id=d, **tracker_args) for d in self.device_ids}
+        self.primary = self.trackers[self.device_ids[0]]
+        # Attributes used by HandController and the renderer
+        for name in ["img_w", "img_h", "internal_fps", "use_lm", "use_gesture", "lm_score_thresh"]:
+            if hasattr(self.primary, name):
+                setattr(self, name, getattr(self.primary, name))
+
+        # Latest result of each device: (frame, hands, time, result number)
+        self.latest = {d: None for d in self.device_ids}
+        # Last frame of each device (the frames of the trackers' pools are recycled, except the copies of the primary frames)
+        self.frames = {}
+        self.nb_results = 0
+        self.last_result_read = 0
+        # Error raised by the tracker of a device, as (device_id, exception)
+        self.error = None
+        self.condition = threading.Condition()
+        self.running = True
+        self.threads = [threading.Thread(target=self.read_device, args=(d,), daemon=True) for d in self.device_ids]
+        for t in self.threads:
+            t.start()
+
+    def read_device(self, device_id):
+        tracker = self.trackers[device_id]
+        try:
+            while self.running:
+                frame, hands, _ = tracker.next_frame()
+                # The frame returned by next_frame() must stay valid while the next ones are read
+                if tracker is self.primary and frame is not None:
+                    frame = frame.copy()
+                for hand in hands:
+                    hand.device_id = device_id
+                with self.condition:
+                    self.nb_results += 1
+                    self.latest[device_id] = (frame, hands, monotonic(), self.nb_results)
+                    self.condition.notify()
+        except Exception as e:
+            print(f"Error on device {device_id}: {e!r}")
+            with self.condition:
+                if self.error is None:
+                    self.error = (device_id, e)
+                self.condition.notify()
+
+    def next_frame(self):
+        """
+        Wait for a new result from any device.
+        Returns (frame, hands, None) where frame is the last frame of the primary device
+        (the first call waits for its first result) and hands the deduplicated list of the hands of the results received since the previous call
+        (the hands of a result are returned once). Each hand has 2 new attributes:
+        'device_id' and 'screen_landmarks' (landmarks in the common screen space, float array of shape (21,2)).
+        The last frame of each device is in self.frames.
+        """
+        with self.condition:
+            while (self.nb_results == self.last_result_read or self.latest[self.device_ids[0]] is None) and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error[1]
+            last_read = self.last_result_read
+            self.last_result_read = self.nb_results
+            latest = dict(self.latest)
+        now = monotonic()
+        hands = []
+        for device_id, result in latest.items():
+            if result is None: continue
+            frame, device_hands, time, result_nb = result
+            self.frames[device_id] = frame
+            # Results already returned, or too old
+            if result_nb <= last_read or now - time > self.max_age: continue
+            for hand in device_hands:
+                hand.screen_landmarks = self.to_screen(device_id, hand.landmarks)
+            hands += device_hands
+        return self.frames[self.device_ids[0]], self.deduplicate(hands), None
+
+    def to_screen(self, device_id, points):
+        # Apply the homography of the device on points of shape (N,2)
+        h = self.transforms[device_id]
+        points = np.asarray(points, dtype=np.float64)
+        projected = points @ h[:, :2].T + h[:, 2]
+        return projected[:, :2] / projected[:, 2:]
+
+    def deduplicate(self, hands):
+        if len(hands) < 2:
+            return hands
+        wrists = np.array([hand.screen_landmarks[0] for hand in hands])
+        labels = np.array([hand.label for hand in hands])
+        devices = np.array([hand.device_id for hand in hands])
+        distances = np.linalg.norm(wrists[:,None] - wrists[None], axis=-1)
+        same = (distances < self.dedup_radius) & (labels[:,None] == labels[None]) & (devices[:,None] != devices[None])
+        # Greedy selection by decreasing landmark score
+        order = np.argsort([-hand.lm_score for hand in hands], kind="stable")
+        kept = []
+        for i in order:
+            if not same[i, kept].any():
+                kept.append(i)
+        return [hands[i] for i in sorted(kept)]
+
+    def exit(self):
+        self.running = False
+        for t in self.threads:
+            t.join(timeout=1)
+        for tracker in self.trackers.values():
+            tracker.exit()
+
+
+class FakeHandTracker:
+    """
+    Stand-in of HandTracker producing synthetic hands at a fixed rate, without device.
+    The hand (21 landmarks, open hand) moves on a circle whose center can be set with 'center'.
+    Used to exercise MultiHandTracker (throughput, merging, deduplication).
+    """
+    def __init__(self, device_id=None, fps=30, center=(576, 324), radius=100, label="right", lm_score=0.9, img_w=1152, img_h=648):
+        self.device_id = device_id
+        self.fps = fps
+        self.center = np.array(center, dtype=np.float64)
+        self.radius = radius
+        self.label = label
+        self.lm_score = lm_score
+        self.img_w = img_w
+        self.img_h = img_h
+        self.frame_nb = 0
+        self.next_time = monotonic()
+        self.frame = np.zeros((img_h, img_w, 3), dtype=np.uint8)
+        # Open hand skeleton, relative to the wrist
+        self.skeleton = np.array([[0,0], [-30,-20], [-50,-45], [-65,-70], [-75,-95],
+                    [-25,-80], [-30,-115], [-32,-140], [-34,-160],
+                    [0,-85], [0,-125], [0,-150], [0,-172],
+                    [22,-80], [25,-115], [27,-140], [29,-158],
+                    [40,-70], [47,-95], [51,-113], [54,-130]], dtype=np.float64)
+
+    def next_frame(self):
+        # Wait for the next frame time as a device would do
+        self.next_time += 1 / self.fps
+        delay = self.next_time - monotonic()
+        if delay > 0:
+            sleep(delay)
+        self.frame_nb += 1
+        angle = 2 * np.pi * self.frame_nb / (4 * self.fps)
+        wrist = self.center + self.radius * np.array([np.cos(angle), np.sin(angle)])
+        hand = mp.HandRegion()
+        hand.landmarks = (self.skeleton + wrist).astype(np.int32)
+        # Rotated rectangle of the hand, as in the tracker results
+        hand.rect_x_center_a, hand.rect_y_center_a = (hand.landmarks.min(axis=0) + hand.landmarks.max(axis=0)) / 2
+        hand.rect_w_a = hand.rect_h_a = 1.5 * float(np.ptp(hand.landmarks, axis=0).max())
+        hand.label = self.label
+        hand.handedness = 1.0 if self.label == "right" else 0.0
+        hand.lm_score = self.lm_score
+        hand.gesture = "FIVE"
+        return self.frame, [hand], None
+
+    def exit(self):
+        pass
@@ -0,0 +1,137 @@
+"""
+Local preview of the tracker frames, served as an MJPEG stream over HTTP
+
+Used on headless devices to see what the tracker sees (with the hand overlay) in a browser:
+> http://127.0.0.1:8080/           (page showing the stream)
+> http://127.0.0.1:8080/stream     (multipart/x-mixed-replace MJPEG stream)
+
+The control loop calls wants_frame() and submit(frame). When no client is connected,
+wants_frame() returns False and nothing else is done: no overlay drawing, no copy, no encoding.
+When a client is connected, at most 'fps' frames per second are handed to a worker thread
+through a latest-wins slot. The worker downscales the frame to 'width' pixels and JPEG-encodes it.
+The frames must come from a tracker in a non laconic mode (laconic frames are black).
+"""
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import monotonic
+import cv2
+
+PAGE = b"<html><head><title>Hand tracking preview</title></head><body style='margin:0;background:#000'><img src='/stream' style='width:100%'></body></html>"
+
+class PreviewServer:
+    """
+    - host, port: address of the HTTP server,
+    - width: width in pixels of the served frames (the aspect ratio is kept), None to keep the original size,
+    - fps: max number of frames per second served,
+    - quality: JPEG quality (0-100).
+    """
+    def __init__(self, host="127.0.0.1", port=8080, width=480, fps=10, quality=70):
+        self.width = width
+        self.period = 1 / fps
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.nb_clients = 0
+        self.last_submit = 0
+        self.running = True
+        # Latest-wins slot between the control loop and the encoder
+        self.pending = None
+        self.pending_cond = threading.Condition()
+        # Last encoded frame, and its sequence number
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.jpeg_cond = threading.Condition()
+        self.nb_encoded = 0
+
+        preview = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                path = handler.path.split("?")[0]
+                if path == "/":
+                    handler.send_response(200)
+                    handler.send_header("Content-Type", "text/html")
+                    handler.send_header("Content-Length", str(len(PAGE)))
+                    handler.end_headers()
+                    handler.wfile.write(PAGE)
+                elif path == "/stream":
+                    handler.send_response(200)
+                    handler.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                    handler.send_header("Cache-Control", "no-cache")
+                    handler.end_headers()
+                    preview.stream(handler.wfile)
+                else:
+                    handler.send_error(404)
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.encoder_thread = threading.Thread(target=self.encoder, daemon=True)
+        self.encoder_thread.start()
+        print(f"Preview served on http://{host}:{self.server.server_port}/")
+
+    def wants_frame(self, now=None):
+        """
+        Returns True when a frame should be submitted (at least one client and the rate allows it)
+        """
+        if self.nb_clients == 0: return False
+        if now is None: now = monotonic()
+        return now - self.last_submit >= self.period
+
+    def submit(self, frame, now=None):
+        """
+        Hand 'frame' to the encoder. The frame must not be modified afterwards.
+        """
+        self.last_submit = monotonic() if now is None else now
+        with self.pending_cond:
+            self.pending = frame
+            self.pending_cond.notify()
+
+    def encoder(self):
+        while True:
+            with self.pending_cond:
+                while self.pending is None and self.running:
+                    self.pending_cond.wait()
+                if not self.running: break
+                frame = self.pending
+                self.pending = None
+            h, w = frame.shape[:2]
+            if self.width and self.width < w:
+                frame = cv2.resize(frame, (self.width, round(h * self.width / w)), interpolation=cv2.INTER_AREA)
+            ok, jpeg = cv2.imencode(".jpg", frame, self.encode_params)
+            if not ok: continue
+            with self.jpeg_cond:
+                self.jpeg = jpeg.tobytes()
+                self.jpeg_seq += 1
+                self.nb_encoded += 1
+                self.jpeg_cond.notify_all()
+
+    def stream(self, wfile):
+        # Runs in the thread of the HTTP request, until the client disconnects
+        with self.jpeg_cond:
+            self.nb_clients += 1
+            seq = self.jpeg_seq
+        try:
+            while self.running:
+                with self.jpeg_cond:
+                    self.jpeg_cond.wait_for(lambda: self.jpeg_seq != seq or not self.running, timeout=1)
+                    if self.jpeg_seq == seq: continue
+                    seq = self.jpeg_seq
+                    jpeg = self.jpeg
+                wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.jpeg_cond:
+                self.nb_clients -= 1
+
+    def close(self):
+        self.running = False
+        with self.pending_cond:
+            self.pending_cond.notify()
+        with self.jpeg_cond:
+            self.jpeg_cond.notify_all()
+        self.encoder_thread.join()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,185 @@
+"""
+Profiling of the HandController loop
+
+LoopProfiler measures the time spent in each stage of the loop with perf_counter
+(a few hundreds of nanoseconds per stage), during a fixed window of time.
+Depending on the mode, it also:
+    - 'cprofile': runs cProfile during the window. The stats are saved in <output>.prof
+      and the top functions are printed,
+    - 'sample': samples the stack of the loop thread at regular interval from another thread,
+      and the stacks of the threads registered with add_thread() (with HandController.stream(),
+      the reader thread which runs the tracker). The stacks are saved in <output>.collapsed,
+      in the "collapsed stacks" format read by flamegraph.pl or speedscope, under one root
+      per thread,
+    - 'tracemalloc': traces the memory allocated in each stage, and prints the top allocation
+      sites at the end of the window (tracemalloc slows down the loop a lot).
+When the profiler is not enabled, the loop only pays a test of 'self.profiler' per stage.
+"""
+import sys
+import threading
+from time import perf_counter, sleep
+
+MODES = ["timers", "cprofile", "sample", "tracemalloc"]
+
+class StackSampler:
+    """
+    Sample the Python stacks of threads every 'interval' seconds
+    - threads: dict {thread id: name}. The name is the root of the stacks of the thread.
+    Threads can be added while the sampler runs.
+    """
+    def __init__(self, threads, interval=0.002):
+        self.threads = threads
+        self.interval = interval
+        self.stacks = {}
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            frames = sys._current_frames()
+            for thread_id, name in list(self.threads.items()):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.split('/')[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(name)
+                    key = ";".join(reversed(stack))
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+            sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.stacks.items())) + "\n"
+
+
+class LoopProfiler:
+    """
+    - mode: one of MODES,
+    - window: duration in seconds of the profiling (from the first frame),
+    - output: prefix of the output files,
+    - top: number of lines of the top-N reports.
+    Usage in the loop:
+        t = profiler.start_frame()
+        ... stage 1 ...
+        t = profiler.lap("stage 1", t)
+        ... stage 2 ...
+        t = profiler.lap("stage 2", t)
+        if profiler.end_frame(): profiler = None    # End of the window
+    """
+    def __init__(self, mode="timers", window=30, output="profile", top=15):
+        assert mode in MODES, f"Unknown profiling mode {mode}"
+        self.mode = mode
+        self.window = window
+        self.output = output
+        self.top = top
+        self.stage_time = {}
+        self.stage_alloc = {}
+        self.nb_frames = 0
+        self.start_time = None
+        self.finished = False
+        # Threads sampled in 'sample' mode besides the loop thread {thread id: name}
+        self.threads = {}
+
+    def add_thread(self, thread_id, name):
+        """
+        Also sample the thread 'thread_id' in 'sample' mode (eg the thread running the tracker)
+        """
+        self.threads[thread_id] = name
+
+    def begin(self):
+        self.start_time = perf_counter()
+        if self.mode == "cprofile":
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        elif self.mode == "sample":
+            self.threads[threading.get_ident()] = "loop"
+            self.sampler = StackSampler(self.threads)
+            self.sampler.start()
+        elif self.mode == "tracemalloc":
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            tracemalloc.start(10)
+
+    def start_frame(self):
+        if self.start_time is None:
+            self.begin()
+        if self.mode == "tracemalloc":
+            self.alloc_start = self.tracemalloc.get_traced_memory()[0]
+            self.tracemalloc.reset_peak()
+        return perf_counter()
+
+    def lap(self, stage, t):
+        now = perf_counter()
+        self.stage_time[stage] = self.stage_time.get(stage, 0) + now - t
+        if self.mode == "tracemalloc":
+            current, peak = self.tracemalloc.get_traced_memory()
+            self.stage_alloc[stage] = self.stage_alloc.get(stage, 0) + peak - self.alloc_start
+            self.alloc_start = current
+            self.tracemalloc.reset_peak()
+            # Do not count the time spent in tracemalloc calls
+            now = perf_counter()
+        return now
+
+    def end_frame(self):
+        """
+        Returns True when the profiling window is over (the report has been written)
+        """
+        self.nb_frames += 1
+        if perf_counter() - self.start_time > self.window:
+            self.finish()
+            return True
+        return False
+
+    def stop_tools(self):
+        if self.mode == "cprofile":
+            self.cprofile.disable()
+        elif self.mode == "sample":
+            self.sampler.stop()
+        elif self.mode == "tracemalloc":
+            self.tracemalloc.stop()
+
+    def finish(self):
+        if self.finished or self.start_time is None: return
+        self.finished = True
+        elapsed = perf_counter() - self.start_time
+        if self.nb_frames == 0:
+            # The loop stopped before the end of the first frame (eg device failure at startup)
+            self.stop_tools()
+            print(f"\nProfiling ({self.mode}) - no complete frame, no report")
+            return
+        print(f"\nProfiling ({self.mode}) - {self.nb_frames} frames in {elapsed:.1f} s - {self.nb_frames / elapsed:.1f} FPS")
+        print(f"{'stage':20s} {'ms/frame':>9s} {'%':>6s}" + (f" {'peak KB':>9s}" if self.stage_alloc else ""))
+        for stage, total in self.stage_time.items():
+            line = f"{stage:20s} {total / self.nb_frames * 1000:9.3f} {total / elapsed * 100:6.1f}"
+            if self.stage_alloc:
+                line += f" {self.stage_alloc[stage] / self.nb_frames / 1024:9.2f}"
+            print(line)
+
+        if self.mode == "cprofile":
+            import pstats
+            self.cprofile.disable()
+            self.cprofile.dump_stats(f"{self.output}.prof")
+            pstats.Stats(self.cprofile).sort_stats("cumulative").print_stats(self.top)
+            print(f"cProfile stats saved in {self.output}.prof")
+        elif self.mode == "sample":
+            self.sampler.stop()
+            with open(f"{self.output}.collapsed", "w") as file:
+                file.write(self.sampler.collapsed())
+            print(f"{sum(self.sampler.stacks.values())} stack samples saved in {self.output}.collapsed")
+        elif self.mode == "tracemalloc":
+            snapshot = self.tracemalloc.take_snapshot()
+            self.tracemalloc.stop()
+            print(f"Top {self.top} allocation sites (live memory):")
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                print(f"    {stat}")
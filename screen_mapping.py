@@ -0,0 +1,135 @@
+"""
+Mapping of camera image coordinates to the virtual desktop (all the monitors)
+
+The mapping is a 3x3 matrix computed once (and recomputed only when the monitor layout changes):
+    - by default, an affine transform built from the edge margins: the part of the image
+      between the margins is stretched over the whole virtual desktop (bounding box of the monitors),
+      the image being mirrored horizontally so that the pointer follows the hand,
+    - or a homography calibrated from at least 4 pairs of points (camera pixels -> desktop pixels),
+      see calibrate_homography().
+map() applies the matrix to a landmark and clamps the result to the desktop in one operation.
+"""
+import threading
+import numpy as np
+
+def get_monitor_rects():
+    """
+    Returns the list of the monitors as (x, y, width, height) in desktop coordinates
+    """
+    from screeninfo import get_monitors
+    return [(m.x, m.y, m.width, m.height) for m in get_monitors()]
+
+def calibrate_homography(cam_points, screen_points):
+    """
+    Homography (3x3) mapping 'cam_points' to 'screen_points' (N >= 4 pairs of (x, y), least squares if N > 4)
+    """
+    cam_points = np.asarray(cam_points, dtype=np.float64)
+    screen_points = np.asarray(screen_points, dtype=np.float64)
+    assert len(cam_points) >= 4 and len(cam_points) == len(screen_points), "At least 4 pairs of points are needed"
+    rows = []
+    for (x, y), (u, v) in zip(cam_points, screen_points):
+        rows.append([x, y, 1, 0, 0, 0, -u*x, -u*y, -u])
+        rows.append([0, 0, 0, x, y, 1, -v*x, -v*y, -v])
+    # Solution of A.h = 0: right singular vector of the smallest singular value
+    _, _, vt = np.linalg.svd(np.array(rows))
+    h = vt[-1].reshape(3, 3)
+    return h / h[2, 2]
+
+class ScreenMapper:
+    """
+    - img_w, img_h: size of the camera image (tracker.img_w, tracker.img_h),
+    - monitors: list of (x, y, width, height) of the monitors to cover. When None, all the monitors
+                    given by screeninfo are used, and the layout is watched every 'watch_interval' seconds
+                    from a daemon thread (0 to disable),
+    - monitor_index: when not None, only this monitor is covered,
+    - margin_x: horizontal margin (ratio of the image width) on each side,
+    - margin_top, margin_bottom: vertical margins (ratio of the image height),
+    - mirror: mirror the image horizontally,
+    - homography: calibrated 3x3 matrix (camera pixels -> desktop pixels) used instead of the margins.
+    """
+    def __init__(self, img_w, img_h, monitors=None, monitor_index=None,
+                margin_x=0.15, margin_top=0.05, margin_bottom=0.4, mirror=True,
+                homography=None, watch_interval=2):
+        self.img_w = img_w
+        self.img_h = img_h
+        self.monitor_index = monitor_index
+        self.margin_x = margin_x
+        self.margin_top = margin_top
+        self.margin_bottom = margin_bottom
+        self.mirror = mirror
+        self.homography = None if homography is None else np.asarray(homography, dtype=np.float64)
+        self.watched = monitors is None
+        self.update_layout(get_monitor_rects() if monitors is None else monitors)
+        if self.watched and watch_interval > 0:
+            self.watch_event = threading.Event()
+            self.watch_thread = threading.Thread(target=self.watch, args=(watch_interval,), daemon=True)
+            self.watch_thread.start()
+
+    def update_layout(self, monitors):
+        """
+        Recompute the transform for a new monitor layout
+        """
+        self.monitors = list(monitors)
+        rects = self.monitors if self.monitor_index is None else [self.monitors[self.monitor_index]]
+        rects_array = np.array(rects, dtype=np.float64)
+        left, top = rects_array[:,:2].min(axis=0)
+        right, bottom = (rects_array[:,:2] + rects_array[:,2:]).max(axis=0)
+        width, height = right - left, bottom - top
+
+        if self.homography is not None:
+            matrix = self.homography
+        else:
+            # x_desktop = left + (x_img / img_w - margin_x) * width / (1 - 2*margin_x)  (with x_img mirrored)
+            sx = width / (1 - 2*self.margin_x)
+            sy = height / (1 - self.margin_top - self.margin_bottom)
+            if self.mirror:
+                ax, bx = -sx / self.img_w, left + sx * (1 - self.margin_x)
+            else:
+                ax, bx = sx / self.img_w, left - sx * self.margin_x
+            matrix = np.array([[ax, 0, bx], [0, sy / self.img_h, top - sy * self.margin_top], [0, 0, 1]])
+
+        # Coefficients as Python floats (scalar arithmetic is faster than numpy on 2D points).
+        # Replaced in a single assignment, so that map() called from another thread
+        # always sees a consistent transform
+        self.transform = (tuple(matrix.reshape(-1).tolist()), (left, top, right - 1, bottom - 1),
+                        [(x, y, x + w - 1, y + h - 1) for x, y, w, h in rects] if len(rects) > 1 else None)
+
+    def watch(self, interval):
+        while not self.watch_event.wait(interval):
+            try:
+                monitors = get_monitor_rects()
+            except Exception as e:
+                print(f"Warning: monitor layout not available ({e})")
+                continue
+            if monitors != self.monitors:
+                print(f"Monitor layout changed: {monitors}")
+                self.update_layout(monitors)
+
+    def map(self, point):
+        """
+        Desktop coordinates (x, y) (ints) of 'point' given in camera image pixels
+        """
+        (m00, m01, m02, m10, m11, m12, m20, m21, m22), (left, top, right, bottom), rects = self.transform
+        x, y = float(point[0]), float(point[1])
+        if self.homography is None:
+            x, y = m00*x + m01*y + m02, m10*x + m11*y + m12
+        else:
+            w = m20*x + m21*y + m22
+            x, y = (m00*x + m01*y + m02) / w, (m10*x + m11*y + m12) / w
+        x = min(max(x, left), right)
+        y = min(max(y, top), bottom)
+        if rects is not None:
+            # Gaps of the bounding box not covered by a monitor: move the point into the nearest monitor
+            best = None
+            for x0, y0, x1, y1 in rects:
+                cx, cy = min(max(x, x0), x1), min(max(y, y0), y1)
+                d = (cx - x)**2 + (cy - y)**2
+                if best is None or d < best[0]:
+                    best = (d, cx, cy)
+                    if d == 0: break
+            x, y = best[1], best[2]
+        return int(x), int(y)
+
+    def close(self):
+        if self.watched and hasattr(self, "watch_event"):
+            self.watch_event.set()
@@ -0,0 +1,64 @@
+"""
+Startup timeline of the hand controller
+
+1) Import times: the controller modules are imported in a fresh interpreter run with
+   '-X importtime', and the slowest imports (cumulative time, including their own imports) are listed,
+2) Pipeline phases (needs a device): a HandTracker is created and the duration of each phase
+   until the first result is printed (open device, device profile, create pipeline - including the
+   generation of the manager script, start pipeline, first frame, first result).
+
+Usage:
+> python3 startup_report.py [--imports_only] [--top 15] [tracker arguments, eg --laconic]
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from time import monotonic
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+# Modules imported by mouse_controller.py before the first frame
+MODULES = ["hand_pose_controller", "hand_tracker_edge", "smoothing", "screeninfo", "pynput.mouse"]
+
+def import_times(modules=MODULES):
+    """
+    Returns (total time in s, list of (cumulative time in s, self time in s, module))
+    of the import of 'modules' in a fresh interpreter
+    """
+    code = "\n".join(f"try:\n    import {m}\nexcept ImportError as e:\n    pass" for m in modules)
+    start = monotonic()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=SCRIPT_DIR, capture_output=True, text=True)
+    total = monotonic() - start
+    times = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line: continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, name.rstrip()))
+    return total, times
+
+def print_import_times(top=15):
+    total, times = import_times()
+    print(f"Interpreter start + imports: {total:.3f} s")
+    print(f"{'cumulative':>11s} {'self':>8s}  module")
+    for cumulative, self_time, name in sorted(times, reverse=True)[:top]:
+        print(f"{cumulative:10.3f}s {self_time:7.3f}s {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup timeline of the hand controller")
+    parser.add_argument('--imports_only', action="store_true", help="Only report import times (no device needed)")
+    parser.add_argument('--top', type=int, default=15, help="Number of imports listed (default=%(default)i)")
+    parser.add_argument('--laconic', action="store_true", help="Do not send the video frames to the host")
+    parser.add_argument('--xyz', action="store_true", help="Enable spatial location measure")
+    args = parser.parse_args()
+
+    print_import_times(args.top)
+    if not args.imports_only:
+        from hand_tracker_edge import HandTracker
+        tracker = HandTracker(input_src="rgb_laconic" if args.laconic else "rgb", xyz=args.xyz, solo=True)
+        tracker.next_frame()
+        print()
+        tracker.print_startup()
+        tracker.exit()
@@ -0,0 +1,159 @@
+"""
+Procedural generator of realistic hand tracking results, used to benchmark
+and exercise the host side code without a camera.
+
+For each pose of mediapipe.GESTURES, a 21-landmark template is defined in the
+normalized rotated rectangle coordinates (rrn) of the landmark model. A stream
+cycles through the poses with linear transitions between them, adds noise, and moves,
+rotates and scales the hand rectangle in the image. The results are generated
+in the format sent by the manager script (see manager_hand_solo.py) so they go
+through HandTracker.extract_hand_data() like real results.
+"""
+from math import sin, cos, pi
+import numpy as np
+import mediapipe as mp
+
+WRIST = (0.5, 0.85)
+THUMB_OPEN = [(0.40, 0.80), (0.33, 0.72), (0.27, 0.65), (0.22, 0.58)]
+THUMB_CLOSE = [(0.40, 0.80), (0.36, 0.72), (0.42, 0.64), (0.47, 0.62)]
+FINGER_MCPS = [(0.42, 0.55), (0.50, 0.53), (0.58, 0.55), (0.65, 0.60)]
+FINGER_LENGTHS = [1.0, 1.1, 1.0, 0.8]
+# Offsets of PIP, DIP and tip relative to MCP
+FINGER_OPEN = [(0, -0.10), (0, -0.18), (0, -0.25)]
+FINGER_CLOSE = [(0, -0.07), (0.01, -0.03), (0.01, 0.01)]
+
+def pose_template(finger_states):
+    """
+    Landmarks (21,3) in rrn coordinates of a hand with the given finger states
+    (thumb, index, middle, ring, little), 1=open, 0=close
+    """
+    lms = np.zeros((21, 3))
+    lms[0,:2] = WRIST
+    lms[1:5,:2] = THUMB_OPEN if finger_states[0] == 1 else THUMB_CLOSE
+    for f in range(4):
+        mcp = np.array(FINGER_MCPS[f])
+        offsets = np.array(FINGER_OPEN if finger_states[f+1] == 1 else FINGER_CLOSE) * FINGER_LENGTHS[f]
+        lms[5+4*f,:2] = mcp
+        lms[6+4*f:9+4*f,:2] = mcp + offsets
+    return lms
+
+POSE_TEMPLATES = {g: pose_template(states) for g, states in zip(mp.GESTURES, mp.GESTURE_FINGER_STATES)}
+
+
+class SyntheticHandStream:
+    """
+    - poses: list of poses to cycle through (default: all the poses of mediapipe.GESTURES),
+    - frames_per_pose: number of frames a pose is held,
+    - transition_frames: number of frames of the transition between 2 poses,
+    - noise: standard deviation of the noise added to the rrn landmarks,
+    - rotation_range: max absolute rotation (radians) of the hand in the image,
+    - missing_rate: probability of a frame without hand,
+    - img_w, img_h: size of the image (the squared image is padded vertically like in HandTracker).
+    """
+    def __init__(self, poses=None, frames_per_pose=45, transition_frames=8, noise=0.004, rotation_range=0.5,
+                missing_rate=0.02, img_w=1152, img_h=648, seed=0):
+        self.poses = poses or mp.GESTURES
+        self.frames_per_pose = frames_per_pose
+        self.transition_frames = transition_frames
+        self.noise = noise
+        self.rotation_range = rotation_range
+        self.missing_rate = missing_rate
+        self.img_w = img_w
+        self.img_h = img_h
+        self.frame_size = max(img_w, img_h)
+        self.pad_h = (self.frame_size - img_h) // 2
+        self.pad_w = (self.frame_size - img_w) // 2
+        self.rng = np.random.default_rng(seed)
+        self.frame_nb = 0
+
+    def pose_landmarks(self, frame_nb):
+        # Template of the current pose, interpolated with the next pose during transitions
+        period = self.frames_per_pose + self.transition_frames
+        idx = (frame_nb // period) % len(self.poses)
+        t = frame_nb % period
+        lms = POSE_TEMPLATES[self.poses[idx]]
+        if t >= self.frames_per_pose:
+            alpha = (t - self.frames_per_pose + 1) / (self.transition_frames + 1)
+            lms = (1 - alpha) * lms + alpha * POSE_TEMPLATES[self.poses[(idx + 1) % len(self.poses)]]
+        return lms
+
+    def next_result(self):
+        """
+        Returns the result of the next frame, in the format of the manager script
+        """
+        self.frame_nb += 1
+        n = self.frame_nb
+        if self.rng.random() < self.missing_rate:
+            return {"pd_inf": True, "nb_lm_inf": 0}
+        rrn = self.pose_landmarks(n) + self.rng.normal(0, self.noise, (21, 3)) * [1, 1, 0.5]
+        # Smooth trajectory of the hand in the squared image (normalized coordinates)
+        margin_y = (self.pad_h + 0.25 * self.img_h) / self.frame_size
+        center_x = 0.5 + 0.3 * sin(2 * pi * n / 240)
+        center_y = 0.5 + (0.5 - margin_y) * sin(2 * pi * n / 170)
+        size = 0.3 + 0.08 * sin(2 * pi * n / 300)
+        rotation = self.rotation_range * sin(2 * pi * n / 200)
+        cos_rot, sin_rot = cos(rotation), sin(rotation)
+        # Same retroprojection as in the manager script
+        sqn_x = center_x + size * ((rrn[:,0] - 0.5) * cos_rot + (0.5 - rrn[:,1]) * sin_rot)
+        sqn_y = center_y + size * ((rrn[:,1] - 0.5) * cos_rot + (rrn[:,0] - 0.5) * sin_rot)
+        sqn_lms = np.stack([sqn_x, sqn_y], axis=1).reshape(-1).tolist()
+        return {"pd_inf": False, "nb_lm_inf": 1,
+                "lm_score": [float(0.9 + 0.05 * self.rng.random())],
+                "handedness": [float(0.8 + 0.1 * self.rng.random())],
+                "rotation": [rotation],
+                "rect_center_x": [center_x], "rect_center_y": [center_y], "rect_size": [size],
+                "rrn_lms": [rrn.reshape(-1).tolist()], "sqn_lms": [sqn_lms],
+                "world_lms": [0], "xyz": [0], "xyz_zone": [0], "xyz_age": [0]}
+
+    def results(self, nb_frames):
+        return [self.next_result() for _ in range(nb_frames)]
+
+
+class SyntheticTracker:
+    """
+    Stand-in of HandTracker (laconic mode) fed by a SyntheticHandStream.
+    The results are converted into hands by HandTracker.extract_hand_data().
+    When 'results' is given, these results are replayed in loop instead of being generated.
+    """
+    def __init__(self, stream=None, results=None, use_gesture=True, lm_score_thresh=0.5):
+        from hand_tracker_edge import HandTracker
+        self._extract_hand_data = HandTracker.extract_hand_data
+        self.stream = stream or SyntheticHandStream()
+        self.results = results
+        self.result_idx = 0
+        self.img_w = self.stream.img_w
+        self.img_h = self.stream.img_h
+        self.frame_size = self.stream.frame_size
+        self.pad_h = self.stream.pad_h
+        self.pad_w = self.stream.pad_w
+        self.crop_w = 0
+        self.laconic = True
+        self.xyz = False
+        self.use_lm = True
+        self.use_world_landmarks = False
+        self.use_gesture = use_gesture
+        self.lm_score_thresh = lm_score_thresh
+        self.internal_fps = 30
+        self.latency = None
+        self.frame = np.zeros((self.img_h, self.img_w, 3), dtype=np.uint8)
+
+    def extract_hand_data(self, res, hand_idx):
+        return self._extract_hand_data(self, res, hand_idx)
+
+    def next_result(self):
+        if self.results is None:
+            return self.stream.next_result()
+        res = self.results[self.result_idx]
+        self.result_idx = (self.result_idx + 1) % len(self.results)
+        return res
+
+    def next_frame(self):
+        res = self.next_result()
+        hands = [self.extract_hand_data(res, i) for i in range(len(res.get("lm_score", [])))]
+        return self.frame, hands, None
+
+    def get_frame(self):
+        return self.frame
+
+    def exit(self):
+        pass
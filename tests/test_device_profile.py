@@ -0,0 +1,43 @@
+import mediapipe as mp
+from device_profile import RESOLUTIONS, SimulatedDevice, best_setting, candidate_heights, load_profile, save_profile, sweep
+
+def test_sweep_stops_when_fps_saturates():
+    device = SimulatedDevice()
+    results = sweep(device.measure, heights=[640])
+    # 1 / nn_time = 37 fps: the sweep stops at the first FPS value that does not increase the output FPS
+    assert [r['internal_fps'] for r in results] == [18, 22, 26, 30, 34, 38, 42]
+    assert results[-1]['fps'] == results[-2]['fps']
+
+def test_best_setting_usb2_chooses_smaller_frames():
+    heights = candidate_heights(RESOLUTIONS["full"], 432, 720)
+    best_usb3 = best_setting(sweep(SimulatedDevice("SUPER").measure, heights=heights))
+    best_usb2 = best_setting(sweep(SimulatedDevice("HIGH").measure, heights=heights))
+    assert best_usb3 == {'internal_fps': 38, 'internal_frame_height': 648}
+    assert best_usb2['internal_frame_height'] < best_usb3['internal_frame_height']
+    for best, usb_speed in [(best_usb3, "SUPER"), (best_usb2, "HIGH")]:
+        result = SimulatedDevice(usb_speed).measure(best['internal_fps'], best['internal_frame_height'])
+        assert result['drop_rate'] <= 0.05
+
+def test_best_setting_all_dropping():
+    results = [{'fps': 10, 'drop_rate': 0.5, 'internal_fps': 20, 'internal_frame_height': 640},
+               {'fps': 12, 'drop_rate': 0.2, 'internal_fps': 15, 'internal_frame_height': 432}]
+    assert best_setting(results) == {'internal_fps': 15, 'internal_frame_height': 432}
+    assert best_setting([]) is None
+
+def test_candidate_heights_are_reachable():
+    for resolution in RESOLUTIONS.values():
+        # Crop mode: HandTracker calls find_isp_scale_params() on the height, the frame is square
+        for h in candidate_heights(resolution, 288, 1080, crop=True):
+            assert mp.find_isp_scale_params(h, resolution)[0] == h
+        width, height = resolution
+        for h in candidate_heights(resolution, 288, 1080):
+            _, (n, d) = mp.find_isp_scale_params(h * width / height, resolution, is_height=False)
+            assert round(height * n / d) == h
+
+def test_profile_round_trip(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    assert load_profile("MXID", "SUPER", "lite", False, path=path) is None
+    setting = {'internal_fps': 30, 'internal_frame_height': 576}
+    save_profile("MXID", "SUPER", "lite", False, setting, crop=True, path=path)
+    assert load_profile("MXID", "SUPER", "lite", False, crop=True, path=path) == setting
+    assert load_profile("MXID", "SUPER", "lite", False, path=path) is None
@@ -0,0 +1,62 @@
+import copy
+import numpy as np
+import mediapipe as mp
+from hand_pose_controller import HandController, ALL_POSES
+from multi_hand_tracker import FakeHandTracker
+
+POSE_ACTIONS = [
+    {'name': 'move', 'pose': 'ONE', 'hand': 'right', 'trigger': 'continuous', 'min_delta': 8},
+    {'name': 'click', 'pose': 'TWO', 'trigger': 'enter', 'first_trigger_delay': 0.1, 'max_missing_frames': 3},
+    {'name': 'drag', 'pose': 'FIST', 'trigger': 'enter_leave', 'first_trigger_delay': 0.05, 'max_missing_frames': 2},
+    {'name': 'scroll', 'pose': 'FIVE', 'hand': 'left', 'trigger': 'periodic', 'first_trigger_delay': 0.1, 'next_trigger_delay': 0.2},
+    {'name': 'any', 'pose': 'ALL', 'trigger': 'continuous'},
+]
+
+def make_controller(multi_hand):
+    config = {'pose_actions': copy.deepcopy(POSE_ACTIONS), 'multi_hand': {'enable': multi_hand}}
+    return HandController(config, tracker=FakeHandTracker())
+
+def make_hand(gesture, label, xy):
+    hand = mp.HandRegion()
+    hand.gesture = gesture
+    hand.label = label
+    hand.handedness = 1.0 if label == "right" else 0.0
+    hand.landmarks = np.tile(xy, (21, 1)).astype(np.int32) + np.arange(21)[:,None]
+    hand.rect_x_center_a, hand.rect_y_center_a = xy
+    hand.rect_w_a = hand.rect_h_a = 200
+    return hand
+
+def test_track_events_match_solo_events():
+    """
+    With a single hand that is never lost long enough for its track to be dropped,
+    the multi-hand (array) path generates the same events as the solo path
+    """
+    rng = np.random.default_rng(0)
+    solo = make_controller(False)
+    track = make_controller(True)
+    assert solo.event_state is None and track.event_state is not None
+    gestures = [None] + ALL_POSES
+    gesture, label, xy, nb_missing = "ONE", "right", np.array([500., 300.]), 0
+    now = 0
+    nb_events = 0
+    for frame_nb in range(1, 30001):
+        now += rng.uniform(0.01, 0.05)
+        if rng.random() < 0.1:
+            gesture = gestures[rng.integers(len(gestures))]
+        if rng.random() < 0.02:
+            label = "left" if label == "right" else "right"
+        xy = np.clip(xy + rng.normal(0, 6, 2), 100, 1000)
+        # Missing hand for a few frames, less than the associator's max_missing_frames
+        if nb_missing == 0 and rng.random() < 0.03:
+            nb_missing = rng.integers(1, 6)
+        present = nb_missing == 0
+        nb_missing = max(0, nb_missing - 1)
+        events = []
+        for controller in (solo, track):
+            controller.now, controller.frame_nb = now, frame_nb
+            hands = [make_hand(gesture, label, xy)] if present else []
+            events.append([(e.name, e.trigger, e.pose) for e in controller.generate_events(hands)])
+        assert events[0] == events[1], f"frame {frame_nb}"
+        nb_events += len(events[0])
+    assert nb_events > 1000
+    assert np.array_equal(solo.nb_suppressed_events, track.nb_suppressed_events)
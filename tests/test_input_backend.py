@@ -0,0 +1,13 @@
+import numpy as np
+from input_backend import RecordingBackend, load_actions
+from smoothing import DoubleExponentialSmoothing
+
+def test_record_smoothed_move(tmp_path):
+    output = tmp_path / "actions.jsonl"
+    backend = RecordingBackend(str(output), clock=lambda: 1.0)
+    smooth = DoubleExponentialSmoothing(smoothing=0.3, prediction=0.1, jitter_radius=700, out_int=True)
+    x, y = smooth.update(np.array([100, 200]))
+    backend.move(x, y)
+    backend.scroll(0, np.int64(3))
+    backend.close()
+    assert load_actions(str(output)) == [(1.0, "move", (100, 200)), (1.0, "scroll", (0, 3))]
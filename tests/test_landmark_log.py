@@ -0,0 +1,32 @@
+import threading
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from landmark_log import LandmarkLogWriter, LandmarkLogReader
+
+def make_hand():
+    return SimpleNamespace(gesture="FIVE", lm_score=0.9, handedness=0.8,
+            landmarks=np.ones((21, 2)), norm_landmarks=np.zeros((21, 3)))
+
+def test_write_and_read(tmp_path):
+    writer = LandmarkLogWriter(str(tmp_path / "log"), block_size=4)
+    for i in range(10):
+        writer.append(i, i / 30, make_hand())
+    writer.close()
+    reader = LandmarkLogReader(writer.directory)
+    assert len(reader) == 10
+    assert list(reader["frame"]) == list(range(10))
+
+def test_writer_error_is_raised(tmp_path):
+    writer = LandmarkLogWriter(str(tmp_path / "log"), block_size=4)
+    writer.files["frame"].close()   # The next write fails in the writer thread
+    def append_rows():
+        for i in range(20):
+            writer.append(i, i / 30, make_hand())
+    thread = threading.Thread(target=lambda: pytest.raises(ValueError, append_rows))
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive(), "append() blocked after the writer thread died"
+    assert isinstance(writer.error, ValueError)
+    with pytest.raises(ValueError):
+        writer.close()
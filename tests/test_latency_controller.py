@@ -0,0 +1,26 @@
+from latency_controller import DEFAULT_LADDER, LatencyBudgetController, default_ladder, SimulatedTracker, simulate
+
+def test_switch_up_from_last_level():
+    # The camera FPS of the last level (24) is below min_fps / up_margin
+    level = len(DEFAULT_LADDER) - 1
+    controller = LatencyBudgetController(level=level)
+    tracker = SimulatedTracker(**controller.settings, host_load=0.5)
+    switches = simulate(controller, tracker, 10000)
+    assert switches
+    assert switches[0][1] == level - 1
+
+def test_switch_down_under_load():
+    controller = LatencyBudgetController(level=0)
+    tracker = SimulatedTracker(**controller.settings, host_load=2.0)
+    switches = simulate(controller, tracker, 2000)
+    assert switches
+    assert switches[0][1] == 1
+
+def test_xyz_ladder():
+    # With depth, the ladder uses the lower default FPS of each model, down to a camera FPS below min_fps
+    ladder = default_ladder(xyz=True)
+    assert [s["internal_fps"] for s in ladder] == [22, 29, 24, 19]
+    controller = LatencyBudgetController(xyz=True, level=len(ladder) - 1)
+    tracker = SimulatedTracker(**controller.settings, host_load=0.5)
+    switches = simulate(controller, tracker, 10000)
+    assert [level for _, level in switches] == [2, 1, 0]
@@ -0,0 +1,9 @@
+from metrics import MetricsRegistry
+
+def test_render_escapes_help_and_label_values():
+    registry = MetricsRegistry(prefix="")
+    registry.counter("events_total", 'Events\nper "pose" \\ action', pose='say "hi"\\\n').inc(2)
+    assert registry.render() == (
+        '# HELP events_total Events\\nper "pose" \\\\ action\n'
+        '# TYPE events_total counter\n'
+        'events_total{pose="say \\"hi\\"\\\\\\n"} 2\n')
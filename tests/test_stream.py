@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+from hand_pose_controller import HandController
+from multi_hand_tracker import FakeHandTracker
+
+class FailingTracker(FakeHandTracker):
+    def __init__(self, nb_frames, **kwargs):
+        super().__init__(fps=200, **kwargs)
+        self.nb_frames = nb_frames
+        self.closed = False
+    def next_frame(self):
+        if self.frame_nb == self.nb_frames:
+            raise RuntimeError("device disconnected")
+        return super().next_frame()
+    def exit(self):
+        self.closed = True
+
+def test_stream_reraises_reader_error():
+    tracker = FailingTracker(5)
+    controller = HandController({'pose_actions': []}, tracker=tracker)
+    nb_frames = 0
+    async def consume():
+        nonlocal nb_frames
+        async for _ in controller.stream():
+            nb_frames += 1
+    with pytest.raises(RuntimeError, match="device disconnected"):
+        asyncio.run(asyncio.wait_for(consume(), timeout=5))
+    assert 0 < nb_frames <= 5
+    assert tracker.closed
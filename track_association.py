@@ -0,0 +1,90 @@
+"""
+Association of the hands of consecutive frames into tracks
+
+Each hand gets a persistent 'track_id' attribute. The hands of a new frame are matched with the
+current tracks with a cost computed for all the (hand, track) pairs at once:
+    - distance between the rotated rectangle centers, relative to the mean rectangle size,
+    - difference of the rectangle sizes (absolute log ratio),
+    - handedness mismatch (hand.label).
+Pairs whose relative distance is above 'max_distance' cannot be matched. The pairs are then
+assigned greedily by increasing cost. Unmatched hands start new tracks, tracks not matched
+for more than 'max_missing_frames' frames are dropped.
+"""
+import numpy as np
+
+class HandTrackAssociator:
+    """
+    - max_distance: max distance between the centers of a hand and a track, relative to their size,
+    - size_weight: weight of the size difference in the cost,
+    - handedness_weight: weight of the handedness mismatch in the cost,
+    - max_missing_frames: number of frames a track is kept without matching hand.
+    """
+    def __init__(self, max_distance=0.8, size_weight=1.0, handedness_weight=0.5, max_missing_frames=10):
+        self.max_distance = max_distance
+        self.size_weight = size_weight
+        self.handedness_weight = handedness_weight
+        self.max_missing_frames = max_missing_frames
+        self.next_id = 0
+        # Tracks
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.centers = np.zeros((0, 2))
+        self.sizes = np.zeros(0)
+        self.rights = np.zeros(0, dtype=bool)
+        self.last_seen = np.zeros(0, dtype=np.int64)
+
+    def costs(self, centers, sizes, rights):
+        """
+        Cost matrix (nb hands, nb tracks), inf for the pairs that cannot be matched
+        """
+        ref_sizes = (sizes[:,None] + self.sizes[None,:]) / 2
+        distances = np.linalg.norm(centers[:,None,:] - self.centers[None,:,:], axis=2) / ref_sizes
+        costs = distances \
+                + self.size_weight * np.abs(np.log(sizes[:,None] / self.sizes[None,:])) \
+                + self.handedness_weight * (rights[:,None] != self.rights[None,:])
+        costs[distances > self.max_distance] = np.inf
+        return costs
+
+    def update(self, hands, frame_nb):
+        """
+        Set hand.track_id for each hand of 'hands'. Returns the list of the ids of the dropped tracks
+        """
+        nb_hands = len(hands)
+        centers = np.array([(h.rect_x_center_a, h.rect_y_center_a) for h in hands], dtype=np.float64).reshape(-1, 2)
+        sizes = np.array([h.rect_w_a for h in hands], dtype=np.float64)
+        rights = np.array([h.label == "right" for h in hands], dtype=bool)
+        track_idx = np.full(nb_hands, -1)
+        if nb_hands and len(self.ids):
+            costs = self.costs(centers, sizes, rights)
+            # Greedy assignment by increasing cost
+            for flat in np.argsort(costs, axis=None):
+                i, j = divmod(int(flat), costs.shape[1])
+                if not np.isfinite(costs[i, j]): break
+                if track_idx[i] >= 0 or j in track_idx: continue
+                track_idx[i] = j
+                if (track_idx >= 0).all(): break
+        matched = track_idx >= 0
+        # Update the matched tracks
+        self.centers[track_idx[matched]] = centers[matched]
+        self.sizes[track_idx[matched]] = sizes[matched]
+        self.rights[track_idx[matched]] = rights[matched]
+        self.last_seen[track_idx[matched]] = frame_nb
+        # New tracks
+        nb_new = nb_hands - int(matched.sum())
+        new_ids = np.arange(self.next_id, self.next_id + nb_new)
+        self.next_id += nb_new
+        track_idx[~matched] = np.arange(len(self.ids), len(self.ids) + nb_new)
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.centers = np.concatenate([self.centers, centers[~matched]])
+        self.sizes = np.concatenate([self.sizes, sizes[~matched]])
+        self.rights = np.concatenate([self.rights, rights[~matched]])
+        self.last_seen = np.concatenate([self.last_seen, np.full(nb_new, frame_nb)])
+        for hand, idx in zip(hands, track_idx.tolist()):
+            hand.track_id = int(self.ids[idx])
+        # Drop the lost tracks
+        lost = frame_nb - self.last_seen > self.max_missing_frames
+        dropped = self.ids[lost].tolist()
+        if dropped:
+            keep = ~lost
+            self.ids, self.centers, self.sizes = self.ids[keep], self.centers[keep], self.sizes[keep]
+            self.rights, self.last_seen = self.rights[keep], self.last_seen[keep]
+        return dropped